@@ -0,0 +1,185 @@
+"""
+Benchmark the address passes against a local fake Elasticsearch.
+
+Builds a synthetic voter frame with the columns of the voterfile data
+contract, starts FakeElasticsearch in-process and runs passes 01-07 exactly
+as voters_transform does, reporting per pass the rows/sec, the queries sent,
+the p50/p99 _msearch latency and the peak RSS. --report also saves the
+pipeline's own run report (utils/pass_metrics.py).
+
+    python benchmarks/address_passes_benchmark.py --rows 200000 --latency-ms 20 --date 2024-01-01
+
+Options not listed below are passed on to the pipeline's own arguments.
+"""
+import sys
+sys.path.append(r'../src')
+import os
+import time
+import json
+import argparse
+import resource
+import tempfile
+import numpy as np
+import pandas as pd
+
+from benchmarks.fake_elasticsearch import FakeElasticsearch
+
+STREETS = ['MAIN', 'OAK', 'PINE', 'MAPLE', 'CEDAR', 'ELM', 'WILLAMETTE', 'COLUMBIA', 'LINCOLN', 'HAWTHORNE', 'BURNSIDE', 'DIVISION', 'STARK', 'ALDER', 'FIR']
+SUFFIXES = ['ST', 'AVE', 'RD', 'DR', 'LN', 'CT', 'WAY', 'BLVD']
+DIRECTIONS = ['', '', '', 'N', 'S', 'E', 'W', 'NE', 'SE', 'NW', 'SW']
+CITIES = [('PORTLAND', '972'), ('SALEM', '973'), ('EUGENE', '974'), ('BEND', '977'), ('MEDFORD', '975')]
+COUNTIES = ['MULTNOMAH', 'MARION', 'LANE', 'DESCHUTES', 'JACKSON']
+HOMELESS_ADDRESSES = ['HOMELESS CAMP', 'CORNER OF MAIN & OAK', 'NEAR THE RIVER', '0 TRANSIENT', 'BEHIND THE LIBRARY']
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the address passes against a fake Elasticsearch')
+    parser.add_argument('--rows', type=int, default=100000, help='Voters in the synthetic frame')
+    parser.add_argument('--households', type=float, default=0.6, help='Distinct addresses per voter')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Fixed latency of every request')
+    parser.add_argument('--per-query-ms', type=float, default=0.05, help='Latency added per query in a request')
+    parser.add_argument('--hit-rate', type=float, default=0.5, help='Share of queries with exactly one hit')
+    parser.add_argument('--ambiguous-rate', type=float, default=0.05, help='Share of queries with two hits')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='Share of requests rejected with a 429')
+    parser.add_argument('--item-reject-rate', type=float, default=0.0, help='Share of _msearch items rejected with a 429 item error (the whole request is retried, keep it low, e.g. 0.001)')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the synthetic frame')
+    parser.add_argument('--report', help='Write the results as JSON to this file')
+    return parser.parse_known_args()
+
+def synthetic_voters(rows, households, seed):
+    """
+    Build a voter frame shaped like a processed Oregon voter file.
+
+    Voters share addresses (households) so the passes see the duplicate
+    queries they see on real files; a few are confidential or homeless.
+    """
+    rng = np.random.default_rng(seed)
+    addresses = max(1, int(rows * households))
+    address = rng.integers(0, addresses, rows)
+
+    def pick(values, size=addresses):
+        return np.asarray(values, dtype=object)[rng.integers(0, len(values), size)]
+
+    city = rng.integers(0, len(CITIES), addresses)
+    house_number = rng.integers(1, 20000, addresses).astype(str)
+    direction = pick(DIRECTIONS)
+    street = pick(STREETS)
+    suffix = pick(SUFFIXES)
+    zip_code = np.array([CITIES[c][1] for c in city], dtype=object) + rng.integers(0, 100, addresses).astype(str).astype(object)
+    apartment = rng.random(addresses) < 0.2
+    unit_type = np.where(apartment, 'APT', '')
+    unit_number = np.where(apartment, rng.integers(1, 400, addresses).astype(str), '')
+
+    address_1 = pd.Series(house_number, dtype=object) + ' ' + direction + ' ' + street + ' ' + suffix
+    address_1 = address_1.str.replace('  ', ' ')
+    address_2 = pd.Series(np.where(apartment, 'APT ' + pd.Series(unit_number, dtype=object), ''), dtype=object)
+
+    df = pd.DataFrame({
+        'state_voter_id': np.arange(rows).astype(str),
+        'name_first': pick(['MARY', 'JOHN', 'PAT', 'LINDA', 'JAMES', 'ALEX'], rows),
+        'name_last': pick(['SMITH', 'JOHNSON', 'NGUYEN', 'GARCIA', 'LEE'], rows),
+        'name_middle': pick(['', 'A', 'B', 'LEE', 'MARIE'], rows),
+        'birthdate': pick(['1950-01-01', '1975-06-15', '1990-03-30', '2001-11-11'], rows),
+        'party_affiliation': pick(['DEM', 'REP', 'NAV', 'IND', 'LBT'], rows),
+        'registration_date': pick(['2004-10-01', '2016-09-20', '2020-10-13'], rows),
+        'voter_status': 'A',
+        'confidential': np.where(rng.random(rows) < 0.005, 'Confidential', ''),
+        'physical_address_1': address_1.to_numpy()[address],
+        'physical_address_2': address_2.to_numpy()[address],
+        'physical_city': np.array([CITIES[c][0] for c in city], dtype=object)[address],
+        'physical_state': 'OR',
+        'physical_zip_code': zip_code[address],
+        'physical_house_number': house_number[address],
+        'physical_house_suffix': '',
+        'physical_street_pre_direction': direction[address],
+        'physical_street_name': street[address],
+        'physical_street_suffix': suffix[address],
+        'physical_street_post_direction': '',
+        'physical_unit_type': unit_type[address],
+        'physical_unit_number': unit_number[address],
+        'county': pick(COUNTIES, rows),
+        'precinct': rng.integers(1, 500, rows).astype(str),
+        'split': '',
+    })
+    homeless = rng.random(rows) < 0.003
+    df.loc[homeless, 'physical_address_1'] = pick(HOMELESS_ADDRESSES, int(homeless.sum()))
+    df['precinct_link'] = df['county'] + '-' + df['precinct']
+    for column in ['mail_address_1', 'mail_address_2', 'mail_address_3', 'mail_address_4', 'mail_city', 'mail_state', 'mail_zip_code']:
+        df[column] = ''
+    return df
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def pass_report(interation_pass, rows, seconds, requests, results):
+    latencies = np.array([latency for _, latency in requests]) * 1000
+    return {
+        "pass": interation_pass,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+        "requests": len(requests),
+        "queries": int(sum(queries for queries, _ in requests)),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "not_found": int((results == 'Not Found').sum()),
+    }
+
+def run_passes(df, fake):
+    # imported here: utils.config reads the environment and arguments set up in main
+    from voterfile.voters_transform import ADDRESS_PASSES, columns_to_update, _find_address
+    from utils.address_cache import close_address_cache
+    from utils.pass_metrics import get_run_report, close_run_report
+
+    run_report = get_run_report()
+    reports = []
+    for interation_pass, transform_pass in ADDRESS_PASSES:
+        print(f"...pass {interation_pass}")
+        fake.reset_counters()
+        started = time.perf_counter()
+        if interation_pass != '01':
+            df['find_address'] = _find_address(df, interation_pass)
+        df = transform_pass(df, columns_to_update)
+        seconds = time.perf_counter() - started
+        run_report.record_pass(interation_pass, seconds, len(df))
+        reports.append(pass_report(interation_pass, len(df), seconds, fake.reset_counters(), df['results']))
+    close_address_cache()
+    return df, reports, close_run_report()
+
+def print_reports(reports):
+    print('')
+    print(f"{'pass':>4} {'rows/sec':>12} {'requests':>9} {'queries':>9} {'p50 ms':>8} {'p99 ms':>8} {'rss MB':>8} {'not found':>10}")
+    for report in reports:
+        print(f"{report['pass']:>4} {report['rows_per_sec'] or 0:>12.0f} {report['requests']:>9} {report['queries']:>9} "
+              f"{report['p50_ms'] or 0:>8.2f} {report['p99_ms'] or 0:>8.2f} {report['peak_rss_mb']:>8.1f} {report['not_found']:>10}")
+
+def main():
+    args, pipeline_args = parse_args()
+    fake = FakeElasticsearch(args.latency_ms, args.per_query_ms, args.hit_rate, args.ambiguous_rate, args.reject_rate, args.item_reject_rate).start()
+
+    # point the pipeline at the fake cluster and a scratch data directory before utils.config is imported
+    os.environ["ES_HOST"] = fake.url
+    os.environ.setdefault("DATA_FILES", tempfile.mkdtemp(prefix='address-benchmark-'))
+    os.environ.setdefault("ADDRESS_CACHE_ENABLED", "false")
+    sys.argv = [sys.argv[0]] + pipeline_args
+
+    try:
+        print(f"Building {args.rows} synthetic voters")
+        df = synthetic_voters(args.rows, args.households, args.seed)
+        df = df.fillna('')
+        started = time.perf_counter()
+        df, reports, run_report = run_passes(df, fake)
+        total = time.perf_counter() - started
+    finally:
+        fake.stop()
+
+    print_reports(reports)
+    print(f"All passes: {len(df) / total:.0f} rows/sec, {sum(report['queries'] for report in reports)} queries, {fake.rejected} rejected requests, {fake.rejected_items} rejected items, {total:.1f}s")
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump({"arguments": vars(args), "seconds": round(total, 3), "passes": reports, "run_report": run_report}, report_file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+In-process HTTP stand-in for the places indices.
+
+Answers the requests the address passes make (_msearch, _search, index
+settings and the product check) with a configurable latency and hit rate,
+and records every request so benchmarks can report queries and latencies.
+Rejections come as whole requests (a 429) or as single _msearch items (a
+429 item with an error, the rest of the request answered).
+"""
+import gzip
+import json
+import time
+import zlib
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeElasticsearch:
+    def __init__(self, latency_ms=5.0, per_query_ms=0.05, hit_rate=0.8, ambiguous_rate=0.05, reject_rate=0.0, item_reject_rate=0.0):
+        """
+        Parameters:
+        latency_ms (float): Fixed latency added to every request.
+        per_query_ms (float): Extra latency per query in a request.
+        hit_rate (float): Share of queries answered with exactly one hit.
+        ambiguous_rate (float): Share of queries answered with two hits.
+        reject_rate (float): Share of search requests rejected with a 429.
+        item_reject_rate (float): Share of _msearch queries answered with a 429 item error.
+        """
+        self.latency_ms = latency_ms
+        self.per_query_ms = per_query_ms
+        self.hit_rate = hit_rate
+        self.ambiguous_rate = ambiguous_rate
+        self.reject_rate = reject_rate
+        self.item_reject_rate = item_reject_rate
+        self.random = random.Random(0)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.rejected = 0
+        self.rejected_items = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_counters(self):
+        """
+        Return the (queries, seconds) of each request since the last reset.
+        """
+        with self.lock:
+            requests, self.requests = self.requests, []
+        return requests
+
+    def _record(self, queries, seconds):
+        with self.lock:
+            self.requests.append((queries, seconds))
+
+    def respond(self, index_name, query):
+        """
+        Answer one query deterministically from a hash of its body.
+        """
+        bucket = zlib.crc32(json.dumps(query, sort_keys=True).encode()) % 10000 / 10000
+        hits = []
+        if bucket < self.hit_rate:
+            hits = [self._place(index_name, bucket, 0)]
+        elif bucket < self.hit_rate + self.ambiguous_rate:
+            hits = [self._place(index_name, bucket, 0), self._place(index_name, bucket, 1)]
+        return {"took": 1, "timed_out": False, "hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits}}
+
+    def respond_item(self, index_name, query):
+        """
+        Answer one _msearch item, rejecting item_reject_rate of them like a full search queue does.
+        """
+        with self.lock:
+            rejected = self.random.random() < self.item_reject_rate
+            self.rejected_items += rejected
+        if rejected:
+            return {"status": 429, "error": {"type": "es_rejected_execution_exception", "reason": "rejected execution of the search"}}
+        return dict(self.respond(index_name, query), status=200)
+
+    def _place(self, index_name, bucket, offset):
+        place_id = f"{index_name}-{int(bucket * 10000)}-{offset}"
+        return {
+            "_index": index_name,
+            "_id": place_id,
+            "_source": {
+                "PropertyAddressFull": f"{int(bucket * 10000)} MAIN ST",
+                "PropertyAddressHouseNumber": str(int(bucket * 10000)),
+                "PropertyAddressStreetDirection": "",
+                "PropertyAddressStreetName": "MAIN",
+                "PropertyAddressStreetSuffix": "ST",
+                "PropertyAddressCity": "SALEM",
+                "PropertyAddressState": "OR",
+                "PropertyAddressZIP": "97301",
+                "PropertyAddressZIP4": "0001",
+                "PropertyAddressCRRT": "C001",
+                "PropertyLatitude": "44.94",
+                "PropertyLongitude": "-123.03",
+            },
+        }
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, body, status=200):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('X-Elastic-Product', 'Elasticsearch')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _body(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                return body.decode()
+
+            def do_GET(self):
+                if '/_settings' in self.path:
+                    index_name = self.path.strip('/').split('/')[0]
+                    return self._send({index_name: {"settings": {"index": {"uuid": f"{index_name}-benchmark"}}}})
+                self._send({"version": {"number": "8.11.0"}, "tagline": "You Know, for Search"})
+
+            def do_POST(self):
+                started = time.perf_counter()
+                body = self._body()
+                with fake.lock:
+                    rejected = fake.random.random() < fake.reject_rate
+                    fake.rejected += rejected
+                if rejected:
+                    return self._send({"error": {"type": "es_rejected_execution_exception", "reason": "rejected execution"}, "status": 429}, status=429)
+                if '/_msearch' in self.path:
+                    lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+                    queries = list(zip(lines[0::2], lines[1::2]))
+                    responses = [fake.respond_item(header.get("index"), query) for header, query in queries]
+                    response = {"took": 1, "responses": responses}
+                else:
+                    index_name = self.path.strip('/').split('/')[0]
+                    queries = [None]
+                    response = fake.respond(index_name, json.loads(body or '{}'))
+                time.sleep((fake.latency_ms + fake.per_query_ms * len(queries)) / 1000)
+                self._send(response)
+                fake._record(len(queries), time.perf_counter() - started)
+
+            do_PUT = do_POST
+
+        return Handler
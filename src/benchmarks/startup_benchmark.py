@@ -0,0 +1,109 @@
+"""
+Benchmark the startup time of the pipeline entry points.
+
+Imports every entry point module in a fresh interpreter (what running the
+script costs before main() starts), repeats it and reports the median wall
+time next to a bare interpreter, plus the top level packages that took the
+longest according to python -X importtime (self time summed over
+the package's modules).
+
+    python benchmarks/startup_benchmark.py --repeat 5 --date 2024-01-01
+
+Options not listed below are passed on to the entry points' own arguments.
+"""
+import sys
+sys.path.append(r'../src')
+import os
+import time
+import json
+import argparse
+import subprocess
+import statistics
+
+ENTRY_POINTS = [
+    'voterfile.voters_extract',
+    'voterfile.voters_transform',
+    'voterfile.voters_load_database',
+    'voterfile.voters_load_elasticsearch',
+    'voterfile.run_extract',
+    'votehistory.history_extract',
+    'votehistory.history_load',
+    'votehistory.run_load',
+    'precinct.precincts_etl',
+    'omv.omv_etl',
+    'daily_voted.daily_voted_etl',
+    'run_backfill',
+]
+SRC_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of the pipeline entry points')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per entry point')
+    parser.add_argument('--top', type=int, default=5, help='Slowest packages listed per entry point')
+    parser.add_argument('--entry-points', default='', help='Comma separated modules, default all of them')
+    parser.add_argument('--report', help='Write the results as JSON to this file')
+    return parser.parse_known_args()
+
+def import_times(stderr):
+    """
+    Microseconds spent importing each top level package, from -X importtime output.
+    """
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|', 2)
+        # self time, summed over the package's modules wherever they were imported from
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(own)
+    return packages
+
+def measure(module, pipeline_args, repeat):
+    """
+    Import module in repeat fresh interpreters.
+
+    Returns:
+    tuple: (list of wall seconds, dict of package -> import seconds of the last run, error or None)
+    """
+    code = f"import {module}" if module else "pass"
+    seconds = []
+    stderr = ''
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code, *pipeline_args],
+                                cwd=SRC_PATH, capture_output=True, text=True)
+        seconds.append(time.perf_counter() - started)
+        stderr = result.stderr
+        if result.returncode != 0:
+            return seconds, {}, stderr.strip().splitlines()[-1]
+    packages = {package: micros / 1e6 for package, micros in import_times(stderr).items()}
+    return seconds, packages, None
+
+def main():
+    args, pipeline_args = parse_args()
+    modules = [module.strip() for module in args.entry_points.split(',') if module.strip()] or ENTRY_POINTS
+
+    reports = []
+    for module in [None] + modules:
+        seconds, packages, error = measure(module, pipeline_args, args.repeat)
+        top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        reports.append({
+            "entry_point": module or "(interpreter)",
+            "median_seconds": round(statistics.median(seconds), 3),
+            "min_seconds": round(min(seconds), 3),
+            "error": error,
+            "slowest_imports": {package: round(seconds, 3) for package, seconds in top},
+        })
+
+    print('')
+    print(f"{'entry point':<38} {'median s':>9} {'min s':>7}  slowest imports")
+    for report in reports:
+        details = report['error'] or ', '.join(f"{package} {seconds:.2f}s" for package, seconds in report['slowest_imports'].items())
+        print(f"{report['entry_point']:<38} {report['median_seconds']:>9.3f} {report['min_seconds']:>7.3f}  {details}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+if __name__ == "__main__":
+    main()
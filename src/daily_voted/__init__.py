@@ -1,5 +1,5 @@
-from config import STATE as cli_state
-STATE=cli_state
+from utils.config import state as cli_state
+STATE=cli_state.upper()
 TABLENAME = 'daily_voted'
 DATA_CONTRACT = {
     'state_voter_id': ['VOTER_ID'],
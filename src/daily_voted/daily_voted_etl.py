@@ -22,17 +22,16 @@ from sqlalchemy.dialects.postgresql import insert
 # from common_functions.common import get_traceback, get_timing, timing_decorator
 from common_functions.file_operations import read_extract, write_load, read_extract_multiple
 
-from utils.arg_parser import get_date, get_sample
+from utils.arg_parser import get_date, get_sample, require_date
 
-from utils.config import LOGSTASH_DATA_PATH, DATA_FILES, state, file_date, sample, initialize_pandarallel
+from utils.config import LOGSTASH_DATA_PATH, DATA_FILES, state, file_date, sample, seed, initialize_pandarallel
 from data_contracts.daily_voted_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns, DailyVoted, Base
 from utils.database import Database, fetch_existing_table, fetch_sql
 from utils.file_operations import validate_dataframe
 from utils.dataframe_operations import diff_dataframe
-from utils.transformations import convert_date_format
+from utils.dates import parse_dates, format_dates, MDY_DASH
 from utils.search import index_documents
-
-initialize_pandarallel()
+from utils.sampling import BottomKSampler
 
 def _extract(df):
     print("Extracting Data...")
@@ -43,18 +42,29 @@ def _extract(df):
     lst_files.sort(key=os.path.getmtime)
     file_path = lst_files[-1:][0]
     names = ZipFile(file=file_path).namelist()
+    # a sample keeps the voters of the voter file sampled with the same seed, picked chunk by chunk
+    voter_id = DATA_CONTRACT['state_voter_id'][0]
+    # invalid ids are removed by _clean, keep them out of the sample
+    sampler = BottomKSampler(sample, seed, key=voter_id, row_filter=lambda batch: batch[voter_id].ne('ACP').fillna(True)) if sample else None
     for n in names:
         if os.path.basename(n):
             if 'readme' not in n:
                 print(n)
-                temp_df = pd.read_csv(ZipFile(file=file_path).open(n), sep='\t', dtype=str, on_bad_lines='skip')
                 # Ex-VoterNotVoted-gbergerson-2024-05-14-72459_YAMHILL.txt
                 # get the last part of the file name by underscore
                 county = os.path.basename(n).split('_')[-1].split('.')[0]
                 print(county)
+                if sampler is not None:
+                    for temp_df in pd.read_csv(ZipFile(file=file_path).open(n), sep='\t', dtype=str, on_bad_lines='skip', chunksize=100000):
+                        temp_df['county'] = county
+                        sampler.add(temp_df)
+                    continue
+                temp_df = pd.read_csv(ZipFile(file=file_path).open(n), sep='\t', dtype=str, on_bad_lines='skip')
                 temp_df['county'] = county
                 df = pd.concat([df, temp_df])
 
+    if sampler is not None:
+        df = sampler.frame()
     return df.reset_index(drop=True)
 
 def _clean(df):
@@ -73,7 +83,7 @@ def _transform(df):
     df['state'] = state.upper()
     df['election_date'] = file_date.strftime('%Y-%m-%d')
     df['voted'] = 'YES'
-    df['voted_on_date'] = df['voted_on_date'].parallel_apply(convert_date_format)
+    df['voted_on_date'] = format_dates(parse_dates(df['voted_on_date'], [MDY_DASH]))
 
     df = df[final_columns]
     return df.reset_index(drop=True)
@@ -103,7 +113,8 @@ def _load_index(df) -> None:
 
 # Assuming Database class and other necessary imports and configurations are defined elsewhere
 
-def _load_history(current_df, engine):
+def _load_history(current_df, db_connection):
+    engine = db_connection.get_engine()
     table_name = f"{TABLENAME.lower()}_history"
     sql = f"SELECT * FROM {table_name} where election_date = '{file_date.strftime('%Y-%m-%d')}'"
     existing_records = fetch_sql(engine, sql)
@@ -115,15 +126,16 @@ def _load_history(current_df, engine):
 
     insert_df = diff_dataframe(df_new=current_df, df_existing=existing_records, on_columns=final_columns)
     print(f"Found {len(insert_df)} new records to insert")
-    results = insert_df.to_sql(table_name, engine, if_exists='append', index=False, dtype=dtype_mapping, method='multi', chunksize=5000)
+    db_connection.bulk_load(insert_df, table_name, dtype_mapping, if_exists='append')
 
-def _load_current(current_df, engine):
+def _load_current(current_df, db_connection):
+    engine = db_connection.get_engine()
     table_name = f"{TABLENAME.lower()}_{file_date.strftime('%Y_%m_%d')}"
     existing_records = fetch_existing_table(engine, table_name, final_columns)
 
     insert_df = diff_dataframe(df_new=current_df, df_existing=existing_records, on_columns=final_columns)
     print(f"Found {len(insert_df)} new records to insert")
-    results = insert_df.to_sql(table_name, engine, if_exists='append', index=False, dtype=dtype_mapping, method='multi', chunksize=5000)
+    db_connection.bulk_load(insert_df, table_name, dtype_mapping, if_exists='append')
 
 def _load_database(df_orginal, database) -> pd.DataFrame:
     """
@@ -152,9 +164,9 @@ def _load_database(df_orginal, database) -> pd.DataFrame:
     df['voted_on_date'] = pd.to_datetime(df['voted_on_date'])
 
     # _load current records
-    _load_current(df, engine)
+    _load_current(df, db_connection)
     # _load history records
-    _load_history(df, engine)
+    _load_history(df, db_connection)
 
 # @timing_decorator
 def main():
@@ -166,9 +178,6 @@ def main():
     print(f"...validated {len(df)} records")
     df = _clean(df)
     print(f"...cleaned {len(df)} records")
-    if sample:
-        print(f"...taking a sample of {sample}")
-        df = df.sample(n=sample)
     df = _transform(df)
     print(f"...transformed {len(df)} records")
     _load_file(df)
@@ -182,6 +191,7 @@ def get_traceback(e):
     return ''.join(lines)
 
 if __name__ == "__main__":
+    require_date()
     try:
         print(f"Processing raw history file on {file_date.strftime('%Y-%m-%d')}")
         main()
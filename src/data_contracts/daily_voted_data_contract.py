@@ -2,7 +2,7 @@ import sqlalchemy
 from sqlalchemy import Column, Integer, String, Date, Index, UniqueConstraint, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from utils.config import file_date
+from utils.arg_parser import require_date
 from utils.database import Database
 
 # Define the table name
@@ -38,7 +38,7 @@ Base = declarative_base()
 
 # Definition of the DailyVoted class
 class DailyVoted(Base):
-    __tablename__ = f"daily_voted_{file_date.strftime('%Y_%m_%d')}"
+    __tablename__ = f"daily_voted_{require_date().strftime('%Y_%m_%d')}"
     id = Column(sqlalchemy.Integer, primary_key=True)
     state = Column(sqlalchemy.types.String(length=50))
     county = Column(sqlalchemy.types.String(length=50))
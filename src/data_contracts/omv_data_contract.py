@@ -2,7 +2,6 @@ import sqlalchemy
 from sqlalchemy import Column, Integer, String, Date, Index, UniqueConstraint, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from utils.config import file_date
 from utils.database import Database
 
 # Define the table name
@@ -30,6 +29,9 @@ final_columns = [
     'file_date',
 ]
 
+# the processed and final datasets are partitioned by these columns (see utils/datasets.py)
+partition_columns = ['county']
+
 # Using declarative_base to create the base class
 Base = declarative_base()
 
@@ -36,3 +36,6 @@ final_columns = [
     'precinct_split',
     'precinct_link',
 ]
+
+# the processed and final datasets are partitioned by these columns (see utils/datasets.py)
+partition_columns = ['district_county']
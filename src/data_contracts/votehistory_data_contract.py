@@ -2,7 +2,6 @@ import sqlalchemy
 from sqlalchemy import Column, Integer, String, Date, Index, UniqueConstraint, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from utils.config import file_date
 from utils.database import Database
 import pandas as pd
 
@@ -26,6 +25,9 @@ final_columns = [
     'voted'
 ]
 
+# the processed and final datasets are partitioned by these columns (see utils/datasets.py)
+partition_columns = ['election_date']
+
 Base = declarative_base()
 
 TABLENAME = "vote_history"
@@ -55,9 +57,13 @@ class ElectionVoting(Base):
         cls.__table__.name = cls.__tablename__
         Base.metadata.tables[cls.__tablename__] = cls.__table__
 
+# election date -> its ORM class, a table can only be declared once on Base
+_dynamic_classes = {}
+
 def create_dynamic_class(election_date):
     """
-    Creates a new dynamic class based on the election date.
+    Creates a new dynamic class based on the election date, or returns the one
+    already created in this process (every file date loads the past elections again).
 
     Parameters:
     election_date (datetime.date or str): The election date to use for the table name.
@@ -65,6 +71,9 @@ def create_dynamic_class(election_date):
     Returns:
     type: A new SQLAlchemy ORM class with the appropriate table name.
     """
+    election_date = str(election_date)
+    if election_date in _dynamic_classes:
+        return _dynamic_classes[election_date]
     table_name = f"{TABLENAME.lower()}_{election_date}"
 
     # Dynamically create a new class with the appropriate table name
@@ -83,4 +92,5 @@ def create_dynamic_class(election_date):
                 Index('idx_election_date', 'election_date'),)
         }
     )
+    _dynamic_classes[election_date] = DynamicElectionVoting
     return DynamicElectionVoting
@@ -109,6 +109,25 @@ dtype_mapping = {
     'mail_zip_code': sqlalchemy.types.String(length=20)
 }
 
+# values the address passes write to 'results'
+ADDRESS_RESULTS = ['Not Found', 'Success', 'Fuzzy Match', 'Confidential', 'Homeless', '']
+
+# low cardinality columns kept as categoricals (see utils/dtypes.py)
+# form is 'column': [fixed categories] or None to take the categories from the data
+category_columns = {
+    'state': None,
+    'county': None,
+    'party_affiliation': None,
+    'voter_status': None,
+    'confidential': None,
+    'physical_state': None,
+    'physical_street_suffix': None,
+    'mail_state': None,
+    'address_type': ['residential', 'apartment', 'Homeless', ''],
+    'results': ADDRESS_RESULTS,
+    'gender': ['male', 'female', 'unknown', ''],
+}
+
 final_columns = [
     'state_voter_id',
     'file_date',
@@ -164,3 +183,6 @@ final_columns = [
     'mail_state',
     'mail_zip_code'
 ]
+
+# the processed and final datasets are partitioned by these columns (see utils/datasets.py)
+partition_columns = ['county']
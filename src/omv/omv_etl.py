@@ -22,15 +22,21 @@ from sqlalchemy.dialects.postgresql import insert
 from common_functions.common import get_traceback, get_timing, timing_decorator
 from common_functions.file_operations import read_extract, write_load, read_extract_multiple
 
-from utils.arg_parser import get_date, get_sample
+from utils.arg_parser import get_date, get_sample, require_date
 
-from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, state, file_date, sample, initialize_pandarallel
-from data_contracts.omv_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns, MotorVoter, Base
+from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, state, file_date, sample, seed, initialize_pandarallel
+from data_contracts.omv_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns, partition_columns, MotorVoter, Base
 from utils.database import Database, fetch_existing_table, fetch_sql
 from utils.file_operations import validate_dataframe
 from utils.dataframe_operations import diff_dataframe
 from utils.transformations import convert_date_format
 from utils.search import index_documents
+from utils.stage_cache import stage_fingerprint, cached_output, with_fingerprint, write_output
+from utils.datasets import read_dataset, write_dataset
+from utils.sampling import sample_frame
+
+# bump when a change to this stage changes what it writes (invalidates the stage cache)
+STAGE_VERSION = 1
 
 def _clean(df):
     print("Cleaning data")
@@ -41,7 +47,7 @@ def _clean(df):
 
     return df.reset_index(drop=True)
 
-def _transform(df):
+def _transform(df, file_date):
     print('Transforming data...')
     df['file_date'] = file_date.strftime('%Y-%m-%d')
     df['state'] = state.lower()
@@ -66,42 +72,78 @@ def _load_database(current_df):
     # rename file_date_x to file_date
     insert_df = insert_df.rename(columns={'file_date_x': 'file_date'})
     print(f"Found {len(insert_df)} new records to insert")
-    results = insert_df.to_sql(table_name, engine, if_exists='append', index=False, dtype=dtype_mapping, method='multi', chunksize=50)
+    db_connection.bulk_load(insert_df, table_name, dtype_mapping, if_exists='append')
+
+def extract(file_date, sample=0, seed=0) -> pd.DataFrame:
+    """
+    Read, validate, clean and transform the raw motor voter files of a file date.
+
+    Returns:
+    pd.DataFrame: The processed records, empty when the date has none.
+    """
+    raw_directory = os.path.join(RAW_DATA_PATH, file_date.strftime('%Y_%m_%d'), 'omv')
+    fingerprint = stage_fingerprint('omv_extract', STAGE_VERSION, raw_directory, (DATA_CONTRACT, dtype_mapping, final_columns),
+                                    {"sample": sample, "seed": seed}, processed_path(file_date))
+    df = cached_output(fingerprint, processed_path(file_date))
+    if df is not None:
+        return df
 
-def main():
     df = pd.DataFrame()
     # get dataframe with try except on file name
     try:
-        df = read_extract_multiple(df, os.path.join(RAW_DATA_PATH, file_date.strftime('%Y_%m_%d'), 'omv'))
-    except Exception as e:
+        df = read_extract_multiple(df, raw_directory)
+    except Exception:
         print(f"Error reading file {file_date.strftime('%Y-%m-%d')}")
-        print(get_traceback(e))
-        exit()
-    # if len is 0 exit()
+        raise
+    # if len is 0 there is nothing to process
     if len(df) == 0:
         print(f"No records found for {file_date.strftime('%Y-%m-%d')}")
-        exit()
+        return df
     # validate the dataframe with try except
     try:
         df = validate_dataframe(df, DATA_CONTRACT)
-    except Exception as e:
+    except Exception:
         print(f"Validation failed for {file_date.strftime('%Y-%m-%d')}")
-        print(get_traceback(e))
-        exit()
+        raise
     df = _clean(df)
     if sample:
-        print(f"...taking a sample of {sample}")
-        df = df.sample(n=sample)
-    df = _transform(df)
-    df = write_load(df, os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.gzip"))
-    df = write_load(df, os.path.join(FINAL_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.gzip"))
+        print(f"...taking a sample of {sample} voters (seed {seed})")
+        df = sample_frame(df, sample, seed)
+    return with_fingerprint(_transform(df, file_date), fingerprint)
+
+def load(df, file_date) -> pd.DataFrame:
+    """
+    Write the final file and insert the records the motor voter table does not have yet.
+    """
+    df = write_dataset(df, final_path(file_date), partition_columns)
     # convert election_date to datetime
     df['file_date'] = pd.to_datetime(df['file_date'])
     _load_database(df)
+    return df
+
+def processed_path(file_date):
+    return os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}")
+
+def final_path(file_date):
+    return os.path.join(FINAL_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}")
+
+def read_processed(file_date, columns=None, filters=None) -> pd.DataFrame:
+    return read_dataset(processed_path(file_date), columns, filters)
+
+def write_processed(df, file_date):
+    return write_output(df, processed_path(file_date), partition_columns)
+
+def main():
+    df = extract(file_date, sample, seed)
+    if len(df) == 0:
+        return
+    df = write_processed(df, file_date)
+    df = load(df, file_date)
 
     print(f"File Processed {len(df)} records")
 
 if __name__ == "__main__":
+    require_date()
     process_time = time.time()
     try:
         print(f"Processing raw {TABLENAME} file on {file_date.strftime('%Y-%m-%d')}")
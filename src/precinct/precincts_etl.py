@@ -15,11 +15,18 @@ import glob
 from common_functions.common import get_traceback, get_timing, cast_date, timing_decorator
 from common_functions.file_operations import read_extract, write_load, read_extract_multiple
 
-from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, LOGSTASH_DATA_PATH, state, file_date, sample, link
+from utils.arg_parser import require_date
+from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, LOGSTASH_DATA_PATH, state, file_date, sample, seed, link
 from utils.database import Database
 from utils.dataframe_operations import validate_dataframe
 from utils.transformations import convert_date_format
-from data_contracts.precinct_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns
+from utils.stage_cache import stage_fingerprint, cached_output, with_fingerprint, write_output
+from utils.datasets import read_dataset, write_dataset
+from utils.sampling import sample_frame
+from data_contracts.precinct_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns, partition_columns
+
+# bump when a change to this stage changes what it writes (invalidates the stage cache)
+STAGE_VERSION = 1
 
 
 def _clean(df):
@@ -31,7 +38,7 @@ def _clean(df):
 
     return df.reset_index(drop=True)
 
-def _transform(df):
+def _transform(df, file_date):
     print('Transforming data...')
     df['precinct_link'] = df['district_county'] + '-' + df['precinct_number'] + '-' + df['precinct_split']
     df['district_link'] = df['district_county'] + '-' + df['district_type'] + '-' + df['district_name']
@@ -40,19 +47,17 @@ def _transform(df):
     df = df[final_columns]
     return df.reset_index(drop=True)
 
-def _load_database(df) -> pd.DataFrame:
+def _load_database(df, file_date) -> pd.DataFrame:
     print("....writing to database")
 
     database = "oregon_voter_files"
     db_connection = Database(database)
-    engine = db_connection.get_engine()
     table_name = f"{TABLENAME.lower()}_{file_date.strftime('%Y_%m_%d')}"
 
-    # df.to_sql(table_name, con=engine, index=False, if_exists='replace')
-    df.to_sql(table_name, con=engine, index=False, if_exists='replace', dtype=dtype_mapping)
+    db_connection.bulk_load(df, table_name, dtype_mapping, if_exists='replace')
     return df.reset_index(drop=True)
 
-def _create_indices():
+def _create_indices(file_date):
     # Example usage
     database = "oregon_voter_files"
     db_connection = Database(database)
@@ -61,7 +66,7 @@ def _create_indices():
     db_connection.create_index(table_name, ["precinct_link"])
     db_connection.create_index(table_name, ["district_type", "district_name"])
 
-def _create_view():
+def _create_view(file_date):
     database = "oregon_voter_files"
     db_connection = Database(database)
 
@@ -87,32 +92,65 @@ def _load_es(df) -> pd.DataFrame:
 
     return df.reset_index(drop=True)
 
-def main():
+def extract(file_date, sample=0, seed=0) -> pd.DataFrame:
+    """
+    Read, validate, clean and transform the raw precinct files of a file date.
+    """
+    print(f"Processing raw {TABLENAME} file on {file_date.strftime('%Y-%m-%d')}")
+    raw_directory = os.path.join(RAW_DATA_PATH, file_date.strftime('%Y_%m_%d'), TABLENAME.lower())
+    fingerprint = stage_fingerprint('precincts_extract', STAGE_VERSION, raw_directory, (DATA_CONTRACT, dtype_mapping, final_columns),
+                                    {"sample": sample, "seed": seed}, processed_path(file_date))
+    df = cached_output(fingerprint, processed_path(file_date))
+    if df is not None:
+        return df
+
     df = pd.DataFrame()
-    df = read_extract_multiple(df, os.path.join(RAW_DATA_PATH, file_date.strftime('%Y_%m_%d'), TABLENAME.lower()))
+    df = read_extract_multiple(df, raw_directory)
     df = validate_dataframe(df, DATA_CONTRACT)
     df = _clean(df)
     if sample:
-        print(f"...taking a sample of {sample}")
-        df = df.sample(n=sample)
-    df = _transform(df)
-    df = write_load(df, os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.gzip"))
-    df = write_load(df, os.path.join(FINAL_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.gzip"))
-    df = _load_database(df)
-    _create_indices()
+        # precincts have no voter id, the sample is of whole rows
+        print(f"...taking a sample of {sample} (seed {seed})")
+        df = sample_frame(df, sample, seed, key=None)
+    return with_fingerprint(_transform(df, file_date), fingerprint)
+
+def load(df, file_date, link=False) -> pd.DataFrame:
+    """
+    Write the final precinct file, the database table (and view) and the logstash file.
+    """
+    df = write_dataset(df, final_path(file_date), partition_columns)
+    df = _load_database(df, file_date)
+    _create_indices(file_date)
     if (link):
-        _create_view()
+        _create_view(file_date)
     else:
         print("Skipping create view")
-    df = _load_es(df)
+    return _load_es(df)
+
+def processed_path(file_date):
+    return os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}")
+
+def final_path(file_date):
+    return os.path.join(FINAL_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}")
+
+def read_processed(file_date, columns=None, filters=None) -> pd.DataFrame:
+    return read_dataset(processed_path(file_date), columns, filters)
+
+def write_processed(df, file_date):
+    return write_output(df, processed_path(file_date), partition_columns)
+
+def main():
+    df = extract(file_date, sample, seed)
+    df = write_processed(df, file_date)
+    df = load(df, file_date, link)
     # print(df.columns)
 
     print(f"File Processed {len(df)} records")
 
 if __name__ == "__main__":
+    require_date()
     process_time = time.time()
     try:
-        print(f"Processing raw {TABLENAME} file on {file_date.strftime('%Y-%m-%d')}")
         main()
     except Exception as e:
         print('------Start--------')
@@ -1,37 +1,36 @@
-import os
+"""
+Runs the precinct pipeline (extract -> load) in one process for every raw
+folder up to --date (all of them when it is omitted). The processed datasets
+are only written with --persist; --stages load loads the datasets an earlier
+run persisted.
+"""
+import sys
 sys.path.append(r'../src')
-import re
-import logging
-from utils.config import DATA_FILES
-from precinct_data_contract import STATE
+from common_functions.common import timing_decorator
 
-def get_folder_names(directory, pattern):
-    folder_names = []
-    for item in os.listdir(directory):
-        if os.path.isdir(os.path.join(directory, item)) and re.match(pattern, item):
-            folder_names.append(item)
-    return folder_names
+from utils.config import RAW_DATA_PATH, file_date, sample, seed, link, persist, stages
+from utils.pipeline import get_file_dates, setup_logging, select_stages, run_file_dates
+from precinct import precincts_etl
 
-def setup_logging():
-    logging.basicConfig(filename='voter_data_extraction.log', level=logging.INFO,
-                        format='%(asctime)s - %(levelname)s - %(message)s')
+def _extract(df, file_date):
+    return precincts_etl.extract(file_date, sample, seed)
 
-def main():
-    directory = os.path.join(DATA_FILES, STATE.lower(), 'voter_lists', 'raw')
-    pattern = r'\d{4}_\d{2}_\d{2}'  # Pattern for yyyy_mm_dd
-    folder_names = get_folder_names(directory, pattern)
+def _load(df, file_date):
+    if df is None:
+        df = precincts_etl.read_processed(file_date)
+    return precincts_etl.load(df, file_date, link)
 
-    setup_logging()
+STAGES = [
+    ('extract', _extract, precincts_etl.write_processed),
+    ('load', _load, None),
+]
 
-    for folder_name in sorted(folder_names):
-        date_format = folder_name.replace('_', '-')
-        command = f'python precinct/precinct_extract.py --date={date_format}'
-        logging.info(f"Executing: {command}")
-        return_code = os.system(command)
-        if return_code != 0:
-            logging.error(f"Command failed with return code {return_code}: {command}")
-        else:
-            logging.info(f"Command executed successfully: {command}")
+@timing_decorator
+def main():
+    setup_logging()
+    file_dates = get_file_dates(RAW_DATA_PATH, until=file_date)
+    print(f"Processing {len(file_dates)} folders of {RAW_DATA_PATH}")
+    run_file_dates(select_stages(STAGES, stages), file_dates, persist)
 
 if __name__ == "__main__":
     main()
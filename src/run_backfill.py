@@ -0,0 +1,63 @@
+"""
+Backfills the voter file, vote history and precinct datasets for every raw
+folder up to --date (all of them when it is omitted), running independent
+file dates and datasets in parallel across BACKFILL_WORKERS processes (see
+utils/scheduler.py).
+
+    python run_backfill.py [--date=2024-06-01] [--datasets voters,history] [--stages extract] [--force]
+
+Finished tasks leave done markers in BACKFILL_MARKERS_PATH, so rerunning the
+same command resumes after a failure. The markers keep the parameters the
+stages ran with; a task done with another --sample, --seed, --incremental,
+--link or other stages is run again.
+"""
+import sys
+sys.path.append(r'../src')
+from common_functions.common import timing_decorator
+
+from utils.config import RAW_DATA_PATH, BACKFILL_MARKERS_PATH, BACKFILL_WORKERS, file_date, sample, seed, incremental, link, stages, datasets, force
+from utils.pipeline import get_file_dates, setup_logging
+from utils.scheduler import run_backfill
+from voterfile import run_extract as voters_pipeline
+from votehistory import run_load as history_pipeline
+from precinct import run_extract as precincts_pipeline
+
+# dataset -> (stages, stages that wait for the previous file date)
+DATASETS = {
+    # the address passes share the Elasticsearch cluster and the address cache, and
+    # --incremental diffs against the previous final file, so transforms run in date order
+    'voters': (voters_pipeline.STAGES, {'transform', 'load'} if link else {'transform'}),
+    # the history load inserts what the election tables do not have yet
+    'history': (history_pipeline.STAGES, {'load'}),
+    'precincts': (precincts_pipeline.STAGES, {'load'} if link else set()),
+}
+DEFAULT_STAGES = {
+    'voters': voters_pipeline.DEFAULT_STAGES,
+}
+
+def _selected(dataset, dataset_stages):
+    names = stages or DEFAULT_STAGES.get(dataset, [name for name, _, _ in dataset_stages])
+    return [stage for stage in dataset_stages if stage[0] in names]
+
+@timing_decorator
+def main():
+    setup_logging()
+    unknown = set(datasets) - set(DATASETS)
+    if unknown:
+        raise ValueError(f"Unknown datasets {sorted(unknown)}, expected some of {list(DATASETS)}")
+    selected = {}
+    for dataset, (dataset_stages, ordered) in DATASETS.items():
+        if datasets and dataset not in datasets:
+            continue
+        dataset_stages = _selected(dataset, dataset_stages)
+        if dataset_stages:
+            selected[dataset] = (dataset_stages, ordered)
+    file_dates = get_file_dates(RAW_DATA_PATH, until=file_date)
+    print(f"Backfilling {list(selected)} for {len(file_dates)} folders of {RAW_DATA_PATH}")
+    params = {"sample": sample, "seed": seed, "incremental": incremental, "link": link}
+    status = run_backfill(selected, file_dates, BACKFILL_MARKERS_PATH, BACKFILL_WORKERS, force, params)
+    if any(state in ('failed', 'blocked') for state in status.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
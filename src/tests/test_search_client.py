@@ -0,0 +1,44 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from utils.rate_control import MsearchItemError, RateController, is_retriable
+from utils.search_client import MyExtendedElasticsearch
+
+REJECTED = {"status": 429, "error": {"type": "es_rejected_execution_exception", "reason": "rejected execution"}}
+FOUND = {"status": 200, "hits": {"hits": []}}
+
+class FakeClient:
+    """
+    Answers each _msearch request with the next list of items.
+    """
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def msearch(self, searches):
+        self.requests.append(searches)
+        return {"responses": self.responses.pop(0)}
+
+def search_client(*responses):
+    # skip __init__, which connects to the cluster
+    es = MyExtendedElasticsearch.__new__(MyExtendedElasticsearch)
+    es.client = FakeClient(*responses)
+    return es
+
+def test_msearch_raises_the_item_error():
+    es = search_client([FOUND, REJECTED])
+    with pytest.raises(MsearchItemError) as error:
+        es.msearch("places", [{"query": {"match_all": {}}}] * 2)
+    assert error.value.status == 429
+    assert is_retriable(error.value)
+
+def test_rate_controller_retries_a_rejected_item():
+    es = search_client([FOUND, REJECTED], [FOUND, FOUND])
+    controller = RateController(backoff=0, backoff_max=0)
+    responses = controller.call(lambda: es.msearch("places", [{"query": {"match_all": {}}}] * 2))
+    assert responses == [FOUND, FOUND]
+    assert controller.retries == 1
+    assert len(es.client.requests) == 2
@@ -0,0 +1,210 @@
+"""
+Persistent cache of address-pass search results.
+
+Results are stored in a sqlite file on local disk (ADDRESS_CACHE_PATH, not
+the NFS data volume, where sqlite locking is unreliable) keyed on
+(pass, index, normalized query) so each file date only sends Elasticsearch
+the addresses it has not seen before. Entries expire after a TTL, the least
+recently used entries are evicted past a size limit and every entry for an
+index is dropped when that index is rebuilt (its uuid changes).
+"""
+import os
+import json
+import time
+import sqlite3
+
+from utils.config import ADDRESS_CACHE_PATH, ADDRESS_CACHE_TTL_DAYS, ADDRESS_CACHE_MAX_ENTRIES, ADDRESS_CACHE_ENABLED, ADDRESS_CACHE_BUSY_TIMEOUT
+
+# sqlite limits the number of bound parameters per statement
+LOOKUP_CHUNK_SIZE = 500
+
+def normalize_query_keys(params, case_sensitive=False):
+    """
+    Build the cache key for each query from its arguments.
+
+    Full text queries go through the standard analyzer, so case and repeated
+    whitespace do not change the result and are folded away. Term queries
+    (exact match) are case sensitive and are only stripped.
+
+    Parameters:
+    params (pd.DataFrame): The arguments used to build each query, one column per argument.
+    case_sensitive (bool): Keep case and inner whitespace as is.
+
+    Returns:
+    pd.Series: The normalized key of each row.
+    """
+    columns = [params[column].astype(str) for column in params.columns]
+    if case_sensitive:
+        keys = columns[0].str.strip()
+        for column in columns[1:]:
+            keys = keys + '\x1f' + column.str.strip()
+        return keys
+
+    keys = columns[0]
+    for column in columns[1:]:
+        keys = keys + ' ' + column
+    return keys.str.upper().str.replace(r'\s+', ' ', regex=True).str.strip()
+
+class AddressCache:
+    def __init__(self, path=ADDRESS_CACHE_PATH, ttl_days=ADDRESS_CACHE_TTL_DAYS, max_entries=ADDRESS_CACHE_MAX_ENTRIES):
+        """
+        Open (or create) the cache file.
+
+        Parameters:
+        path (str): Location of the sqlite file.
+        ttl_days (float): Age after which an entry is no longer used.
+        max_entries (int): Number of entries kept after eviction.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._validated = set()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # backfill workers share the file from separate processes: wait for the
+        # write lock instead of failing, and let readers run during a write (WAL)
+        self.connection = sqlite3.connect(path, timeout=ADDRESS_CACHE_BUSY_TIMEOUT)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "pass_name TEXT, index_name TEXT, query_key TEXT, result TEXT, created_at REAL, accessed_at REAL, "
+            "PRIMARY KEY (pass_name, index_name, query_key))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed_at ON results (accessed_at)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS indices (index_name TEXT PRIMARY KEY, generation TEXT)")
+        self.connection.commit()
+
+    def get_many(self, pass_name, index_name, keys):
+        """
+        Look up cached results.
+
+        Parameters:
+        pass_name (str): The address pass, e.g. '02'.
+        index_name (str): The Elasticsearch index the results came from.
+        keys (list of str): Normalized query keys.
+
+        Returns:
+        dict: query key -> cached result (dict of columns_to_update) for the keys found.
+        """
+        now = time.time()
+        oldest = now - self.ttl_seconds
+        found = {}
+        for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT query_key, result FROM results WHERE pass_name = ? AND index_name = ? AND created_at >= ? AND query_key IN ({placeholders})",
+                [pass_name, index_name, oldest, *chunk],
+            ).fetchall()
+            for query_key, result in rows:
+                found[query_key] = json.loads(result)
+
+        if found:
+            self.connection.executemany(
+                "UPDATE results SET accessed_at = ? WHERE pass_name = ? AND index_name = ? AND query_key = ?",
+                [(now, pass_name, index_name, key) for key in found],
+            )
+            self.connection.commit()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, pass_name, index_name, results):
+        """
+        Store results.
+
+        Parameters:
+        pass_name (str): The address pass, e.g. '02'.
+        index_name (str): The Elasticsearch index the results came from.
+        results (dict): query key -> result (dict of columns_to_update).
+        """
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO results (pass_name, index_name, query_key, result, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(pass_name, index_name, key, json.dumps(result, default=lambda value: value.item()), now, now) for key, result in results.items()],
+        )
+        self.connection.commit()
+
+    def validate_index(self, index_name, generation):
+        """
+        Drop the entries of an index when it has been rebuilt since they were cached.
+
+        Parameters:
+        index_name (str): The Elasticsearch index name.
+        generation (str): Identifier of the current build of the index (its uuid).
+        """
+        if index_name in self._validated:
+            return
+        row = self.connection.execute("SELECT generation FROM indices WHERE index_name = ?", [index_name]).fetchone()
+        if row is not None and row[0] != generation:
+            print(f"...{index_name} was rebuilt, invalidating cached results")
+            self.invalidate(index_name)
+        self.connection.execute("INSERT OR REPLACE INTO indices (index_name, generation) VALUES (?, ?)", [index_name, generation])
+        self.connection.commit()
+        self._validated.add(index_name)
+
+    def invalidate(self, index_name=None):
+        """
+        Remove cached results for one index, or all of them.
+
+        Parameters:
+        index_name (str): The index to invalidate, None for everything.
+        """
+        if index_name is None:
+            self.connection.execute("DELETE FROM results")
+        else:
+            self.connection.execute("DELETE FROM results WHERE index_name = ?", [index_name])
+        self.connection.commit()
+
+    def evict(self):
+        """
+        Remove expired entries and trim the least recently used past max_entries.
+        """
+        self.connection.execute("DELETE FROM results WHERE created_at < ?", [time.time() - self.ttl_seconds])
+        count = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY accessed_at LIMIT ?)",
+                [count - self.max_entries],
+            )
+        self.connection.commit()
+
+    def stats(self):
+        """
+        Return the hit/miss counters since the cache was opened.
+        """
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": hit_rate}
+
+    def close(self):
+        self.evict()
+        self.connection.close()
+
+_address_cache = None
+
+def get_address_cache():
+    """
+    Return the process wide AddressCache, or None when caching is disabled.
+    """
+    global _address_cache
+    if not ADDRESS_CACHE_ENABLED:
+        return None
+    if _address_cache is None:
+        _address_cache = AddressCache()
+    return _address_cache
+
+def close_address_cache():
+    """
+    Report the counters, evict stale entries and close the process wide cache.
+    """
+    global _address_cache
+    if _address_cache is None:
+        return
+    stats = _address_cache.stats()
+    print(f"...address cache hits {stats['hits']} misses {stats['misses']} ({stats['hit_rate']:.1%})")
+    _address_cache.close()
+    _address_cache = None
@@ -0,0 +1,109 @@
+"""
+Declarative rules for classifying voter addresses before the address passes.
+
+Each rule is a tuple of (label, columns, test_type, condition):
+
+- 'startswith': the column starts with condition (literal, case sensitive)
+- 'contains': the column matches the regex condition anywhere, ignoring case
+- 'contains_case': like 'contains' but case sensitive
+- 'equals': the column is exactly condition
+
+All the rules for one label and column are compiled into a single regex, so
+adding a rule does not add another scan of the column. Labels are applied in
+the order they first appear, later labels overriding earlier ones.
+"""
+import re
+import pandas as pd
+
+PHYSICAL_ADDRESS_COLUMNS = ['physical_address_1', 'physical_address_2']
+
+ADDRESS_RULES = [
+    ('Confidential', ['confidential'], 'equals', 'Confidential'),
+
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'startswith', '00'),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'contains', '@'),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'contains', 'PARKING '),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'contains', 'Lot '),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'contains', 'AROUND '),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'contains', ' & '),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'contains', 'SAFE CAMP'),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'contains', 'CORNER OF '),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'contains', 'BETWEEN '),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'startswith', 'NEAR '),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'startswith', '0 '),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'startswith', 'HOSELESS '),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'startswith', 'HOMELESS '),
+    ('Homeless', PHYSICAL_ADDRESS_COLUMNS, 'startswith', 'BEHIND '),
+    ('Homeless', ['physical_address_2'], 'contains_case', ' AND '),
+]
+
+def rule_name(rule):
+    label, _, test_type, condition = rule
+    return f"{label}: {test_type} '{condition}'"
+
+def rule_pattern(test_type, condition):
+    """
+    Translate one test into a regex fragment.
+    """
+    if test_type == 'startswith':
+        return f"^{re.escape(condition)}"
+    if test_type == 'contains':
+        return f"(?i:{condition})"
+    if test_type == 'contains_case':
+        return f"(?:{condition})"
+    if test_type == 'equals':
+        return f"^{re.escape(condition)}$"
+    raise ValueError(f"Unknown address rule test: {test_type}")
+
+def compile_rules(rules):
+    """
+    Group rules by label and column and combine each group into one regex.
+
+    Parameters:
+    rules (list of tuple): (label, columns, test_type, condition) rules.
+
+    Returns:
+    list of tuple: (label, column, combined pattern, [(rule, pattern), ...]) in label order.
+    """
+    groups = {}
+    for rule in rules:
+        label, columns, test_type, condition = rule
+        pattern = rule_pattern(test_type, condition)
+        for column in columns:
+            groups.setdefault((label, column), []).append((rule, pattern))
+
+    compiled = []
+    for (label, column), members in groups.items():
+        combined = '|'.join(pattern for _, pattern in members)
+        compiled.append((label, column, combined, members))
+    return compiled
+
+def classify_addresses(df, rules=ADDRESS_RULES, result_column='results'):
+    """
+    Label rows with the first matching rules' labels (later labels win) in one
+    pass per label and column, and count the hits of every rule.
+
+    Parameters:
+    df (pd.DataFrame): DataFrame to process
+    rules (list of tuple): (label, columns, test_type, condition) rules.
+    result_column (str): Column receiving the labels.
+
+    Returns:
+    tuple: (modified DataFrame, dict of rule name -> rows hit)
+    """
+    hit_counts = {rule_name(rule): 0 for rule in rules}
+    label_masks = {}
+
+    for label, column, combined, members in compile_rules(rules):
+        matched = df[column].str.contains(combined, na=False, regex=True)
+        label_masks[label] = label_masks.get(label, pd.Series(False, index=df.index)) | matched
+
+        # only the (few) matched rows are tested rule by rule for the counts
+        matched_values = df.loc[matched, column]
+        for rule, pattern in members:
+            hit_counts[rule_name(rule)] += int(matched_values.str.contains(pattern, na=False, regex=True).sum())
+
+    for label, mask in label_masks.items():
+        df.loc[mask, result_column] = label
+
+    return df, hit_counts
@@ -1,28 +1,86 @@
 import argparse
 from datetime import datetime
 
+_args = None
+_parser = None
+
 def parse_args():
+    """
+    Parse the command line once per process; later calls return the same namespace.
+    """
+    global _args, _parser
+    if _args is not None:
+        return _args
     parser = argparse.ArgumentParser(description='Process voter data')
-    parser.add_argument('--date', required=True, help='File date in YYYY-MM-DD format')
+    parser.add_argument('--date', default=None, help='File date in YYYY-MM-DD format, the run_* runners process every raw folder up to it (all of them when omitted)')
     parser.add_argument('--iteration', type=int, default=0, help='Which pass to run with a default of 0 (all passes)')
+    parser.add_argument('--resume', type=int, default=0, help='Finish an interrupted transform from its checkpoints, running the passes from this one on')
     parser.add_argument('--sample', type=int, default=0, help='Sample option with a default of 0')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the --sample voters, the same seed samples the same voters in every file')
     parser.add_argument('--link', action='store_true', help="Set a boolean flag.")
-    return parser.parse_args()
+    parser.add_argument('--incremental', action='store_true', help="Only re-geocode voters that are new or moved since the previous file date")
+    parser.add_argument('--persist', action='store_true', help="Write the intermediate (processed) files when running a pipeline")
+    parser.add_argument('--stages', default='', help="Comma separated pipeline stages to run, default all of the runner's stages")
+    parser.add_argument('--datasets', default='', help="Comma separated datasets to backfill, default all of them")
+    parser.add_argument('--force', action='store_true', help="Rerun backfill tasks that already have a done marker")
+    _args = parser.parse_args()
+    _parser = parser
+    return _args
 
 def get_date():
     args = parse_args()
     file_date_str = args.date
+    if file_date_str is None:
+        return None
     file_date = datetime.strptime(file_date_str, '%Y-%m-%d')
     return file_date
 
+def require_date():
+    """
+    Return --date, exiting with the usage message when it is missing.
+    The single file date scripts need it, the run_* runners do not.
+    """
+    file_date = get_date()
+    if file_date is None:
+        _parser.error('the following arguments are required: --date')
+    return file_date
+
 def get_sample():
     args = parse_args()
     return args.sample
 
+def get_seed():
+    args = parse_args()
+    return args.seed
+
 def get_iteration():
     args = parse_args()
     return args.iteration
 
+def get_resume():
+    args = parse_args()
+    return args.resume
+
 def get_link():
     args = parse_args()
     return args.link
+
+def get_incremental():
+    args = parse_args()
+    return args.incremental
+
+def get_persist():
+    args = parse_args()
+    return args.persist
+
+def get_stages():
+    args = parse_args()
+    return [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+
+def get_datasets():
+    args = parse_args()
+    return [dataset.strip() for dataset in args.datasets.split(',') if dataset.strip()]
+
+def get_force():
+    args = parse_args()
+    return args.force
@@ -0,0 +1,103 @@
+"""
+Asyncio path for the address passes.
+
+Batches of queries are streamed through worker coroutines sharing one
+AsyncElasticsearch client, so the passes get network-bound parallelism from
+a single process instead of forking a worker per core. The RateController
+decides how many of the workers may have a request in flight.
+"""
+import time
+import asyncio
+from elasticsearch import AsyncElasticsearch
+
+from utils.rate_control import MsearchItemError, get_rate_controller
+from utils.config import ES_HOST, ES_USERNAME, ES_PASSWORD, CA_CERT_PATH, ES_MAX_CONCURRENCY, ES_REQUEST_TIMEOUT, ES_HTTP_COMPRESS
+
+def create_async_client(max_concurrency=ES_MAX_CONCURRENCY):
+    """
+    Create an AsyncElasticsearch client with a keep-alive pool sized for max_concurrency.
+    The transport does not retry, the RateController retries every request.
+
+    Returns:
+        AsyncElasticsearch: The client; close it with `await client.close()`.
+    """
+    return AsyncElasticsearch(
+        ES_HOST,
+        ca_certs=CA_CERT_PATH or None,
+        basic_auth=(ES_USERNAME, ES_PASSWORD),
+        connections_per_node=max_concurrency,
+        request_timeout=ES_REQUEST_TIMEOUT,
+        http_compress=ES_HTTP_COMPRESS,
+        max_retries=0,
+        retry_on_timeout=False,
+        retry_on_status=(),
+    )
+
+async def _msearch(client, index_name, queries):
+    searches = []
+    for query in queries:
+        searches.append({"index": index_name})
+        searches.append(query)
+    response = await client.msearch(searches=searches)
+    responses = response['responses']
+    for item in responses:
+        if 'error' in item:
+            raise MsearchItemError(index_name, item['error'], item.get('status'))
+    return responses
+
+async def _msearch_all(index_name, queries, on_batch, batch_size, max_concurrency):
+    batches = asyncio.Queue()
+    for start in range(0, len(queries), batch_size):
+        batches.put_nowait(start)
+    controller = get_rate_controller()
+    # workers wait here while the controller allows fewer requests than are in flight
+    slots = asyncio.Condition()
+    in_flight = 0
+
+    async def worker(client):
+        nonlocal in_flight
+        while True:
+            try:
+                start = batches.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            async with slots:
+                await slots.wait_for(lambda: in_flight < controller.allowed)
+                in_flight += 1
+            try:
+                started = time.perf_counter()
+                responses = await controller.call_async(lambda: _msearch(client, index_name, queries[start:start + batch_size]))
+                on_batch(start, responses, time.perf_counter() - started)
+            finally:
+                async with slots:
+                    in_flight -= 1
+                    slots.notify_all()
+
+    client = create_async_client(max_concurrency)
+    workers = [asyncio.create_task(worker(client)) for _ in range(min(max_concurrency, batches.qsize()))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        # a failed worker leaves the others with requests in flight, stop them before the session closes
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await client.close()
+
+def msearch_async(index_name, queries, on_batch, batch_size, max_concurrency=ES_MAX_CONCURRENCY):
+    """
+    Run queries through _msearch with at most max_concurrency requests in flight.
+
+    Args:
+        index_name (str): The name of the Elasticsearch index to search.
+        queries (list of dict): Query bodies.
+        on_batch (callable): Called as on_batch(offset, responses, seconds) as each
+            batch completes; offset is the position of the batch's first query
+            and seconds the wall time of its request.
+        batch_size (int): Number of queries sent per _msearch request.
+        max_concurrency (int): Most _msearch requests in flight; the rate
+            controller may allow fewer.
+    """
+    if not queries:
+        return
+    asyncio.run(_msearch_all(index_name, queries, on_batch, batch_size, max_concurrency))
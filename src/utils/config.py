@@ -1,14 +1,20 @@
 # utils/config.py
 import os
+from functools import cached_property
 from dotenv import load_dotenv
-from utils.arg_parser import get_date, get_sample, get_iteration, get_link
-# Initialize pandarallel
-from pandarallel import pandarallel
+from utils.arg_parser import get_date, get_sample, get_seed, get_iteration, get_resume, get_link, get_incremental, get_persist, get_stages, get_datasets, get_force
 
-def initialize_pandarallel():
-    pandarallel.initialize(progress_bar=True, use_memory_fs=False)
+_pandarallel_initialized = False
 
-initialize_pandarallel()
+def initialize_pandarallel():
+    """
+    Start pandarallel once per process, right before the first parallel_apply.
+    """
+    global _pandarallel_initialized
+    if not _pandarallel_initialized:
+        from pandarallel import pandarallel
+        pandarallel.initialize(progress_bar=True, use_memory_fs=False)
+        _pandarallel_initialized = True
 
 # Specify the path to the .env file at the top level of your project
 dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '..', '.env')
@@ -17,10 +23,64 @@ load_dotenv(dotenv_path)
 
 # Global Variables
 state = os.environ.get("STATE", "OREGON").lower() # defined in .env file
-file_date = get_date() # defined in utils/arg_parser.py cli argument
-sample = get_sample() # defined in utils/arg_parser.py cli argument
-iteration = get_iteration() # defined in utils/arg_parser.py cli argument
-link = get_link() # defined in utils/arg_parser.py cli argument
+
+class Settings:
+    """
+    The cli arguments (utils/arg_parser.py), parsed on first access. They are
+    read as module attributes (from utils.config import file_date), so
+    modules that only need the constants below do not parse the command line.
+    """
+    @cached_property
+    def file_date(self):
+        # None without --date, the single file date scripts call require_date()
+        return get_date()
+
+    @cached_property
+    def sample(self):
+        return get_sample()
+
+    @cached_property
+    def seed(self):
+        return get_seed()
+
+    @cached_property
+    def iteration(self):
+        return get_iteration()
+
+    @cached_property
+    def resume(self):
+        return get_resume()
+
+    @cached_property
+    def link(self):
+        return get_link()
+
+    @cached_property
+    def incremental(self):
+        return get_incremental()
+
+    @cached_property
+    def persist(self):
+        return get_persist()
+
+    @cached_property
+    def stages(self):
+        return get_stages()
+
+    @cached_property
+    def datasets(self):
+        return get_datasets()
+
+    @cached_property
+    def force(self):
+        return get_force()
+
+settings = Settings()
+
+def __getattr__(name):
+    if isinstance(getattr(Settings, name, None), cached_property):
+        return getattr(settings, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Define default constants
 
@@ -31,6 +91,20 @@ ES_HOST=os.environ.get("ES_HOST", "https://localhost:9200")
 ES_USERNAME=os.environ.get("ES_USERNAME", "elastic")
 ES_PASSWORD=os.environ.get("ES_PASSWORD", "")
 CA_CERT_PATH=os.environ.get("CA_CERT_PATH", "")
+ES_POOL_MAXSIZE=int(os.environ.get("ES_POOL_MAXSIZE", "10")) # connections per node kept alive by each process
+ES_REQUEST_TIMEOUT=float(os.environ.get("ES_REQUEST_TIMEOUT", "30"))
+ES_HTTP_COMPRESS=os.environ.get("ES_HTTP_COMPRESS", "true").lower() == "true"
+ES_MAX_RETRIES=int(os.environ.get("ES_MAX_RETRIES", "3")) # transport retries of bulk indexing and the snapshot scroll, the address searches are retried by the RateController
+ES_MSEARCH_BATCH_SIZE=int(os.environ.get("ES_MSEARCH_BATCH_SIZE", "500")) # queries per _msearch request in the address passes
+ES_ASYNC=os.environ.get("ES_ASYNC", "false").lower() == "true" # resolve the address passes with AsyncElasticsearch
+ES_MAX_CONCURRENCY=int(os.environ.get("ES_MAX_CONCURRENCY", "8")) # upper bound of _msearch requests in flight in async mode
+ES_MIN_CONCURRENCY=int(os.environ.get("ES_MIN_CONCURRENCY", "1"))
+ES_LATENCY_TARGET=float(os.environ.get("ES_LATENCY_TARGET", "5")) # seconds; slower _msearch requests lower the concurrency
+ES_RETRY_ATTEMPTS=int(os.environ.get("ES_RETRY_ATTEMPTS", "5")) # tries per _msearch request on 429s and timeouts
+ES_RETRY_BACKOFF=float(os.environ.get("ES_RETRY_BACKOFF", "0.5"))
+ES_RETRY_BACKOFF_MAX=float(os.environ.get("ES_RETRY_BACKOFF_MAX", "30"))
+ES_BREAKER_THRESHOLD=int(os.environ.get("ES_BREAKER_THRESHOLD", "10")) # consecutive failed requests before the passes stop
+ADDRESS_BACKEND=os.environ.get("ADDRESS_BACKEND", "elasticsearch").lower() # 'elasticsearch' or 'local' (places snapshots)
 
 # File Paths
 LOGSTASH_DATA_PATH = os.environ.get("LOGSTASH_FILES", "/Volumes/nfs-data/logstash")
@@ -39,9 +113,38 @@ PROCESSED_DATA_PATH = os.path.join(DATA_FILES, state, 'voter_lists', 'processed'
 FINAL_DATA_PATH = os.path.join(DATA_FILES, state, 'voter_lists', 'final')
 WORKING_DATA_PATH = os.path.join(DATA_FILES, state, 'voter_lists', 'working')
 
+CHECKPOINT_COMPRESSION = os.environ.get("CHECKPOINT_COMPRESSION", "zstd") # codec for the address pass checkpoints
+PLACES_SNAPSHOT_PATH = os.environ.get("PLACES_SNAPSHOT_PATH", os.path.join(WORKING_DATA_PATH, 'places'))
+BACKFILL_MARKERS_PATH = os.environ.get("BACKFILL_MARKERS_PATH", os.path.join(WORKING_DATA_PATH, 'backfill')) # done markers of the backfill tasks
+GENDER_TABLE_PATH = os.environ.get("GENDER_TABLE_PATH", os.path.join(WORKING_DATA_PATH, 'gender_names.parquet')) # name -> gender_guesser answer
+
+# Processed and final datasets (utils/datasets.py)
+DATASET_COMPRESSION = os.environ.get("DATASET_COMPRESSION", "zstd")
+DATASET_ROW_GROUP_SIZE = int(os.environ.get("DATASET_ROW_GROUP_SIZE", "131072")) # rows per parquet row group
+
+# Final pass fuzzy match against the places snapshot
+FUZZY_MATCH_THRESHOLD = float(os.environ.get("FUZZY_MATCH_THRESHOLD", "85")) # lowest accepted similarity, 0-100
+FUZZY_MATCH_PREFIX = int(os.environ.get("FUZZY_MATCH_PREFIX", "3")) # street name letters in the blocking key
+FUZZY_MATCH_CHUNK_SIZE = int(os.environ.get("FUZZY_MATCH_CHUNK_SIZE", "20000")) # voter addresses scored per batch
+
+# Extract stage cache (skips extracts whose raw files, contract and code are unchanged)
+STAGE_CACHE_ENABLED = os.environ.get("STAGE_CACHE_ENABLED", "true").lower() == "true"
+
+# Backfill scheduler
+BACKFILL_WORKERS = int(os.environ.get("BACKFILL_WORKERS", str(os.cpu_count() or 1))) # processes running backfill tasks
+
+# Address pass result cache (shared across file dates)
+ADDRESS_CACHE_ENABLED = os.environ.get("ADDRESS_CACHE_ENABLED", "true").lower() == "true"
+# sqlite locking is unreliable on NFS (DATA_FILES), so the cache defaults to local disk
+ADDRESS_CACHE_PATH = os.environ.get("ADDRESS_CACHE_PATH", os.path.join(os.path.expanduser('~'), '.cache', 'voter_data', state, 'address_cache.sqlite'))
+ADDRESS_CACHE_BUSY_TIMEOUT = float(os.environ.get("ADDRESS_CACHE_BUSY_TIMEOUT", "60")) # seconds a process waits for another one's write
+ADDRESS_CACHE_TTL_DAYS = float(os.environ.get("ADDRESS_CACHE_TTL_DAYS", "90"))
+ADDRESS_CACHE_MAX_ENTRIES = int(os.environ.get("ADDRESS_CACHE_MAX_ENTRIES", "10000000"))
+
 # Database Connections
 DB_HOST = os.environ.get("DB_HOST", "localhost")
 DB_USERNAME = os.environ.get("DB_USERNAME", "root")
 DB_PASSWORD = os.environ.get("DB_PASSWORD", "password")
 DB_PORT = os.environ.get("DB_PORT", "3306")
 DB_DATABASE = os.environ.get("DB_DATABASE", "voterfile")
+DB_BULK_LOAD_CHUNK_ROWS = int(os.environ.get("DB_BULK_LOAD_CHUNK_ROWS", "100000")) # rows formatted at a time into the LOAD DATA file
@@ -0,0 +1,92 @@
+"""
+Partitioned parquet datasets for the processed and final files.
+
+Outputs are written as hive partitioned directories, e.g.
+FINAL_DATA_PATH/2024.01.01.voters/county=MULTNOMAH/part-0.parquet, with
+DATASET_COMPRESSION (zstd) and row groups of DATASET_ROW_GROUP_SIZE rows.
+read_dataset projects columns and pushes filters down to the partition
+directories and the row group statistics, so a job that needs a few columns
+or one county only decodes those. Dates written before the datasets existed
+are read from their single gzip file (<path>.gzip) with the same options.
+"""
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils.config import DATASET_COMPRESSION, DATASET_ROW_GROUP_SIZE
+
+def legacy_path(path):
+    return f"{path}.gzip"
+
+def write_dataset(df, path, partition_columns=None):
+    """
+    Write df as a partitioned dataset, replacing the one at path.
+
+    Parameters:
+    df (pd.DataFrame): The frame to write.
+    path (str): The dataset directory.
+    partition_columns (list of str): Columns to partition by (one directory level each).
+
+    Returns:
+    pd.DataFrame: df, unchanged.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    temp_path = f"{path}.tmp"
+    shutil.rmtree(temp_path, ignore_errors=True)
+    if table.num_rows == 0:
+        # write_dataset writes no file for an empty table, keep its schema in one unpartitioned file
+        os.makedirs(temp_path)
+        pq.write_table(table, os.path.join(temp_path, 'part-0.parquet'), compression=DATASET_COMPRESSION)
+    else:
+        ds.write_dataset(
+            table, temp_path, format='parquet',
+            partitioning=partition_columns or None, partitioning_flavor='hive' if partition_columns else None,
+            file_options=ds.ParquetFileFormat().make_write_options(compression=DATASET_COMPRESSION),
+            max_rows_per_group=DATASET_ROW_GROUP_SIZE, min_rows_per_group=min(DATASET_ROW_GROUP_SIZE, 16384),
+            basename_template='part-{i}.parquet',
+        )
+    # a crash in between leaves the new dataset in temp_path and no half written one at path
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temp_path, path)
+    return df
+
+def _read_table(path, columns, filters):
+    if os.path.isdir(path):
+        return pq.read_table(path, columns=columns, filters=filters, partitioning=ds.HivePartitioning.discover(infer_dictionary=True))
+    return pq.read_table(legacy_path(path), columns=columns, filters=filters)
+
+def dataset_columns(path):
+    """
+    The column names of a dataset (or of its legacy file).
+    """
+    if os.path.isdir(path):
+        return ds.dataset(path, format='parquet', partitioning='hive').schema.names
+    return pq.read_schema(legacy_path(path)).names
+
+def read_dataset(path, columns=None, filters=None):
+    """
+    Read a dataset written by write_dataset, or the legacy gzip file.
+
+    Parameters:
+    path (str): The dataset directory (without the legacy .gzip suffix).
+    columns (list of str): Columns to read, all of them when None.
+    filters (list of tuple): pyarrow filters, e.g. [('county', 'in', ['LANE'])].
+
+    Returns:
+    pd.DataFrame: The rows matching filters, in their written dtypes (columns in the order asked for, else as written).
+    """
+    table = _read_table(path, columns, filters)
+    # string columns come back Arrow backed, as they were written
+    with pd.option_context('mode.string_storage', 'pyarrow'):
+        df = table.to_pandas()
+        metadata = table.schema.pandas_metadata or {}
+        written = [column for column in metadata.get('columns', []) if column['name'] in df.columns]
+        # partition columns come back last and as categoricals, put them back as written
+        for column in written:
+            if column['pandas_type'] != 'categorical' and isinstance(df[column['name']].dtype, pd.CategoricalDtype):
+                df[column['name']] = df[column['name']].astype(column['numpy_type'])
+    order = columns or [column['name'] for column in written]
+    return df[order + [name for name in df.columns if name not in order]]
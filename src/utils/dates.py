@@ -0,0 +1,90 @@
+"""
+Vectorized date handling for the extracts.
+
+Dates arrive as mm-dd-yyyy, mm/dd/yyyy, yyyy-mm-dd, bare birth years or
+masked years ('19XX'). parse_dates detects the format of each value with
+precompiled patterns and parses every format group with one to_datetime
+call; normalize_birthdates turns any mix of those (plus the confidential
+sentinel) into 'YYYY-MM-DD' strings and integer birth years in one pass.
+"""
+import re
+import numpy as np
+import pandas as pd
+
+# birth year used for confidential voters and unusable birthdates
+SENTINEL_YEAR = 1850
+
+MDY_DASH = (re.compile(r'\d{1,2}-\d{1,2}-\d{4}'), '%m-%d-%Y')
+MDY_SLASH = (re.compile(r'\d{1,2}/\d{1,2}/\d{4}'), '%m/%d/%Y')
+ISO_DATE = (re.compile(r'\d{4}-\d{1,2}-\d{1,2}'), '%Y-%m-%d')
+ISO_TIMESTAMP = (re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}'), '%Y-%m-%d %H:%M:%S')
+DATE_FORMATS = [MDY_DASH, MDY_SLASH, ISO_DATE, ISO_TIMESTAMP]
+YEAR_PATTERN = re.compile(r'\d{4}')
+
+def _text(values):
+    return values.astype(object).astype('string').str.strip()
+
+def parse_dates(values, formats=DATE_FORMATS):
+    """
+    Parse date strings of mixed formats.
+
+    Parameters:
+    values (pd.Series): Date strings (or datetimes, returned as they are).
+    formats (list of tuple): (compiled pattern, strptime format) pairs to try.
+
+    Returns:
+    pd.Series: datetime64 values, NaT where no format matched or the date is invalid.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    text = _text(values)
+    dates = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for pattern, date_format in formats:
+        mask = text.str.fullmatch(pattern).fillna(False).to_numpy(dtype=bool)
+        if mask.any():
+            dates[mask] = pd.to_datetime(text[mask], format=date_format, errors='coerce')
+    return dates
+
+def format_dates(dates):
+    """
+    Format datetimes as 'YYYY-MM-DD' strings (NaN where missing).
+    """
+    return dates.dt.strftime('%Y-%m-%d')
+
+def normalize_birthdates(birthdates, confidential=None):
+    """
+    Derive birthdates and birth years from full dates or bare years.
+
+    Blank, masked ('19XX'), unparseable and pre-1850 values, and the voters
+    marked 'confidential', get the sentinel year. Bare years become Jan 1.
+
+    Parameters:
+    birthdates (pd.Series): Birthdates as any of the DATE_FORMATS, years or integers.
+    confidential (pd.Series): The confidential column, when known.
+
+    Returns:
+    tuple: (pd.Series of 'YYYY-MM-DD' strings, np.ndarray of int birth years)
+    """
+    text = _text(birthdates)
+    dates = parse_dates(text)
+    is_year = text.str.fullmatch(YEAR_PATTERN).fillna(False).to_numpy(dtype=bool)
+
+    years = dates.dt.year.to_numpy(dtype=float, na_value=np.nan)
+    years[is_year] = pd.to_numeric(text[is_year]).to_numpy(dtype=float)
+    if confidential is not None:
+        years[confidential.eq('confidential').fillna(False).to_numpy(dtype=bool)] = np.nan
+    sentinel = np.isnan(years) | (years < SENTINEL_YEAR)
+    years = np.where(sentinel, SENTINEL_YEAR, years).astype(int)
+
+    # full dates keep their month and day, everything else is Jan 1 of the year
+    full_date = dates.notna().to_numpy() & ~sentinel
+    formatted = pd.Series(years.astype(str), index=birthdates.index, dtype=object) + '-01-01'
+    formatted[full_date] = format_dates(dates[full_date])
+    return formatted, years
+
+def ages(birth_years, today=None):
+    """
+    Age in years as the difference between the current year and the birth year.
+    """
+    today = today or pd.Timestamp.now()
+    return today.year - birth_years
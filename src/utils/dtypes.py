@@ -0,0 +1,82 @@
+"""
+Dtype policy for the pipeline frames, derived from the data contracts.
+
+Low cardinality columns listed by a contract are categoricals (with fixed
+categories where the pipeline defines the values), other string columns are
+Arrow backed strings and numeric columns follow their SQL type. Frames keep
+these dtypes from extract through write_dataset; to_boundary turns them back
+into plain objects where the database and Elasticsearch loaders need them.
+"""
+import pandas as pd
+import sqlalchemy
+
+STRING_DTYPE = pd.StringDtype("pyarrow")
+
+def dtype_policy(dtype_mapping, category_columns):
+    """
+    Build the pandas dtype of every contract column.
+
+    Parameters:
+    dtype_mapping (dict): column -> sqlalchemy type, from a data contract.
+    category_columns (dict): column -> fixed categories (or None to take them from the data).
+
+    Returns:
+    dict: column -> pandas dtype.
+    """
+    policy = {}
+    for column, sql_type in dtype_mapping.items():
+        if column in category_columns:
+            categories = category_columns[column]
+            policy[column] = 'category' if categories is None else pd.CategoricalDtype(categories)
+        elif isinstance(sql_type, sqlalchemy.types.Float):
+            policy[column] = 'float64'
+        elif isinstance(sql_type, sqlalchemy.types.Integer):
+            policy[column] = 'Int64'
+        else:
+            policy[column] = STRING_DTYPE
+    return policy
+
+def apply_dtypes(df, policy):
+    """
+    Cast the columns of df that the policy covers.
+
+    Values missing from fixed categories are added to them rather than lost,
+    and numeric columns are parsed leniently (unparseable values become NA).
+
+    Returns:
+    pd.DataFrame: The cast frame.
+    """
+    dtypes = {}
+    for column, dtype in policy.items():
+        if column not in df.columns:
+            continue
+        if dtype in ('float64', 'Int64'):
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+        if isinstance(dtype, pd.CategoricalDtype):
+            extra = set(df[column].dropna().unique()) - set(dtype.categories)
+            if extra:
+                dtype = pd.CategoricalDtype(list(dtype.categories) + sorted(str(value) for value in extra))
+        dtypes[column] = dtype
+    return df.astype(dtypes)
+
+def fill_missing(df, value=''):
+    """
+    df.fillna(value) that also works on categorical and nullable integer columns.
+    """
+    has_missing = df.isna().any()
+    for column, dtype in df.dtypes.items():
+        # a categorical rejects a fill value outside its categories even without missing values
+        if isinstance(dtype, pd.CategoricalDtype):
+            if value not in dtype.categories:
+                df[column] = df[column].cat.add_categories([value])
+        elif has_missing[column] and pd.api.types.is_extension_array_dtype(dtype) and not pd.api.types.is_string_dtype(dtype):
+            df[column] = df[column].astype(object)
+    return df.fillna(value)
+
+def to_boundary(df):
+    """
+    Turn categorical and Arrow string columns back into object columns, for
+    Database.bulk_load and the Elasticsearch/JSON writers.
+    """
+    columns = [column for column, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype) or isinstance(dtype, pd.StringDtype)]
+    return df.astype({column: object for column in columns})
@@ -1,4 +1,9 @@
+import os
+import glob
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
 
 def validate_dataframe(df, data_contract):
     print("Validating...", end=" ")
@@ -16,3 +21,129 @@ def validate_dataframe(df, data_contract):
 
     print("Done")
     return vdf.reset_index(drop=True)
+
+def sniff_delimiter(path, encoding='utf8'):
+    """
+    Tell a tab delimited extract from a comma delimited one by its header line.
+    """
+    with open(path, encoding=encoding, errors='replace') as extract_file:
+        header = extract_file.readline()
+    return '\t' if '\t' in header else ','
+
+def file_headers(path, delimiter, encoding='utf8'):
+    with open(path, encoding=encoding, errors='replace') as extract_file:
+        return [header.strip().strip('"') for header in extract_file.readline().rstrip('\r\n').split(delimiter)]
+
+def contract_headers(path, data_contract, delimiter, encoding='utf8'):
+    """
+    Pick, for every contract column, the first of its possible headers present in the file.
+
+    Returns:
+    dict: file header -> contract column.
+    """
+    headers = file_headers(path, delimiter, encoding)
+
+    selected = {}
+    for key, possible_headers in data_contract.items():
+        matching_headers = [header for header in possible_headers if header in headers]
+        if not matching_headers:
+            raise ValueError(f"Broken Contract! Missing columns for {key}: {possible_headers} / {os.path.basename(path)}")
+        selected[matching_headers[0]] = key
+    return selected
+
+def read_contract_file(path, data_contract, encoding='utf8'):
+    """
+    Read one extract with Arrow's multi-threaded CSV reader, parsing only the
+    contract's columns, all as strings, trimmed (empty and whitespace only
+    fields are null).
+
+    Returns:
+    pa.Table: One column per contract key, in contract order.
+    """
+    delimiter = sniff_delimiter(path, encoding)
+    selected = contract_headers(path, data_contract, delimiter, encoding)
+    table = pv.read_csv(path, **_csv_options(selected, delimiter, encoding))
+    return _contract_table(table, selected)
+
+def _csv_options(headers, delimiter, encoding):
+    return dict(
+        read_options=pv.ReadOptions(encoding=encoding, use_threads=True),
+        parse_options=pv.ParseOptions(delimiter=delimiter),
+        convert_options=pv.ConvertOptions(
+            include_columns=list(headers),
+            column_types={header: pa.string() for header in headers},
+            strings_can_be_null=True,
+            null_values=[''],
+        ),
+    )
+
+def _trim(column):
+    # trim first, then null the empty fields, so whitespace only fields are null too
+    trimmed = pc.utf8_trim_whitespace(column)
+    return pc.if_else(pc.equal(trimmed, ''), pa.scalar(None, pa.string()), trimmed)
+
+def _contract_table(table, selected):
+    columns = [_trim(table.column(header)) for header in selected]
+    return pa.table(columns, names=list(selected.values()))
+
+def _to_frame(table):
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+
+def sample_csv_file(path, sampler, data_contract=None, encoding='utf8'):
+    """
+    Stream one extract through a BottomKSampler (utils/sampling.py) a record
+    batch at a time, parsed like read_contract_file (every column when there
+    is no data_contract).
+    """
+    delimiter = sniff_delimiter(path, encoding)
+    if data_contract is None:
+        selected = {header: header for header in file_headers(path, delimiter, encoding)}
+    else:
+        selected = contract_headers(path, data_contract, delimiter, encoding)
+    with pv.open_csv(path, **_csv_options(selected, delimiter, encoding)) as reader:
+        for batch in reader:
+            sampler.add(_to_frame(_contract_table(pa.Table.from_batches([batch]), selected)))
+
+def extract_paths(directory):
+    paths = sorted(path for path in glob.glob(os.path.join(directory, '*')) if os.path.isfile(path) and not os.path.basename(path).startswith('.'))
+    if not paths:
+        raise FileNotFoundError(f"No extracts in {directory}")
+    return paths
+
+def sample_csv_files(directory, sampler, data_contract=None, encoding='utf8'):
+    """
+    Read the sample of every extract in a directory (see sample_csv_file).
+
+    Returns:
+    pd.DataFrame: The sampled rows, Arrow backed string columns.
+    """
+    for path in extract_paths(directory):
+        print(f"...sampling {os.path.basename(path)}")
+        sample_csv_file(path, sampler, data_contract, encoding)
+    return sampler.frame()
+
+def read_contract_files(directory, data_contract, encoding='utf8', sampler=None):
+    """
+    Read every extract in a directory into one frame holding only the contract's
+    columns, replacing read_extract_multiple + validate_dataframe.
+
+    Parameters:
+    directory (str): Directory with the extracts (tab or comma delimited).
+    data_contract (dict): contract column -> possible headers.
+    encoding (str): Encoding of the extracts.
+    sampler (BottomKSampler): Keep only the sample voters, picked batch by batch while reading.
+
+    Returns:
+    pd.DataFrame: Arrow backed string columns named after the contract keys.
+    """
+    if sampler is not None:
+        return sample_csv_files(directory, sampler, data_contract, encoding)
+    paths = extract_paths(directory)
+
+    tables = []
+    for path in paths:
+        print(f"...reading {os.path.basename(path)}")
+        tables.append(read_contract_file(path, data_contract, encoding))
+    table = pa.concat_tables(tables)
+    print(f"...read {table.num_rows} records from {len(paths)} files")
+    return _to_frame(table)
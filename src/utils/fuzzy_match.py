@@ -0,0 +1,134 @@
+"""
+Fuzzy fallback for the addresses still Not Found after the search passes.
+
+Candidates come from the local places snapshot (see places_snapshot.py), so
+the fallback sends nothing to Elasticsearch. Voters and places are blocked on
+ZIP + house number + the first letters of the street name, which keeps every
+block to a handful of candidates. The candidate pairs of a chunk of voters
+are scored in one vectorized rapidfuzz call and the best place is accepted
+when it scores above the threshold and no other property ties with it.
+Only the snapshot rows in the residual's ZIP codes and blocks are loaded and
+voters are paired in chunks, so memory stays bounded by the residual.
+"""
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from utils.config import FUZZY_MATCH_THRESHOLD, FUZZY_MATCH_PREFIX, FUZZY_MATCH_CHUNK_SIZE
+from utils.places_snapshot import SNAPSHOT_FIELDS, snapshot_path
+
+FUZZY_MATCH_RESULT = 'Fuzzy Match'
+
+def normalize_text(text):
+    return text.astype(str).str.upper().str.replace(r'\s+', ' ', regex=True).str.strip()
+
+def block_keys(zip_codes, house_numbers, street_names, prefix=FUZZY_MATCH_PREFIX):
+    """
+    Build the blocking key: 5 digit ZIP, house number and street name prefix.
+    """
+    return (zip_codes.astype(str).str.strip().str[:5] + '|'
+            + normalize_text(house_numbers) + '|'
+            + normalize_text(street_names).str[:prefix])
+
+def load_candidates(index_name, zip_codes, blocks, prefix=FUZZY_MATCH_PREFIX):
+    """
+    Read the snapshot rows that share a block with the residual.
+
+    Returns:
+    pd.DataFrame: The places with their 'block' and normalized 'text', or None without a snapshot.
+    """
+    path = snapshot_path(index_name)
+    if not os.path.exists(path):
+        return None
+    table = pq.read_table(path, columns=SNAPSHOT_FIELDS, filters=[("PropertyAddressZIP", "in", sorted(zip_codes))])
+    places = table.to_pandas().fillna('')
+    places['block'] = block_keys(places['PropertyAddressZIP'], places['PropertyAddressHouseNumber'], places['PropertyAddressStreetName'], prefix)
+    places = places[places['block'].isin(blocks)].reset_index(drop=True)
+    places['text'] = normalize_text(places['PropertyAddressFull'])
+    return places
+
+def best_matches(queries, places, threshold, chunk_size):
+    """
+    Pick the place of each query that scores best and above threshold,
+    skipping queries whose best score is shared by different properties.
+
+    Parameters:
+    queries (pd.DataFrame): Distinct 'block' and 'text' of the voters.
+    places (pd.DataFrame): Candidates from load_candidates.
+
+    Returns:
+    pd.DataFrame: 'query' (row of queries) and 'place' (row of places) of the accepted matches.
+    """
+    from rapidfuzz import fuzz
+    from rapidfuzz.process import cpdist
+    candidates = places[['block', 'text', '[ATTOM ID]']].rename(columns={'text': 'place_text'})
+    candidates['place'] = np.arange(len(places))
+    matches = []
+    for start in range(0, len(queries), chunk_size):
+        chunk = queries.iloc[start:start + chunk_size]
+        pairs = chunk.assign(query=np.arange(start, start + len(chunk))).merge(candidates, on='block')
+        if len(pairs) == 0:
+            continue
+        pairs['score'] = cpdist(pairs['text'].tolist(), pairs['place_text'].tolist(), scorer=fuzz.token_sort_ratio, workers=-1)
+        pairs = pairs[pairs['score'] >= threshold]
+        top = pairs[pairs['score'] == pairs.groupby('query')['score'].transform('max')]
+        top = top.drop_duplicates(['query', '[ATTOM ID]'])
+        unique = top['query'].map(top['query'].value_counts()) == 1
+        matches.append(top.loc[unique, ['query', 'place']])
+    if not matches:
+        return pd.DataFrame(columns=['query', 'place'])
+    return pd.concat(matches, ignore_index=True)
+
+def fuzzy_match_addresses(residual, columns_to_update, index_name='places', threshold=FUZZY_MATCH_THRESHOLD, prefix=FUZZY_MATCH_PREFIX, chunk_size=FUZZY_MATCH_CHUNK_SIZE):
+    """
+    Match unresolved voters against the places snapshot.
+
+    Parameters:
+    residual (pd.DataFrame): The voters still Not Found.
+    columns_to_update (list of str): The address pass result columns.
+    index_name (str): The snapshot to match against.
+    threshold (float): Lowest accepted token sort ratio (0-100).
+    prefix (int): Street name letters in the blocking key.
+    chunk_size (int): Distinct voter addresses paired per scoring call.
+
+    Returns:
+    pd.DataFrame: The result columns of the matched voters, indexed like residual.
+    """
+    matched = pd.DataFrame(columns=columns_to_update)
+    if len(residual) == 0:
+        return matched
+
+    voters = pd.DataFrame({
+        'block': block_keys(residual['physical_zip_code'], residual['physical_house_number'], residual['physical_street_name'], prefix),
+        'text': normalize_text(residual['physical_address_1'] + ' ' + residual['physical_address_2']),
+    }, index=residual.index)
+    queries = voters.drop_duplicates().reset_index(drop=True)
+
+    zip_codes = set(residual['physical_zip_code'].astype(str).str.strip().str[:5])
+    places = load_candidates(index_name, zip_codes, set(queries['block']), prefix)
+    if places is None:
+        print(f"...no {index_name} snapshot at {snapshot_path(index_name)}, skipping the fuzzy match")
+        return matched
+    print(f"...fuzzy matching {len(queries)} distinct addresses against {len(places)} candidates")
+
+    accepted = best_matches(queries, places, threshold, chunk_size)
+    if len(accepted) == 0:
+        return matched
+
+    query_place = pd.Series(accepted['place'].to_numpy(), index=accepted['query'].to_numpy())
+    query_ids = pd.Series(pd.MultiIndex.from_frame(queries).get_indexer(pd.MultiIndex.from_frame(voters)), index=voters.index)
+    place_rows = query_ids.map(query_place).dropna().astype(int)
+
+    hits = places.iloc[place_rows.to_numpy()]
+    matched = pd.DataFrame(index=place_rows.index, columns=columns_to_update)
+    for column in columns_to_update:
+        if column == 'results':
+            matched[column] = FUZZY_MATCH_RESULT
+        elif column == 'physical_id':
+            matched[column] = hits['_id'].to_numpy()
+        elif column in ('PropertyLatitude', 'PropertyLongitude'):
+            matched[column] = pd.to_numeric(hits[column], errors='coerce').to_numpy()
+        else:
+            matched[column] = hits[column].to_numpy()
+    return matched
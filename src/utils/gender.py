@@ -0,0 +1,101 @@
+"""
+Gender inference from first and middle names.
+
+Names are factorized so gender_guesser is asked once per distinct name and
+the answers are mapped back to the voters by code. The name -> answer table
+is kept in WORKING_DATA_PATH between runs; the gender_guesser Detector
+(whose dataset parse takes seconds) is only built when a run meets names the
+table does not know yet.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+from utils.config import GENDER_TABLE_PATH
+
+# how gender_guesser answers are reported
+GENDER_LABELS = {
+    'male': 'male',
+    'female': 'female',
+    'mostly_male': 'male',
+    'mostly_female': 'female',
+    'andy': 'unknown',
+    'unknown': 'unknown',
+}
+
+class GenderResolver:
+    def __init__(self, table_path=GENDER_TABLE_PATH):
+        """
+        Parameters:
+        table_path (str): Parquet file holding the name -> gender_guesser answer table.
+        """
+        self.table_path = table_path
+        self.detector = None
+        self.changed = False
+        if os.path.exists(table_path):
+            table = pd.read_parquet(table_path)
+            self.table = dict(zip(table['name'], table['gender']))
+        else:
+            self.table = {}
+
+    def get_detector(self):
+        if self.detector is None:
+            import gender_guesser.detector as gender
+            print("...loading gender_guesser names")
+            self.detector = gender.Detector(case_sensitive=False)
+        return self.detector
+
+    def guess(self, names):
+        """
+        Return the gender_guesser answer for every name, asking once per distinct name.
+
+        Parameters:
+        names (pd.Series): Names, any case.
+
+        Returns:
+        np.ndarray: The answer per name ('male', 'mostly_female', 'andy', 'unknown', ...).
+        """
+        codes, uniques = pd.factorize(names.astype(object).fillna('').astype(str).str.strip().str.lower())
+        unknown = [name for name in uniques if name not in self.table]
+        if unknown:
+            detector = self.get_detector()
+            for name in unknown:
+                self.table[name] = detector.get_gender(name, country='usa')
+            self.changed = True
+        answers = np.array([self.table[name] for name in uniques], dtype=object)
+        return answers[codes]
+
+    def resolve(self, first_names, middle_names):
+        """
+        Infer male/female/unknown from the first name, falling back on the
+        middle name when the first name is unknown or androgynous.
+
+        Returns:
+        pd.Series: The gender per voter, indexed like first_names.
+        """
+        answers = self.guess(first_names)
+        fallback = np.isin(answers, ['unknown', 'andy'])
+        if fallback.any():
+            answers[fallback] = self.guess(middle_names[fallback])
+        return pd.Series(answers, index=first_names.index).map(GENDER_LABELS).fillna('unknown')
+
+    def save(self):
+        """
+        Persist the table when this run added names to it.
+        """
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.table_path), exist_ok=True)
+        table = pd.DataFrame({'name': list(self.table.keys()), 'gender': list(self.table.values())})
+        table.to_parquet(f"{self.table_path}.tmp", compression='zstd')
+        os.replace(f"{self.table_path}.tmp", self.table_path)
+        self.changed = False
+
+def assign_gender(df):
+    """
+    Set the gender column from name_first/name_middle and update the persisted table.
+    """
+    resolver = GenderResolver()
+    df['gender'] = resolver.resolve(df['name_first'], df['name_middle'])
+    resolver.save()
+    return df
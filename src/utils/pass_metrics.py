@@ -0,0 +1,186 @@
+"""
+Per-pass metrics for the address passes.
+
+msearch_queries records one SearchMetrics per call (queries sent, hits,
+misses, ambiguous multi-hit answers, Elasticsearch `took` against the wall
+time of the requests and the slowest queries) and the run loop records the
+wall time of every pass. The RunReport collects both and is written as JSON
+next to the working files, so each file date shows which passes are worth
+their cost.
+"""
+import os
+import json
+import heapq
+from datetime import datetime
+
+# slowest queries kept per search and per pass
+SLOWEST_QUERIES = 10
+
+class SearchMetrics:
+    def __init__(self, pass_name, index_name, rows, distinct):
+        """
+        Parameters:
+        pass_name (str): The address pass, e.g. '02'.
+        index_name (str): The index searched.
+        rows (int): Rows the pass asked to resolve.
+        distinct (int): Distinct queries among those rows.
+        """
+        self.pass_name = pass_name
+        self.index_name = index_name
+        self.rows = rows
+        self.distinct = distinct
+        self.cache_hits = 0
+        self.queries = 0
+        self.requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.multi_hits = 0
+        self.took_ms = 0
+        self.request_seconds = 0.0
+        self.seconds = 0.0
+        self.rows_resolved = 0
+        self.slowest = []
+        # normalized key of each query sent, set by msearch_queries
+        self.query_keys = []
+
+    def record_request(self, offset, responses, seconds):
+        """
+        Count one _msearch request.
+
+        Parameters:
+        offset (int): Position of the request's first query in query_keys.
+        responses (list of dict): The search responses, in query order.
+        seconds (float): Wall time of the request.
+        """
+        self.requests += 1
+        self.queries += len(responses)
+        self.request_seconds += seconds
+        for query_key, response in zip(self.query_keys[offset:offset + len(responses)], responses):
+            hits_count = len(response['hits']['hits'])
+            if hits_count == 1:
+                self.hits += 1
+            elif hits_count == 0:
+                self.misses += 1
+            else:
+                self.multi_hits += 1
+            took = response.get('took', 0)
+            self.took_ms += took
+            if len(self.slowest) < SLOWEST_QUERIES:
+                heapq.heappush(self.slowest, (took, query_key))
+            elif took > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (took, query_key))
+
+    def to_dict(self):
+        return {
+            "index": self.index_name,
+            "rows": self.rows,
+            "distinct_queries": self.distinct,
+            "cache_hits": self.cache_hits,
+            "queries": self.queries,
+            "requests": self.requests,
+            "hits": self.hits,
+            "misses": self.misses,
+            "multi_hits": self.multi_hits,
+            "rows_resolved": self.rows_resolved,
+            "took_ms": self.took_ms,
+            "request_seconds": round(self.request_seconds, 3),
+            "seconds": round(self.seconds, 3),
+            "slowest_queries": [{"query": query_key, "took_ms": took} for took, query_key in sorted(self.slowest, reverse=True)],
+        }
+
+    def summary(self):
+        return (f"...{self.index_name} queries {self.queries} hits {self.hits} misses {self.misses} "
+                f"multi-hit {self.multi_hits} cache {self.cache_hits}, resolved {self.rows_resolved} of {self.rows} rows "
+                f"(took {self.took_ms / 1000:.1f}s, requests {self.request_seconds:.1f}s, {self.seconds:.1f}s)")
+
+class RunReport:
+    def __init__(self):
+        self.started = datetime.now()
+        self.passes = {}
+        self.results = {}
+
+    def _entry(self, pass_name):
+        return self.passes.setdefault(pass_name, {"seconds": 0.0, "rows": 0, "searches": []})
+
+    def add_search(self, metrics):
+        self._entry(metrics.pass_name)["searches"].append(metrics)
+
+    def record_pass(self, pass_name, seconds, rows):
+        """
+        Record the wall time of a pass and the rows it ran on.
+        """
+        entry = self._entry(pass_name)
+        entry["seconds"] += seconds
+        entry["rows"] = rows
+
+    def record_results(self, counts):
+        """
+        Record the final distribution of the results column.
+        """
+        self.results = {str(label): int(count) for label, count in counts.items()}
+
+    def pass_summary(self, pass_name):
+        entry = self._entry(pass_name)
+        resolved = sum(metrics.rows_resolved for metrics in entry["searches"])
+        rate = resolved / entry["seconds"] if entry["seconds"] else 0
+        return f"...pass {pass_name} resolved {resolved} rows in {entry['seconds']:.1f}s ({rate:.0f} rows/sec)"
+
+    def to_dict(self):
+        passes = {}
+        for pass_name, entry in sorted(self.passes.items()):
+            searches = entry["searches"]
+            resolved = sum(metrics.rows_resolved for metrics in searches)
+            slowest = heapq.nlargest(SLOWEST_QUERIES, ((took, query_key, metrics.index_name) for metrics in searches for took, query_key in metrics.slowest))
+            passes[pass_name] = {
+                "seconds": round(entry["seconds"], 3),
+                "rows": entry["rows"],
+                "queries": sum(metrics.queries for metrics in searches),
+                "hits": sum(metrics.hits for metrics in searches),
+                "misses": sum(metrics.misses for metrics in searches),
+                "multi_hits": sum(metrics.multi_hits for metrics in searches),
+                "cache_hits": sum(metrics.cache_hits for metrics in searches),
+                "took_ms": sum(metrics.took_ms for metrics in searches),
+                "request_seconds": round(sum(metrics.request_seconds for metrics in searches), 3),
+                "rows_resolved": resolved,
+                "rows_resolved_per_sec": round(resolved / entry["seconds"], 1) if entry["seconds"] else None,
+                "slowest_queries": [{"index": index_name, "query": query_key, "took_ms": took} for took, query_key, index_name in slowest],
+                "searches": [metrics.to_dict() for metrics in searches],
+            }
+        return {
+            "started": self.started.isoformat(timespec='seconds'),
+            "finished": datetime.now().isoformat(timespec='seconds'),
+            "passes": passes,
+            "results": self.results,
+        }
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'w') as report_file:
+            json.dump(self.to_dict(), report_file, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+_run_report = None
+
+def get_run_report():
+    """
+    Return the process wide RunReport, creating it on first use.
+    """
+    global _run_report
+    if _run_report is None:
+        _run_report = RunReport()
+    return _run_report
+
+def close_run_report(path=None):
+    """
+    Write the process wide RunReport to path (when given) and start a new one.
+
+    Returns:
+    dict: The report that was closed.
+    """
+    global _run_report
+    report = get_run_report()
+    _run_report = None
+    if path is not None:
+        report.write(path)
+        print(f"...run report written to {path}")
+    return report.to_dict()
@@ -0,0 +1,118 @@
+"""
+In-process pipeline runner.
+
+A pipeline is a list of stages run one after the other for a file date, the
+frame returned by a stage being handed to the next one in memory. A stage is
+a (name, function, persist) tuple: function(df, file_date) returns the
+stage's frame (df is None for the first stage) and persist(df, file_date),
+when given, writes the frame as the stage's dataset (see utils/datasets.py)
+if the run asks for its intermediate files. The runner times every stage and
+summarizes the run.
+"""
+import os
+import re
+import time
+import logging
+from datetime import datetime
+
+from common_functions.common import get_traceback
+
+FOLDER_PATTERN = re.compile(r'\d{4}_\d{2}_\d{2}') # raw folders are named yyyy_mm_dd
+
+def get_file_dates(directory, until=None):
+    """
+    List the file dates with a raw folder in directory.
+
+    Parameters:
+    directory (str): The raw data directory.
+    until (datetime): Latest file date to include, all of them when None.
+
+    Returns:
+    list of datetime: The file dates, oldest first.
+    """
+    file_dates = []
+    for item in os.listdir(directory):
+        if os.path.isdir(os.path.join(directory, item)) and FOLDER_PATTERN.fullmatch(item):
+            file_date = datetime.strptime(item, '%Y_%m_%d')
+            if until is None or file_date <= until:
+                file_dates.append(file_date)
+    return sorted(file_dates)
+
+def setup_logging(filename='voter_data_extraction.log'):
+    logging.basicConfig(filename=filename, level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+def select_stages(stages, names):
+    """
+    Keep the stages named in names (all of them when names is empty).
+    """
+    if not names:
+        return stages
+    unknown = set(names) - {name for name, _, _ in stages}
+    if unknown:
+        raise ValueError(f"Unknown stages {sorted(unknown)}, expected some of {[name for name, _, _ in stages]}")
+    return [stage for stage in stages if stage[0] in names]
+
+def run_pipeline(stages, file_date, persist=False):
+    """
+    Run the stages for one file date.
+
+    Parameters:
+    stages (list of tuple): (name, function, persist) of every stage, in order.
+    file_date (datetime): The file date to process.
+    persist (bool): Write the frame of every stage that has a persist function.
+
+    Returns:
+    tuple: (the frame of the last stage, list of (stage, seconds, rows))
+    """
+    df = None
+    timings = []
+    for name, function, persist_function in stages:
+        print(f"=== {file_date.strftime('%Y-%m-%d')} {name} ===")
+        started = time.perf_counter()
+        df = function(df, file_date)
+        if persist and persist_function is not None:
+            df = persist_function(df, file_date)
+        seconds = time.perf_counter() - started
+        timings.append((name, seconds, len(df)))
+        print(f"...{name} took {seconds:.1f}s for {len(df)} records")
+        logging.info(f"{file_date.strftime('%Y-%m-%d')} {name} took {seconds:.1f}s for {len(df)} records")
+    return df, timings
+
+def run_file_dates(stages, file_dates, persist=False):
+    """
+    Run the pipeline for every file date, logging the dates that fail and moving on.
+
+    Returns:
+    dict: file date -> list of (stage, seconds, rows), None for the dates that failed.
+    """
+    runs = {}
+    for file_date in file_dates:
+        logging.info(f"Running {[name for name, _, _ in stages]} for {file_date.strftime('%Y-%m-%d')}")
+        try:
+            _, runs[file_date] = run_pipeline(stages, file_date, persist)
+            logging.info(f"Pipeline succeeded for {file_date.strftime('%Y-%m-%d')}")
+        except Exception as e:
+            runs[file_date] = None
+            print('------Start--------')
+            print(get_traceback(e))
+            print('------End--------')
+            logging.error(f"Pipeline failed for {file_date.strftime('%Y-%m-%d')}: {e}")
+    print(summary(stages, runs))
+    return runs
+
+def summary(stages, runs):
+    """
+    Format the seconds spent per stage and file date as a table.
+    """
+    names = [name for name, _, _ in stages]
+    lines = [f"{'file date':<12}" + ''.join(f"{name:>12}" for name in names) + f"{'total':>12}"]
+    for file_date, timings in runs.items():
+        if timings is None:
+            lines.append(f"{file_date.strftime('%Y-%m-%d'):<12}" + f"{'failed':>12}")
+            continue
+        seconds = {name: stage_seconds for name, stage_seconds, _ in timings}
+        lines.append(f"{file_date.strftime('%Y-%m-%d'):<12}"
+                     + ''.join(f"{seconds[name]:>12.1f}" if name in seconds else f"{'-':>12}" for name in names)
+                     + f"{sum(seconds.values()):>12.1f}")
+    return '\n'.join(lines)
@@ -0,0 +1,202 @@
+"""
+Local copy of the places indices for the address passes.
+
+export_places_snapshot dumps an index to a parquet file. LocalPlaces loads
+those files and answers the same query bodies the passes send to
+Elasticsearch (see MyExtendedElasticsearch.address_query and friends):
+
+- term queries on house number + street name + ZIP are answered from a hash
+  index, like exact_match_address
+- simple_query_string queries are answered from a token index where every
+  query token has to appear in one of the PropertyAddress* fields, which
+  approximates the standard analyzer with default_operator AND
+- a collapse on [ATTOM ID] keeps one hit per property
+
+Responses have the shape of Elasticsearch search responses, so
+process_search_results works on them unchanged.
+"""
+import os
+import re
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.config import PLACES_SNAPSHOT_PATH
+
+ADDRESS_FIELDS = [
+    "PropertyAddressFull",
+    "PropertyAddressHouseNumber",
+    "PropertyAddressStreetDirection",
+    "PropertyAddressStreetName",
+    "PropertyAddressStreetSuffix",
+    "PropertyAddressCity",
+    "PropertyAddressState",
+    "PropertyAddressZIP",
+    "PropertyAddressZIP4",
+    "PropertyAddressCRRT",
+]
+SNAPSHOT_FIELDS = ["_id", "[ATTOM ID]"] + ADDRESS_FIELDS + ["PropertyLatitude", "PropertyLongitude"]
+# Elasticsearch returns 10 hits unless asked otherwise
+DEFAULT_SIZE = 10
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def snapshot_path(index_name):
+    return os.path.join(PLACES_SNAPSHOT_PATH, f"{index_name}.parquet")
+
+def export_places_snapshot(search_client, index_name, batch_size=50000):
+    """
+    Export an index to a parquet snapshot used by LocalPlaces.
+
+    Parameters:
+    search_client (MyExtendedElasticsearch): Connected search client.
+    index_name (str): The index to export, e.g. 'places'.
+    batch_size (int): Documents written per row group.
+
+    Returns:
+    str: Path of the snapshot file.
+    """
+    from elasticsearch.helpers import scan
+    path = snapshot_path(index_name)
+    os.makedirs(PLACES_SNAPSHOT_PATH, exist_ok=True)
+    client = search_client.retrying_client()
+    generation = search_client.index_generation(index_name)
+    schema = pa.schema([(field, pa.string()) for field in SNAPSHOT_FIELDS], metadata={"index_generation": generation})
+
+    print(f"Exporting {index_name} to {path}")
+    count = 0
+    temp_path = f"{path}.tmp"
+    with pq.ParquetWriter(temp_path, schema, compression='zstd') as writer:
+        batch = {field: [] for field in SNAPSHOT_FIELDS}
+        query = {"query": {"match_all": {}}, "_source": SNAPSHOT_FIELDS[1:]}
+        for hit in scan(client, index=index_name, query=query, size=5000):
+            batch["_id"].append(hit["_id"])
+            for field in SNAPSHOT_FIELDS[1:]:
+                value = hit["_source"].get(field)
+                batch[field].append(None if value is None else str(value))
+            if len(batch["_id"]) >= batch_size:
+                count += len(batch["_id"])
+                writer.write_table(pa.table(batch, schema=schema))
+                batch = {field: [] for field in SNAPSHOT_FIELDS}
+        if batch["_id"]:
+            count += len(batch["_id"])
+            writer.write_table(pa.table(batch, schema=schema))
+    os.replace(temp_path, path)
+
+    print(f"...exported {count} documents")
+    return path
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+class LocalPlacesIndex:
+    def __init__(self, path):
+        """
+        Load a snapshot and build its exact and token indices.
+
+        Parameters:
+        path (str): Path of a snapshot written by export_places_snapshot.
+        """
+        table = pq.read_table(path)
+        self.generation = (table.schema.metadata or {}).get(b"index_generation", b"").decode()
+        self.places = table.to_pandas()
+        self.exact = self._build_exact_index()
+        self.tokens = self._build_token_index()
+
+    def _build_exact_index(self):
+        keys = self.places[["PropertyAddressHouseNumber", "PropertyAddressStreetName", "PropertyAddressZIP"]].fillna('')
+        return pd.Series(np.arange(len(keys))).groupby([keys[column].to_numpy() for column in keys.columns]).indices
+
+    def _build_token_index(self):
+        fields = self.places[ADDRESS_FIELDS].fillna('')
+        text = fields[ADDRESS_FIELDS[0]]
+        for field in ADDRESS_FIELDS[1:]:
+            text = text + ' ' + fields[field]
+        tokens = text.str.lower().str.findall(TOKEN_PATTERN).explode().dropna()
+        postings = pd.DataFrame({"token": tokens.to_numpy(), "row": tokens.index.to_numpy()}).drop_duplicates()
+        postings = postings.sort_values(["token", "row"])
+        token_values = postings["token"].to_numpy()
+        rows = postings["row"].to_numpy().astype(int)
+        boundaries = np.flatnonzero(token_values[1:] != token_values[:-1]) + 1
+        starts = np.r_[0, boundaries]
+        return {token_values[start]: posting for start, posting in zip(starts, np.split(rows, boundaries))}
+
+    def match_exact(self, house_number, street_name, zip_code):
+        return self.exact.get((str(house_number), str(street_name), str(zip_code)), np.array([], dtype=int))
+
+    def match_tokens(self, text):
+        tokens = set(tokenize(text))
+        if not tokens:
+            return np.array([], dtype=int)
+        postings = sorted((self.tokens.get(token, np.array([], dtype=int)) for token in tokens), key=len)
+        rows = postings[0]
+        for posting in postings[1:]:
+            if len(rows) == 0:
+                break
+            rows = np.intersect1d(rows, posting, assume_unique=True)
+        return rows
+
+    def collapse(self, rows):
+        attom_ids = self.places["[ATTOM ID]"].to_numpy()[rows]
+        _, first = np.unique(attom_ids.astype(str), return_index=True)
+        return rows[np.sort(first)]
+
+    def response(self, rows):
+        hits = []
+        for row in rows[:DEFAULT_SIZE]:
+            place = self.places.iloc[row]
+            hits.append({"_id": place["_id"], "_source": place.drop("_id").to_dict()})
+        return {"took": 0, "hits": {"total": {"value": len(rows), "relation": "eq"}, "hits": hits}}
+
+    def search(self, query):
+        """
+        Answer one of the address query bodies.
+
+        Parameters:
+        query (dict): A body from address_query, unit_address_query or exact_match_query.
+
+        Returns:
+        dict: A search response.
+        """
+        must = query["query"]["bool"]["must"]
+        if "simple_query_string" in must[0]:
+            rows = self.match_tokens(must[0]["simple_query_string"]["query"])
+        else:
+            terms = {field: value for clause in must for field, value in clause["term"].items()}
+            rows = self.match_exact(
+                terms["PropertyAddressHouseNumber.raw"],
+                terms["PropertyAddressStreetName.raw"],
+                terms["PropertyAddressZIP.raw"],
+            )
+        if "collapse" in query:
+            rows = self.collapse(rows)
+        return self.response(rows)
+
+class LocalPlaces:
+    """
+    Stand-in for the search client in the address passes, backed by snapshots.
+    """
+    def __init__(self):
+        self.indices = {}
+
+    def get_index(self, index_name):
+        if index_name not in self.indices:
+            print(f"...loading {index_name} snapshot")
+            self.indices[index_name] = LocalPlacesIndex(snapshot_path(index_name))
+        return self.indices[index_name]
+
+    def index_generation(self, index_name):
+        return self.get_index(index_name).generation
+
+    def msearch(self, index_name, queries):
+        index = self.get_index(index_name)
+        return [index.search(query) for query in queries]
+
+_local_places = None
+
+def get_local_places():
+    global _local_places
+    if _local_places is None:
+        _local_places = LocalPlaces()
+    return _local_places
@@ -0,0 +1,160 @@
+"""
+Adaptive rate control for the address pass searches.
+
+RateController wraps every search request:
+
+- retries rejected (429), unavailable (502/503/504) and timed out requests a
+  bounded number of times, sleeping an exponential backoff with full jitter
+- keeps an AIMD concurrency limit: each fast success adds about one request
+  in flight per window, each rejection or slow request halves it (at most
+  once per cooldown), so the async path settles at the highest concurrency
+  the cluster sustains
+- opens a circuit breaker after too many consecutive failed requests and
+  raises SearchUnavailable instead of hammering a struggling cluster; the
+  run loop then flushes its checkpoints and tells how to resume
+"""
+import time
+import random
+import asyncio
+
+from utils.config import ES_MAX_CONCURRENCY, ES_MIN_CONCURRENCY, ES_LATENCY_TARGET, ES_RETRY_ATTEMPTS, ES_RETRY_BACKOFF, ES_RETRY_BACKOFF_MAX, ES_BREAKER_THRESHOLD
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+class MsearchItemError(RuntimeError):
+    """
+    One search of an _msearch request failed.
+    """
+    def __init__(self, index_name, error, status=None):
+        super().__init__(f"msearch on {index_name} failed: {error}")
+        self.status = status
+
+class SearchUnavailable(RuntimeError):
+    """
+    The circuit breaker opened or a request ran out of retries.
+
+    msearch_queries sets resolved to the rows its finished batches (and the
+    address cache) had resolved, indexed like its params.
+    """
+    resolved = None
+
+def is_retriable(error):
+    # only asked about failures, so the client package is imported here rather than at startup
+    from elasticsearch import ApiError, ConnectionError, ConnectionTimeout
+    if isinstance(error, (ConnectionError, ConnectionTimeout)):
+        return True
+    if isinstance(error, ApiError):
+        return error.status_code in RETRY_STATUSES
+    if isinstance(error, MsearchItemError):
+        return error.status in RETRY_STATUSES
+    return False
+
+class RateController:
+    def __init__(self, max_concurrency=ES_MAX_CONCURRENCY, min_concurrency=ES_MIN_CONCURRENCY, latency_target=ES_LATENCY_TARGET,
+                 attempts=ES_RETRY_ATTEMPTS, backoff=ES_RETRY_BACKOFF, backoff_max=ES_RETRY_BACKOFF_MAX, breaker_threshold=ES_BREAKER_THRESHOLD):
+        """
+        Parameters:
+        max_concurrency (int): Upper bound of the concurrency limit.
+        min_concurrency (int): Lower bound of the concurrency limit.
+        latency_target (float): Seconds above which a request counts as congestion.
+        attempts (int): Tries per request, including the first.
+        backoff (float): Base of the exponential backoff, in seconds.
+        backoff_max (float): Cap of a single backoff, in seconds.
+        breaker_threshold (int): Consecutive failed requests that open the breaker.
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(max(self.min_concurrency, self.max_concurrency // 2))
+        self.latency_target = latency_target
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.consecutive_failures = 0
+        self.last_decrease = 0.0
+        self.retries = 0
+        self.rejections = 0
+
+    @property
+    def allowed(self):
+        """
+        Requests allowed in flight right now.
+        """
+        return int(self.limit)
+
+    def _decrease(self):
+        now = time.monotonic()
+        # one congestion event usually fails several requests in flight: back off once for it
+        if now - self.last_decrease < self.latency_target:
+            return
+        self.last_decrease = now
+        self.limit = max(float(self.min_concurrency), self.limit / 2)
+
+    def on_success(self, seconds):
+        self.consecutive_failures = 0
+        if seconds > self.latency_target:
+            self._decrease()
+        else:
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+    def on_failure(self, error, attempt):
+        """
+        Account for a failed try and return the seconds to wait before the next one.
+
+        Raises:
+        SearchUnavailable: The breaker opened or the request is out of retries.
+        Exception: error itself when it is not retriable.
+        """
+        if not is_retriable(error):
+            raise error
+        self.rejections += 1
+        self.consecutive_failures += 1
+        self._decrease()
+        if self.consecutive_failures >= self.breaker_threshold:
+            raise SearchUnavailable(f"circuit breaker open after {self.consecutive_failures} consecutive failed requests ({error})") from error
+        if attempt + 1 >= self.attempts:
+            raise SearchUnavailable(f"request failed after {self.attempts} attempts ({error})") from error
+        self.retries += 1
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def call(self, request):
+        """
+        Run request() with retries, returning its result.
+        """
+        for attempt in range(self.attempts):
+            started = time.perf_counter()
+            try:
+                result = request()
+            except Exception as error:
+                time.sleep(self.on_failure(error, attempt))
+                continue
+            self.on_success(time.perf_counter() - started)
+            return result
+
+    async def call_async(self, request):
+        """
+        Await request() with retries, returning its result.
+        """
+        for attempt in range(self.attempts):
+            started = time.perf_counter()
+            try:
+                result = await request()
+            except Exception as error:
+                await asyncio.sleep(self.on_failure(error, attempt))
+                continue
+            self.on_success(time.perf_counter() - started)
+            return result
+
+    def summary(self):
+        return f"...rate control limit {self.allowed} retries {self.retries} rejections {self.rejections}"
+
+_rate_controller = None
+
+def get_rate_controller():
+    """
+    Return the process wide RateController, so the limit it learned carries over between passes.
+    """
+    global _rate_controller
+    if _rate_controller is None:
+        _rate_controller = RateController()
+    return _rate_controller
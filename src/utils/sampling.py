@@ -0,0 +1,126 @@
+"""
+Deterministic --sample of voters, taken while the files are read.
+
+A sample of N keeps the N voters whose (seed, state_voter_id) hash is the
+lowest, with every row of theirs (all their elections in the vote history).
+The hash only depends on the seed and the voter id, so the voter file, the
+vote history and the daily voted file sampled with the same seed keep the same
+voters (wherever they rank among the N lowest hashes of each file), and the
+same command always gives the same sample.
+
+The sampler is a bottom-k over record batches: readers hand it one batch at a
+time and it only holds the rows that can still make the N lowest hashes, so a
+sampled run never has the whole file in memory. Readers pass the row checks of
+their cleaning step as row_filter, so the rows cleaning would drop never take
+a place in the sample: N is a count of cleaned voters, the same voters a
+sample of the processed dataset gives.
+"""
+import numpy as np
+import pandas as pd
+
+from utils.datasets import read_dataset
+
+HASH_COLUMN = '_sample_hash'
+
+def hash_key(seed):
+    # pandas hashes with SipHash keyed by a 16 character string
+    return f"{seed:016x}"[-16:]
+
+def key_hashes(df, seed, key='state_voter_id'):
+    """
+    Hash the key of every row, keyed by seed.
+
+    Parameters:
+    df (pd.DataFrame): The rows to hash.
+    seed (int): The sample seed (>= 0).
+    key (str): The column identifying a voter, None to hash whole rows.
+
+    Returns:
+    np.ndarray: uint64 hash per row.
+    """
+    if key is None:
+        return pd.util.hash_pandas_object(df.astype(object).fillna(''), index=False, hash_key=hash_key(seed)).to_numpy()
+    # ids are hashed as trimmed strings, whatever dtype the reader gave them
+    values = df[key].astype(object).fillna('').astype(str).str.strip().to_numpy(dtype=object)
+    return pd.util.hash_array(values, hash_key=hash_key(seed))
+
+class BottomKSampler:
+    """
+    Keep the rows of the sample voters among the batches added.
+
+    Parameters:
+    sample (int): Voters to keep.
+    seed (int): The sample seed.
+    key (str): The column identifying a voter, None to sample whole rows.
+    row_filter (callable): Returns the mask of the rows of a batch cleaning keeps, None to keep them all.
+    """
+    def __init__(self, sample, seed=0, key='state_voter_id', row_filter=None):
+        self.sample = sample
+        self.seed = seed
+        self.key = key
+        self.row_filter = row_filter
+        self.threshold = None
+        self.frames = []
+        self.rows = 0
+        self.seen = 0
+
+    def add(self, df):
+        """
+        Add a batch of rows.
+        """
+        self.seen += len(df)
+        if self.row_filter is not None:
+            df = df[self.row_filter(df)]
+        hashes = key_hashes(df, self.seed, self.key)
+        if self.threshold is not None:
+            keep = hashes <= self.threshold
+            df, hashes = df[keep], hashes[keep]
+        if len(df) == 0:
+            return
+        df = df.copy()
+        df[HASH_COLUMN] = hashes
+        self.frames.append(df)
+        self.rows += len(df)
+        # prune once the candidates are well over the sample, so the memory stays bounded
+        if self.rows > 4 * self.sample:
+            self._prune()
+
+    def _prune(self):
+        if not self.frames:
+            return
+        df = pd.concat(self.frames, ignore_index=True)
+        distinct = np.unique(df[HASH_COLUMN].to_numpy())
+        if len(distinct) > self.sample:
+            self.threshold = distinct[self.sample - 1]
+            df = df[df[HASH_COLUMN] <= self.threshold]
+        self.frames = [df]
+        self.rows = len(df)
+
+    def frame(self):
+        """
+        The sampled rows, in the order they were read.
+        """
+        self._prune()
+        if not self.frames:
+            return pd.DataFrame()
+        df = self.frames[0].drop(columns=[HASH_COLUMN]).reset_index(drop=True)
+        print(f"...sampled {len(df)} of {self.seen} records (seed {self.seed})")
+        return df
+
+def sample_frame(df, sample, seed=0, key='state_voter_id'):
+    """
+    Sample a frame already in memory the same way the readers do.
+    """
+    if len(df) == 0:
+        return df
+    sampler = BottomKSampler(sample, seed, key)
+    sampler.add(df)
+    return sampler.frame()
+
+def read_sampled_dataset(path, sample, seed=0, columns=None, key='state_voter_id'):
+    """
+    Read the sample voters of a dataset (see utils/datasets.py): the key column
+    is read alone to pick them, then only their rows are read.
+    """
+    keys = sample_frame(read_dataset(path, columns=[key]), sample, seed, key)[key]
+    return read_dataset(path, columns, filters=[(key, 'in', keys.astype(object).drop_duplicates().tolist())])
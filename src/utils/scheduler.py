@@ -0,0 +1,207 @@
+"""
+Multi-date backfill scheduler.
+
+A backfill is a DAG of (dataset, file date, stage) tasks. The stages of a
+dataset and file date run in pipeline order, and a stage listed as ordered
+also waits for the same stage of the previous file date (incremental diffs,
+loads that diff against what is already in the database, the view pointing
+at the latest table). Everything else - other dates, other datasets - runs
+in parallel across a process pool, oldest file dates first.
+
+Tasks in different processes hand frames over through the stage's
+persisted dataset (see pipeline.py), so the stages with a persist function
+are always persisted here. A worker process runs many tasks, so module level
+state a stage keeps (e.g. the vote history ORM classes, one per election
+date) must allow the next file date in the same process.
+
+A finished task leaves a done marker recording the run parameters (--sample,
+--seed, the stages, ...). A rerun with the same parameters skips the tasks
+that have one and picks up the failed ones and everything downstream of
+them; a marker left with other parameters counts as not done.
+"""
+import os
+import json
+import time
+import logging
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from common_functions.common import get_traceback
+
+from utils.pipeline import summary
+
+def build_tasks(datasets, file_dates):
+    """
+    Build the task DAG.
+
+    Parameters:
+    datasets (dict): dataset -> (stages, ordered) with stages a pipeline stage
+        list and ordered the names of the stages that depend on the previous file date.
+    file_dates (list of datetime): The file dates to run, oldest first.
+
+    Returns:
+    dict: (dataset, file_date, stage) -> set of the tasks it depends on.
+    """
+    graph = {}
+    for dataset, (stages, ordered) in datasets.items():
+        previous_date = None
+        for file_date in file_dates:
+            previous_stage = None
+            for name, _, _ in stages:
+                dependencies = set()
+                if previous_stage is not None:
+                    dependencies.add((dataset, file_date, previous_stage))
+                if name in ordered and previous_date is not None:
+                    dependencies.add((dataset, previous_date, name))
+                graph[(dataset, file_date, name)] = dependencies
+                previous_stage = name
+            previous_date = file_date
+    return graph
+
+def marker_path(markers_path, task):
+    dataset, file_date, stage = task
+    return os.path.join(markers_path, dataset, f"{file_date.strftime('%Y.%m.%d')}.{stage}.done")
+
+def task_params(datasets, params, dataset):
+    """
+    The parameters a task of dataset runs with: params and the names of the dataset's stages, as stored in JSON.
+    """
+    stages, _ = datasets[dataset]
+    return json.loads(json.dumps(dict(params or {}, stages=[name for name, _, _ in stages])))
+
+def write_marker(markers_path, task, rows, seconds, params):
+    path = marker_path(markers_path, task)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump({"rows": rows, "seconds": round(seconds, 3), "finished": datetime.now().isoformat(timespec='seconds'), "params": params}, f)
+    os.replace(f"{path}.tmp", path)
+
+def read_marker(markers_path, task):
+    """
+    Returns:
+    dict: The done marker of task, None when it has none.
+    """
+    path = marker_path(markers_path, task)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def run_task(function, persist_function, file_date):
+    """
+    Run one stage in a worker process, reading its input from the previous stage's persisted dataset.
+
+    Returns:
+    tuple: (rows, seconds)
+    """
+    started = time.perf_counter()
+    df = function(None, file_date)
+    if persist_function is not None:
+        df = persist_function(df, file_date)
+    return len(df), time.perf_counter() - started
+
+def run_backfill(datasets, file_dates, markers_path, workers, force=False, params=None):
+    """
+    Run every task of the DAG whose dependencies are done, up to workers at a time.
+
+    Parameters:
+    datasets (dict): dataset -> (stages, ordered), see build_tasks.
+    file_dates (list of datetime): The file dates to run, oldest first.
+    markers_path (str): Directory of the done markers.
+    workers (int): Processes in the pool.
+    force (bool): Rerun the tasks that already have a done marker.
+    params (dict): The run parameters the stages read (e.g. sample, seed), kept in the
+        done markers with the stages; a marker with other parameters is rerun.
+
+    Returns:
+    dict: task -> 'done', 'skipped' (marker found), 'failed' or 'blocked' (a dependency failed).
+    """
+    graph = build_tasks(datasets, file_dates)
+    stage_functions = {(dataset, name): (function, persist_function)
+                       for dataset, (stages, _) in datasets.items() for name, function, persist_function in stages}
+    stage_order = {(dataset, stage[0]): position
+                   for dataset, (stages, _) in datasets.items() for position, stage in enumerate(stages)}
+
+    dataset_params = {dataset: task_params(datasets, params, dataset) for dataset in datasets}
+
+    status = {}
+    stale = 0
+    if not force:
+        for task in graph:
+            marker = read_marker(markers_path, task)
+            if marker is None:
+                continue
+            if marker.get("params") == dataset_params[task[0]]:
+                status[task] = 'skipped'
+            else:
+                stale += 1
+    finished = set(status)
+    pending = sorted(set(graph) - finished, key=lambda task: (task[1], stage_order[(task[0], task[2])], task[0]))
+    print(f"Backfill of {len(graph)} tasks: {len(finished)} already done, {len(pending)} to run on {workers} workers"
+          + (f" ({stale} done with other parameters)" if stale else ""))
+
+    timings = {}
+    running = {}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            waiting = []
+            for task in pending:
+                dependencies = graph[task]
+                if any(status.get(dependency) in ('failed', 'blocked') for dependency in dependencies):
+                    status[task] = 'blocked'
+                    logging.error(f"{task[0]} {task[1].strftime('%Y-%m-%d')} {task[2]} blocked by a failed dependency")
+                elif dependencies <= finished and len(running) < workers:
+                    function, persist_function = stage_functions[(task[0], task[2])]
+                    running[executor.submit(run_task, function, persist_function, task[1])] = task
+                else:
+                    waiting.append(task)
+            pending = waiting
+            if not running:
+                break
+
+            completed, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in completed:
+                task = running.pop(future)
+                label = f"{task[0]} {task[1].strftime('%Y-%m-%d')} {task[2]}"
+                try:
+                    rows, seconds = future.result()
+                except Exception as e:
+                    status[task] = 'failed'
+                    print('------Start--------')
+                    print(get_traceback(e))
+                    print('------End--------')
+                    logging.error(f"{label} failed: {e}")
+                    continue
+                status[task] = 'done'
+                finished.add(task)
+                timings[task] = (rows, seconds)
+                write_marker(markers_path, task, rows, seconds, dataset_params[task[0]])
+                print(f"...{label} took {seconds:.1f}s for {rows} records")
+                logging.info(f"{label} took {seconds:.1f}s for {rows} records")
+
+    wall = time.perf_counter() - started
+    print(backfill_summary(datasets, file_dates, status, timings, wall, workers))
+    return status
+
+def backfill_summary(datasets, file_dates, status, timings, wall, workers):
+    """
+    Format the stage timings per dataset and the pool utilization.
+    """
+    lines = []
+    for dataset, (stages, _) in datasets.items():
+        runs = {}
+        for file_date in file_dates:
+            tasks = [(dataset, file_date, name) for name, _, _ in stages]
+            if any(status.get(task) in ('failed', 'blocked') for task in tasks):
+                runs[file_date] = None
+            else:
+                runs[file_date] = [(task[2], timings[task][1], timings[task][0]) for task in tasks if task in timings]
+        lines.append(f"--- {dataset} ---")
+        lines.append(summary(stages, runs))
+    busy = sum(seconds for _, seconds in timings.values())
+    counts = {state: list(status.values()).count(state) for state in ('done', 'skipped', 'failed', 'blocked')}
+    utilization = busy / (wall * workers) if wall > 0 and workers > 0 else 0.0
+    lines.append(f"{counts['done']} done, {counts['skipped']} skipped, {counts['failed']} failed, {counts['blocked']} blocked "
+                 f"in {wall:.1f}s ({busy:.1f}s of work on {workers} workers, {utilization:.0%} utilization)")
+    return '\n'.join(lines)
@@ -1,9 +1,15 @@
-from common_functions.search import MyElasticsearch
-from utils.config import ES_HOST, ES_USERNAME, ES_PASSWORD, CA_CERT_PATH
+import os
+import time
+import atexit
+from utils.config import ES_HOST, ES_USERNAME, ES_PASSWORD, CA_CERT_PATH, ES_MSEARCH_BATCH_SIZE, ES_ASYNC, ADDRESS_BACKEND
+import numpy as np
 import pandas as pd
-from elasticsearch.helpers import streaming_bulk, BulkIndexError
 import tqdm
 import json
+from utils.address_cache import get_address_cache, normalize_query_keys
+from utils.places_snapshot import get_local_places
+from utils.pass_metrics import SearchMetrics, get_run_report
+from utils.rate_control import SearchUnavailable, get_rate_controller
 
 # Example usage:
 es_host = ES_HOST
@@ -11,177 +17,265 @@ es_username = ES_USERNAME
 es_password = ES_PASSWORD
 ca_cert_path = CA_CERT_PATH
 
-class MyExtendedElasticsearch(MyElasticsearch):
-    def __init__(self, host, cert_path, username, password):
-        super().__init__(host, cert_path, username, password)
-
-    def __enter__(self):
-        # Initialize the Elasticsearch client connection here
-        # Assuming self.client is the Elasticsearch client instance
-        self.client = self.create_client()  # Placeholder for actual client creation method
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        # Close the Elasticsearch client connection here
-        # Assuming self.client has a close method
-        if hasattr(self.client, 'close'):
-            self.client.close()
-
-    def create_client(self):
-        # Placeholder method to create and return the Elasticsearch client
-        # This should include authentication and any other setup required
-        return super().create_client()
-    def search_address(self, index_name, address_query):
-        """
-        Search for an address in the Elasticsearch index.
-
-        Args:
-            index_name (str): The name of the Elasticsearch index to search.
-            address_query (str): The address query to search for.
-
-        Returns:
-            dict: The search results as a dictionary.
-        """
-        # Create an Elasticsearch query DSL for address search
-        query = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "simple_query_string": {
-                                "query": address_query,
-
-                                "fields": ["PropertyAddress*"],
-                                "default_operator": "AND",
-                                "analyzer": "standard"
-                            }
-                        }
-                    ]
-                }
-            },
-            "collapse": {
-                "field": "[ATTOM ID].keyword"
-            }
-        }
-        response = self.client.options(basic_auth=(self.username, self.password)).search(index=index_name, body=query)
-        return response
-
-    def search_unit_address(self, index_name, address_query):
-        """
-        Search for an address in the Elasticsearch index.
-
-        Args:
-            index_name (str): The name of the Elasticsearch index to search.
-            address_query (str): The address query to search for.
-
-        Returns:
-            dict: The search results as a dictionary.
-        """
-        # Create an Elasticsearch query DSL for address search
-        query = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "simple_query_string": {
-                                "query": address_query,
-
-                                "fields": ["PropertyAddress*"],
-                                "default_operator": "AND",
-                                "analyzer": "standard"
-                            }
-                        }
-                    ]
-                }
-            }
-        }
-        response = self.client.options(basic_auth=(self.username, self.password)).search(index=index_name, body=query)
-        return response
-
-    def exact_match_address(self, index_name, house_number, street_name, zip_code):
-        """
-        Search for an address in the Elasticsearch index.
-
-        Args:
-            index_name (str): The name of the Elasticsearch index to search.
-            address_query (str): The address query to search for.
-
-        Returns:
-            dict: The search results as a dictionary.
-        """
-        # Create an Elasticsearch query DSL for address search
-        query = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "term": {
-                                "PropertyAddressHouseNumber.raw": house_number
-                            }
-                        },
-                        {
-                            "term": {
-                                "PropertyAddressStreetName.raw": street_name
-                            }
-                        },
-                        {
-                            "term": {
-                                "PropertyAddressZIP.raw": zip_code
-                            }
-                        }
-                    ]
-                }
-            }
-        }
-        response = self.client.options(basic_auth=(self.username, self.password)).search(index=index_name, body=query)
-        return response
-
-    def voter_votehistory(self, index_name, voter_id):
-        """
-        Search for an address in the Elasticsearch index.
-
-        Args:
-            index_name (str): The name of the Elasticsearch index to search.
-            address_query (str): The address query to search for.
-
-        Returns:
-            dict: The search results as a dictionary.
-        """
-        # Create an Elasticsearch query DSL for address search
-        query = {
-            "query": {
-                "bool": {
-                    "filter": [
-                        {
-                            "term": {
-                                "state_voter_id": voter_id
-                            }
-                        }
-                    ]
-                }
-            }
-        }
-        response = self.client.options(basic_auth=(self.username, self.password)).search(index=index_name, body=query)
-        return response
-
-search_client = MyExtendedElasticsearch(es_host, ca_cert_path, es_username, es_password)
+_search_client = None
+
+def get_search_client():
+    """
+    Return this process's search client, creating it on first use.
+
+    Forked workers (pandarallel) do not inherit the parent's client or its
+    sockets: the reference is dropped in the child and a new pool is built
+    on the child's first call.
+
+    Returns:
+        MyExtendedElasticsearch: The client for this process.
+    """
+    global _search_client
+    if _search_client is None:
+        from utils.search_client import MyExtendedElasticsearch
+        _search_client = MyExtendedElasticsearch(es_host, ca_cert_path, es_username, es_password)
+    return _search_client
+
+def close_search_client():
+    """
+    Close this process's search client and its connection pool.
+    """
+    global _search_client
+    if _search_client is not None:
+        _search_client.close()
+        _search_client = None
+
+def _forget_search_client():
+    global _search_client
+    _search_client = None
+
+os.register_at_fork(after_in_child=_forget_search_client)
+atexit.register(close_search_client)
 
 def search_for_address(address):
     index_name = "places"
-    search_results = search_client.search_address(index_name, address)
+    search_results = get_rate_controller().call(lambda: get_search_client().search_address(index_name, address))
     return process_search_results(search_results)
 
 def search_for_apartments(address):
     index_name = "places-previous"
-    search_results = search_client.search_unit_address(index_name, address)
+    search_results = get_rate_controller().call(lambda: get_search_client().search_unit_address(index_name, address))
     return process_search_results(search_results)
 
 
 def search_exact_match_address(house_number, street_name, zip_code):
     index_name = "places"
-    search_results = search_client.exact_match_address(index_name, house_number, street_name, zip_code)
+    search_results = get_rate_controller().call(lambda: get_search_client().exact_match_address(index_name, house_number, street_name, zip_code))
     return process_search_results(search_results)
 
+def msearch_for_address(addresses, columns_to_update, pass_name):
+    from utils.search_client import MyExtendedElasticsearch
+    index_name = "places"
+    params = addresses.to_frame()
+    return msearch_queries(index_name, MyExtendedElasticsearch.address_query, params, columns_to_update, pass_name)
+
+def msearch_for_apartments(addresses, columns_to_update, pass_name):
+    from utils.search_client import MyExtendedElasticsearch
+    index_name = "places-previous"
+    params = addresses.to_frame()
+    return msearch_queries(index_name, MyExtendedElasticsearch.unit_address_query, params, columns_to_update, pass_name)
+
+def msearch_exact_match_address(addresses, columns_to_update, pass_name):
+    from utils.search_client import MyExtendedElasticsearch
+    index_name = "places"
+    params = addresses[['physical_house_number', 'physical_street_name', 'physical_zip_code']]
+    return msearch_queries(index_name, MyExtendedElasticsearch.exact_match_query, params, columns_to_update, pass_name, case_sensitive=True)
+
+def get_address_backend():
+    """
+    Return what the address passes search: the Elasticsearch client or the
+    local places snapshots, depending on ADDRESS_BACKEND.
+    """
+    if ADDRESS_BACKEND == 'local':
+        return get_local_places()
+    return get_search_client()
+
+def msearch_queries(index_name, build_query, params, columns_to_update, pass_name, case_sensitive=False, batch_size=ES_MSEARCH_BATCH_SIZE):
+    """
+    Resolve the queries described by params. Each distinct query is resolved
+    once, from the address cache when possible and otherwise through batched
+    _msearch requests, and its result is broadcast back to every row sharing it.
+
+    Args:
+        index_name (str): The name of the Elasticsearch index to search.
+        build_query (callable): Builds a query body from one row of params.
+        params (pd.DataFrame): Query arguments, one column per build_query argument.
+        columns_to_update (list of str): Columns produced by process_search_results.
+        pass_name (str): The address pass, part of the cache key.
+        case_sensitive (bool): Whether the query arguments are matched case sensitively.
+        batch_size (int): Number of queries sent per _msearch request.
+
+    Returns:
+        pd.DataFrame: The processed results, indexed like params.
+    """
+    started = time.perf_counter()
+    backend = get_address_backend()
+    keys = normalize_query_keys(params, case_sensitive)
+    distinct = params[~keys.duplicated()]
+    distinct_keys = keys[distinct.index]
+    metrics = SearchMetrics(pass_name, index_name, len(params), len(distinct))
+    if len(params) > 0:
+        print(f"...{index_name} {len(params)} rows, {len(distinct)} distinct queries ({1 - len(distinct) / len(params):.1%} deduplicated)")
+
+    cache = get_address_cache()
+    cached = {}
+    if cache is not None and len(distinct) > 0:
+        cache.validate_index(index_name, backend.index_generation(index_name))
+        cached = cache.get_many(pass_name, index_name, distinct_keys.tolist())
+        metrics.cache_hits = len(cached)
+        print(f"...{index_name} cache hits {len(cached)} misses {len(distinct) - len(cached)}")
+
+    missing = ~distinct_keys.isin(cached.keys())
+    missing_keys = distinct_keys[missing].tolist()
+    metrics.query_keys = missing_keys
+    queries = [build_query(*values) for values in distinct[missing].itertuples(index=False, name=None)]
+    columns = allocate_result_columns(columns_to_update, len(queries))
+    completed = np.zeros(len(queries), dtype=bool)
+    try:
+        if ES_ASYNC and ADDRESS_BACKEND != 'local':
+            msearch_columns_async(index_name, queries, columns, completed, batch_size, metrics)
+        else:
+            msearch_columns(index_name, queries, columns, completed, batch_size, backend, metrics)
+    except SearchUnavailable as error:
+        # hand what the finished batches resolved to the pass, which checkpoints it, and cache it
+        done = pd.DataFrame(columns, index=missing_keys, columns=columns_to_update)[completed]
+        if cache is not None and len(done) > 0:
+            cache.set_many(pass_name, index_name, done.to_dict('index'))
+        error.resolved = broadcast_results(keys, cached, done, columns_to_update, how='inner')
+        raise
+    found = pd.DataFrame(columns, index=missing_keys, columns=columns_to_update)
+
+    if cache is not None and len(found) > 0:
+        cache.set_many(pass_name, index_name, found.to_dict('index'))
+
+    results = broadcast_results(keys, cached, found, columns_to_update)
+
+    metrics.rows_resolved = int((results['results'] == 'Success').sum()) if len(results) > 0 else 0
+    metrics.seconds = time.perf_counter() - started
+    if len(params) > 0:
+        print(metrics.summary())
+    get_run_report().add_search(metrics)
+    return results
+
+def broadcast_results(keys, cached, found, columns_to_update, how='left'):
+    """
+    Give every row the result of its query key.
+
+    Args:
+        keys (pd.Series): The query key of every row.
+        cached (dict): query key -> result, from the address cache.
+        found (pd.DataFrame): Results of the searched keys, indexed by query key.
+        how (str): 'inner' to leave out the rows whose key has no result.
+
+    Returns:
+        pd.DataFrame: The columns_to_update, indexed like keys.
+    """
+    resolved = found
+    if cached:
+        from_cache = pd.DataFrame.from_dict(cached, orient='index', columns=columns_to_update)
+        resolved = pd.concat([from_cache, found]) if len(found) > 0 else from_cache
+    return keys.to_frame('query_key').join(resolved, on='query_key', how=how)[columns_to_update]
+
+def msearch_columns(index_name, queries, columns, completed, batch_size=ES_MSEARCH_BATCH_SIZE, backend=None, metrics=None):
+    """
+    Run queries through batched _msearch requests, one request at a time,
+    with the retries of the rate controller. backend defaults to the search
+    client; LocalPlaces answers the same batches offline.
+
+    Args:
+        columns (dict): column -> np.ndarray from allocate_result_columns, filled in place.
+        completed (np.ndarray): bool per query, set as its batch is decoded.
+        metrics (SearchMetrics): Counts each request when given.
+    """
+    backend = backend or get_search_client()
+    controller = get_rate_controller()
+    for start in range(0, len(queries), batch_size):
+        request_started = time.perf_counter()
+        if ADDRESS_BACKEND == 'local':
+            responses = backend.msearch(index_name, queries[start:start + batch_size])
+        else:
+            responses = controller.call(lambda: backend.msearch(index_name, queries[start:start + batch_size]))
+        if metrics is not None:
+            metrics.record_request(start, responses, time.perf_counter() - request_started)
+        decode_responses(responses, columns, start)
+        completed[start:start + batch_size] = True
+
+def msearch_columns_async(index_name, queries, columns, completed, batch_size=ES_MSEARCH_BATCH_SIZE, metrics=None):
+    """
+    Run queries through batched _msearch requests on the asyncio client,
+    decoding each batch into the result columns as it completes. Arguments
+    as for msearch_columns.
+    """
+    from utils.async_search import msearch_async
+
+    def on_batch(start, responses, seconds):
+        if metrics is not None:
+            metrics.record_request(start, responses, seconds)
+        decode_responses(responses, columns, start)
+        completed[start:start + batch_size] = True
+
+    msearch_async(index_name, queries, on_batch, batch_size)
+
+# numeric result columns, decoded to float64
+NUMERIC_RESULT_COLUMNS = ["PropertyLatitude", "PropertyLongitude"]
+
+def allocate_result_columns(columns_to_update, size):
+    """
+    Preallocate one array per result column, filled with the handle_not_found values.
+
+    Returns:
+        dict: column -> np.ndarray of length size.
+    """
+    not_found = handle_not_found()
+    columns = {}
+    for column in columns_to_update:
+        if column in NUMERIC_RESULT_COLUMNS:
+            columns[column] = np.full(size, not_found[column], dtype=np.float64)
+        else:
+            columns[column] = np.full(size, not_found[column], dtype=object)
+    return columns
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def decode_responses(responses, columns, offset):
+    """
+    Write single hits straight into the result columns; every other response
+    keeps the preallocated not found values. Equivalent to process_search_results
+    without building a Series per row.
+
+    Args:
+        responses (list of dict): Search responses.
+        columns (dict): column -> np.ndarray, from allocate_result_columns.
+        offset (int): Position of the first response in the columns.
+    """
+    results = columns.get("results")
+    physical_ids = columns.get("physical_id")
+    source_columns = [(column, values) for column, values in columns.items() if column not in ("results", "physical_id")]
+    for position, response in enumerate(responses, start=offset):
+        hits = response['hits']['hits']
+        if len(hits) != 1:
+            continue
+        hit = hits[0]
+        source = hit['_source']
+        if results is not None:
+            results[position] = "Success"
+        if physical_ids is not None:
+            physical_ids[position] = hit["_id"]
+        for column, values in source_columns:
+            if column in NUMERIC_RESULT_COLUMNS:
+                values[position] = _to_float(source.get(column))
+            else:
+                values[position] = source.get(column)
+
 def generate_actions(df):
     for index, row in df.iterrows():
         yield {
@@ -191,6 +285,7 @@ def generate_actions(df):
 
 def index_documents(df, index_name):
     """Bulk index the dataframe into Elasticsearch."""
+    from elasticsearch.helpers import streaming_bulk, BulkIndexError
     number_of_docs = len(df)
     progress = tqdm.tqdm(unit="docs", total=number_of_docs)
     successes = 0
@@ -198,7 +293,7 @@ def index_documents(df, index_name):
 
     try:
         for ok, action in streaming_bulk(
-            search_client.client.options(basic_auth=(es_username, es_password)),
+            get_search_client().retrying_client(),
             index=index_name, actions=generate_actions(df),
         ):
             progress.update(1)
@@ -0,0 +1,271 @@
+"""
+The Elasticsearch client of the pipeline and the query DSL of the address
+searches. Kept apart from utils/search.py so that importing the search
+helpers does not import the elasticsearch package (and aiohttp); the client
+module is imported on the first search.
+"""
+from common_functions.search import MyElasticsearch
+from elasticsearch import Elasticsearch
+
+from utils.config import ES_POOL_MAXSIZE, ES_REQUEST_TIMEOUT, ES_HTTP_COMPRESS, ES_MAX_RETRIES
+from utils.rate_control import MsearchItemError
+
+class MyExtendedElasticsearch(MyElasticsearch):
+    def __init__(self, host, cert_path, username, password):
+        self.host = host
+        self.cert_path = cert_path
+        self.username = username
+        self.password = password
+        super().__init__(host, cert_path, username, password)
+        self.client = self.create_client()
+
+    def __enter__(self):
+        # Initialize the Elasticsearch client connection here
+        # Assuming self.client is the Elasticsearch client instance
+        self.client = self.create_client()  # Placeholder for actual client creation method
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Close the Elasticsearch client connection here
+        # Assuming self.client has a close method
+        if hasattr(self.client, 'close'):
+            self.client.close()
+
+    def create_client(self):
+        """
+        Create a pooled keep-alive client that authenticates every request,
+        so calls do not need .options(basic_auth=...). The transport does not
+        retry: the address searches are retried by the RateController
+        (utils/rate_control.py), other calls go through retrying_client().
+        """
+        return Elasticsearch(
+            self.host,
+            ca_certs=self.cert_path or None,
+            basic_auth=(self.username, self.password),
+            connections_per_node=ES_POOL_MAXSIZE,
+            request_timeout=ES_REQUEST_TIMEOUT,
+            http_compress=ES_HTTP_COMPRESS,
+            max_retries=0,
+            retry_on_timeout=False,
+            retry_on_status=(),
+        )
+
+    def retrying_client(self):
+        """
+        The client with transport retries (ES_MAX_RETRIES on timeouts and
+        429/502/503/504), for the calls the RateController does not drive:
+        bulk indexing and the places snapshot scroll.
+        """
+        return self.client.options(max_retries=ES_MAX_RETRIES, retry_on_timeout=True, retry_on_status=(429, 502, 503, 504))
+
+    def close(self):
+        if hasattr(self.client, 'close'):
+            self.client.close()
+
+    @staticmethod
+    def address_query(address_query):
+        """
+        Build the query DSL used by search_address.
+
+        Args:
+            address_query (str): The address query to search for.
+
+        Returns:
+            dict: The query body.
+        """
+        return {
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "simple_query_string": {
+                                "query": address_query,
+
+                                "fields": ["PropertyAddress*"],
+                                "default_operator": "AND",
+                                "analyzer": "standard"
+                            }
+                        }
+                    ]
+                }
+            },
+            "collapse": {
+                "field": "[ATTOM ID].keyword"
+            }
+        }
+
+    @staticmethod
+    def unit_address_query(address_query):
+        """
+        Build the query DSL used by search_unit_address.
+
+        Args:
+            address_query (str): The address query to search for.
+
+        Returns:
+            dict: The query body.
+        """
+        return {
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "simple_query_string": {
+                                "query": address_query,
+
+                                "fields": ["PropertyAddress*"],
+                                "default_operator": "AND",
+                                "analyzer": "standard"
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+
+    @staticmethod
+    def exact_match_query(house_number, street_name, zip_code):
+        """
+        Build the query DSL used by exact_match_address.
+
+        Args:
+            house_number (str): The house number to match.
+            street_name (str): The street name to match.
+            zip_code (str): The ZIP code to match.
+
+        Returns:
+            dict: The query body.
+        """
+        return {
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "term": {
+                                "PropertyAddressHouseNumber.raw": house_number
+                            }
+                        },
+                        {
+                            "term": {
+                                "PropertyAddressStreetName.raw": street_name
+                            }
+                        },
+                        {
+                            "term": {
+                                "PropertyAddressZIP.raw": zip_code
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+
+    def search_address(self, index_name, address_query):
+        """
+        Search for an address in the Elasticsearch index.
+
+        Args:
+            index_name (str): The name of the Elasticsearch index to search.
+            address_query (str): The address query to search for.
+
+        Returns:
+            dict: The search results as a dictionary.
+        """
+        query = self.address_query(address_query)
+        response = self.client.search(index=index_name, body=query)
+        return response
+
+    def search_unit_address(self, index_name, address_query):
+        """
+        Search for an address in the Elasticsearch index.
+
+        Args:
+            index_name (str): The name of the Elasticsearch index to search.
+            address_query (str): The address query to search for.
+
+        Returns:
+            dict: The search results as a dictionary.
+        """
+        query = self.unit_address_query(address_query)
+        response = self.client.search(index=index_name, body=query)
+        return response
+
+    def exact_match_address(self, index_name, house_number, street_name, zip_code):
+        """
+        Search for an address in the Elasticsearch index.
+
+        Args:
+            index_name (str): The name of the Elasticsearch index to search.
+            house_number (str): The house number to match.
+            street_name (str): The street name to match.
+            zip_code (str): The ZIP code to match.
+
+        Returns:
+            dict: The search results as a dictionary.
+        """
+        query = self.exact_match_query(house_number, street_name, zip_code)
+        response = self.client.search(index=index_name, body=query)
+        return response
+
+    def msearch(self, index_name, queries):
+        """
+        Run several queries against one index in a single _msearch request.
+
+        Args:
+            index_name (str): The name of the Elasticsearch index to search.
+            queries (list of dict): Query bodies, e.g. from address_query.
+
+        Returns:
+            list of dict: One search response per query, in query order.
+        """
+        searches = []
+        for query in queries:
+            searches.append({"index": index_name})
+            searches.append(query)
+        response = self.client.msearch(searches=searches)
+        responses = response['responses']
+        for item in responses:
+            if 'error' in item:
+                raise MsearchItemError(index_name, item['error'], item.get('status'))
+        return responses
+
+    def index_generation(self, index_name):
+        """
+        Identify the current build of an index (or of the indices behind an alias).
+
+        Args:
+            index_name (str): The name of the Elasticsearch index or alias.
+
+        Returns:
+            str: The uuid(s) of the concrete indices.
+        """
+        settings = self.client.indices.get_settings(index=index_name, name="index.uuid")
+        return ','.join(sorted(index['settings']['index']['uuid'] for index in settings.values()))
+
+    def voter_votehistory(self, index_name, voter_id):
+        """
+        Search for an address in the Elasticsearch index.
+
+        Args:
+            index_name (str): The name of the Elasticsearch index to search.
+            address_query (str): The address query to search for.
+
+        Returns:
+            dict: The search results as a dictionary.
+        """
+        # Create an Elasticsearch query DSL for address search
+        query = {
+            "query": {
+                "bool": {
+                    "filter": [
+                        {
+                            "term": {
+                                "state_voter_id": voter_id
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+        response = self.client.search(index=index_name, body=query)
+        return response
@@ -0,0 +1,145 @@
+"""
+Content addressed cache of the extract stages.
+
+An extract fingerprints what its output depends on: every raw input file
+(name, size, mtime and a hash of its content), the data contract, the
+stage's STAGE_VERSION and its parameters. write_output records that
+fingerprint in a sidecar next to the processed dataset it writes; when a
+later run finds the same file contents, contract, version and parameters,
+cached_output returns the processed dataset instead of re-reading and
+re-cleaning the raw files. STAGE_CACHE_ENABLED=false turns the lookups off.
+
+Content hashes are only recomputed for files whose size or mtime changed
+since the sidecar was written, so checking an unchanged date costs a stat
+per file. A touched but identical file still hits, its hash being equal.
+"""
+import os
+import json
+import hashlib
+from datetime import datetime
+
+from utils.config import STAGE_CACHE_ENABLED
+from utils.datasets import read_dataset, write_dataset
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+def sidecar_path(output_path):
+    return f"{output_path}.fingerprint.json"
+
+def read_sidecar(output_path):
+    path = sidecar_path(output_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as sidecar:
+        return json.load(sidecar)
+
+def hash_file(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_contract(contract):
+    """
+    Hash the repr of the contract objects (column lists, dtype mappings, ...).
+    """
+    return hashlib.blake2b(repr(contract).encode(), digest_size=16).hexdigest()
+
+def file_fingerprints(directory, previous=None):
+    """
+    Fingerprint the files of a raw directory.
+
+    Parameters:
+    directory (str): The raw directory of a dataset and file date.
+    previous (dict): file name -> fingerprint recorded earlier, reused when size and mtime match.
+
+    Returns:
+    list of dict: name, size, mtime (ns) and hash of every file, by name.
+    """
+    previous = previous or {}
+    fingerprints = []
+    entries = sorted((entry for entry in os.scandir(directory) if entry.is_file()), key=lambda entry: entry.name)
+    for entry in entries:
+        stat = entry.stat()
+        known = previous.get(entry.name)
+        if known is not None and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime_ns:
+            content_hash = known['hash']
+        else:
+            content_hash = hash_file(entry.path)
+        fingerprints.append({"name": entry.name, "size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": content_hash})
+    return fingerprints
+
+def stage_fingerprint(stage, version, input_directory, contract, params, output_path):
+    """
+    Fingerprint a run of an extract stage.
+
+    Parameters:
+    stage (str): The stage, e.g. 'voters_extract'.
+    version (int): The stage's STAGE_VERSION.
+    input_directory (str): The raw files the stage reads.
+    contract (tuple): The data contract objects the output depends on.
+    params (dict): Other values the output depends on (sample, ...), JSON types only.
+    output_path (str): Where the stage's output is written.
+
+    Returns:
+    dict: The fingerprint.
+    """
+    sidecar = read_sidecar(output_path) or {}
+    previous = {known['name']: known for known in sidecar.get('fingerprint', {}).get('files', [])}
+    return {
+        "stage": stage,
+        "version": version,
+        "contract": hash_contract(contract),
+        "params": params,
+        "files": file_fingerprints(input_directory, previous),
+    }
+
+def cache_key(fingerprint):
+    """
+    The part of a fingerprint that decides a hit: mtimes only serve to skip hashing.
+    """
+    files = [(known['name'], known['size'], known['hash']) for known in fingerprint['files']]
+    return (fingerprint['stage'], fingerprint['version'], fingerprint['contract'], fingerprint['params'], files)
+
+def is_current(fingerprint, output_path):
+    sidecar = read_sidecar(output_path)
+    return os.path.exists(output_path) and sidecar is not None and cache_key(sidecar['fingerprint']) == cache_key(fingerprint)
+
+def write_sidecar(fingerprint, output_path):
+    path = sidecar_path(output_path)
+    with open(f"{path}.tmp", 'w') as sidecar:
+        json.dump({"fingerprint": fingerprint, "written": datetime.now().isoformat(timespec='seconds')}, sidecar, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def cached_output(fingerprint, output_path):
+    """
+    Return the stage's output when it was written from the same inputs, else None.
+    """
+    if not STAGE_CACHE_ENABLED or not is_current(fingerprint, output_path):
+        return None
+    print(f"...{fingerprint['stage']} inputs unchanged, reading {output_path}")
+    if read_sidecar(output_path)['fingerprint'] != fingerprint:
+        # touched but identical files: record their new mtimes so the next check skips hashing them
+        write_sidecar(fingerprint, output_path)
+    return with_fingerprint(read_dataset(output_path), fingerprint)
+
+def with_fingerprint(df, fingerprint):
+    df.attrs['fingerprint'] = fingerprint
+    return df
+
+def write_output(df, output_path, partition_columns=None):
+    """
+    write_dataset that records the frame's fingerprint (if any) in a sidecar, and
+    skips the write when the dataset already holds the output of that fingerprint.
+    """
+    fingerprint = df.attrs.get('fingerprint')
+    if fingerprint is not None and is_current(fingerprint, output_path):
+        return df
+    # the sidecar goes first: an interrupted write leaves no sidecar claiming the new file
+    if os.path.exists(sidecar_path(output_path)):
+        os.remove(sidecar_path(output_path))
+    df = write_dataset(df, output_path, partition_columns)
+    if fingerprint is not None:
+        write_sidecar(fingerprint, output_path)
+    return df
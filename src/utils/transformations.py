@@ -1,10 +1,12 @@
-import re
 import pandas as pd
+from utils.address_rules import classify_addresses
+from utils.config import initialize_pandarallel
 
 def join_columns(df, columns, new_column_name, sep=' ') -> pd.DataFrame:
     """
     Join multiple columns into a single column
     """
+    initialize_pandarallel()
     df[new_column_name] = df[columns].parallel_apply(lambda x: sep.join(x.dropna().astype(str)), axis=1)
     return df
 
@@ -13,24 +15,12 @@ def mark_homeless_addresses(df, tests):
     Mark rows as 'Homeless' based on various string tests provided in a list of tuples.
 
     :param df: DataFrame to process
-    :param tests: List of tuples where each tuple contains (column, test_type, condition)
+    :param tests: List of tuples where each tuple contains (test_type, condition)
     :return: Modified DataFrame
     """
-
-    # Initialize an empty mask
-    mask = pd.Series(False, index=df.index)
-
-    # Apply tests from the list
     columns = ['physical_address_1', 'physical_address_2']
-    for column in columns:
-        for test_type, condition in tests:
-            if test_type == 'contains':
-                mask |= df[column].str.contains(condition, na=False, flags=re.IGNORECASE)
-            elif test_type == 'startswith':
-                mask |= df[column].str.startswith(condition, na=False)
-
-    # Mark rows as 'Homeless'
-    df.loc[mask, 'results'] = 'Homeless'
+    rules = [('Homeless', columns, test_type, condition) for test_type, condition in tests]
+    df, _ = classify_addresses(df, rules)
     return df
 
 def convert_date_format(date_str):
@@ -16,12 +16,20 @@ import glob
 from common_functions.common import get_traceback, get_timing, cast_date, timing_decorator
 from common_functions.file_operations import read_extract, write_load, read_extract_multiple
 
-from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, LOGSTASH_DATA_PATH, state, file_date, sample
+from utils.arg_parser import require_date
+from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, LOGSTASH_DATA_PATH, state, file_date, sample, seed
 from utils.database import Database
 from utils.dataframe_operations import validate_dataframe
-from utils.transformations import convert_date_format
+from utils.dates import parse_dates, format_dates, MDY_SLASH
+from utils.stage_cache import stage_fingerprint, cached_output, with_fingerprint, write_output
+from utils.datasets import read_dataset
+from utils.file_operations import sample_csv_files
+from utils.sampling import BottomKSampler
 
-from data_contracts.votehistory_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns
+from data_contracts.votehistory_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns, partition_columns
+
+# bump when a change to this stage changes what it writes (invalidates the stage cache)
+STAGE_VERSION = 2
 
 def _clean(df):
     print("Cleaning data")
@@ -36,21 +44,22 @@ def _clean(df):
 
 def _transform(df):
     print('Transforming data...')
-    for h in list(df):
+    # election columns are headed by their date (mm/dd/yyyy)
+    headers = list(df)
+    election_dates = format_dates(parse_dates(pd.Series(headers, dtype=object), [MDY_SLASH]))
+    for h, new_header in zip(headers, election_dates):
         print(f"renaming or dropping {h}...", end =" ")
-        try:
-            new_header = datetime.strptime(h, "%m/%d/%Y").strftime("%Y-%m-%d")
+        if isinstance(new_header, str):
             df = df.rename(columns = {h: new_header})
             print(f"...renaming to {new_header}")
             df[new_header] = df[new_header].fillna('ITV')
             df.loc[df[new_header].str.contains('-'), new_header] = 'ITV'
             df[new_header] = df[new_header].str.upper()
-        except ValueError as e:
-            if h == "state_voter_id":
-                print(f"skipping {h}")
-            else:
-                print(f"...droping {h}")
-                df = df.drop(columns=[h])
+        elif h == "state_voter_id":
+            print(f"skipping {h}")
+        else:
+            print(f"...droping {h}")
+            df = df.drop(columns=[h])
     df = pd.melt(df, id_vars=['state_voter_id'],  value_name='voted', var_name='election_date')
     print("Droping voters who are ITV (ineligible to vote)", end =" ")
     df = df[df['voted'] != 'ITV']
@@ -61,24 +70,61 @@ def _transform(df):
     df = df[final_columns]
     return df.reset_index(drop=True)
 
-def main():
+def extract(file_date, sample=0, seed=0) -> pd.DataFrame:
+    """
+    Read, clean and melt the raw vote history files of a file date.
+
+    Parameters:
+    file_date (datetime): The file date to process.
+    sample (int): Only read the history of this many voters (see utils/sampling.py), all of them when 0.
+    seed (int): The seed of the sample.
+
+    Returns:
+    pd.DataFrame: One row per voter and election voted in.
+    """
     print(f"Processing raw vote history file on {file_date.strftime('%Y-%m-%d')}")
 
-    df = pd.DataFrame()
-    df = read_extract_multiple(df, os.path.join(RAW_DATA_PATH, file_date.strftime('%Y_%m_%d'), 'history'))
+    raw_directory = os.path.join(RAW_DATA_PATH, file_date.strftime('%Y_%m_%d'), 'history')
+    fingerprint = stage_fingerprint('history_extract', STAGE_VERSION, raw_directory, (DATA_CONTRACT, dtype_mapping, final_columns),
+                                    {"sample": sample, "seed": seed}, processed_path(file_date))
+    df = cached_output(fingerprint, processed_path(file_date))
+    if df is not None:
+        return df
+
+    if sample:
+        print(f"...taking a sample of {sample} voters (seed {seed})")
+        # invalid ids are removed by _clean, keep them out of the sample
+        df = sample_csv_files(raw_directory, BottomKSampler(sample, seed, key='VOTER_ID', row_filter=lambda batch: batch['VOTER_ID'].ne('ACP').fillna(True)))
+    else:
+        df = pd.DataFrame()
+        df = read_extract_multiple(df, raw_directory)
     # rename VOTER_ID to state_voter_id
     df = df.rename(columns = {'VOTER_ID': 'state_voter_id'})
-    if sample:
-        print(f"...taking a sample of {sample}")
-        df = df.sample(n=sample)
     df = _clean(df)
     df = _transform(df)
-    df = df.drop_duplicates()
-    df = write_load(df, os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.gzip"))
+    return with_fingerprint(df.drop_duplicates(), fingerprint)
+
+def processed_path(file_date):
+    return os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}")
+
+def read_processed(file_date, columns=None, filters=None) -> pd.DataFrame:
+    """
+    Read the processed vote history of a file date, e.g. one election with
+    filters=[('election_date', '==', '2020-11-03')] (see utils/datasets.py).
+    """
+    return read_dataset(processed_path(file_date), columns, filters)
+
+def write_processed(df, file_date):
+    return write_output(df, processed_path(file_date), partition_columns)
+
+def main():
+    df = extract(file_date, sample, seed)
+    df = write_processed(df, file_date)
 
     print(f"File Processed {len(df)} records")
 
 if __name__ == "__main__":
+    require_date()
     process_time = time.time()
     try:
         print(f"Processing raw history file on {file_date.strftime('%Y-%m-%d')}")
@@ -11,11 +11,13 @@ from sqlalchemy.dialects.postgresql import insert
 from common_functions.common import get_traceback, get_timing, timing_decorator
 from common_functions.file_operations import read_extract, write_load, read_extract_multiple
 
-from utils.arg_parser import get_date, get_sample
+from utils.arg_parser import get_date, get_sample, require_date
 
-from utils.config import LOGSTASH_DATA_PATH, DATA_FILES, state, file_date, sample, initialize_pandarallel, PROCESSED_DATA_PATH
+from utils.config import LOGSTASH_DATA_PATH, DATA_FILES, state, file_date, sample, seed, initialize_pandarallel, PROCESSED_DATA_PATH
 from data_contracts.votehistory_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns, ElectionVoting, Base, create_dynamic_class
 from utils.database import Database, fetch_existing_table, fetch_sql
+from utils.datasets import read_dataset
+from utils.sampling import read_sampled_dataset
 from utils.file_operations import validate_dataframe
 from utils.dataframe_operations import diff_dataframe
 from utils.transformations import convert_date_format
@@ -61,22 +63,30 @@ def _load(df) -> pd.DataFrame:
         # check if the data is already in the database
         insert_df = diff_dataframe(df_new=election_df, df_existing=existing_data, on_columns=final_columns)
         print(f"Found {len(insert_df)} new records to insert")
-        results = insert_df.to_sql(table_name, engine, if_exists='append', index=False, dtype=dtype_mapping, method='multi', chunksize=5000)
+        db_connection.bulk_load(insert_df, table_name, dtype_mapping, if_exists='append')
 
     return df.reset_index(drop=True)
 
+def load(df) -> pd.DataFrame:
+    """
+    Insert the processed vote history into the per election tables, skipping rows already loaded.
+    """
+    df = _transform(df)
+    return _load(df)
+
 def main():
-    df = pd.DataFrame()
-    df = read_extract(df, os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.gzip"))
+    file_path = os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}")
     if sample > 0:
-        print(f"...taking a sample of {sample}")
-        df = df.sample(n=sample)
-    df = _transform(df)
-    df = _load(df)
+        print(f"...taking a sample of {sample} voters (seed {seed})")
+        df = read_sampled_dataset(file_path, sample, seed, columns=final_columns)
+    else:
+        df = read_dataset(file_path, columns=final_columns)
+    df = load(df)
 
     print(f"File Processed {len(df)} records")
 
 if __name__ == "__main__":
+    require_date()
     process_time = time.time()
     try:
         print(f"Processing processed voter file on {file_date.strftime('%Y-%m-%d')}")
@@ -1,40 +1,29 @@
+"""
+Extracts the vote history of every raw folder up to --date (all of them when
+it is omitted) in one process, writing the processed datasets for
+history_load.py / run_load.py --stages load.
+"""
 import sys
 sys.path.append(r'../src')
-import os
-import re
-import logging
 from common_functions.common import timing_decorator
-from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, LOGSTASH_DATA_PATH, state, file_date, sample
 
-def get_folder_names(directory, pattern):
-    folder_names = []
-    for item in os.listdir(directory):
-        if os.path.isdir(os.path.join(directory, item)) and re.match(pattern, item):
-            folder_names.append(item)
-    return folder_names
+from utils.config import RAW_DATA_PATH, file_date, sample, seed
+from utils.pipeline import get_file_dates, setup_logging, run_file_dates
+from votehistory import history_extract
+
+def _extract(df, file_date):
+    return history_extract.extract(file_date, sample, seed)
+
+STAGES = [
+    ('extract', _extract, history_extract.write_processed),
+]
 
-def setup_logging():
-    logging.basicConfig(filename='voter_data_extraction.log', level=logging.INFO,
-                        format='%(asctime)s - %(levelname)s - %(message)s')
 @timing_decorator
 def main():
-    directory = RAW_DATA_PATH
-    print(f"Processing {directory}")
-    pattern = r'\d{4}_\d{2}_\d{2}'  # Pattern for yyyy_mm_dd
-    folder_names = get_folder_names(directory, pattern)
-    print(f"Processing {len(folder_names)} folders")
     setup_logging()
-
-    for folder_name in sorted(folder_names):
-        date_format = folder_name.replace('_', '-')
-        command = f'python votehistory/history_extract.py --date={date_format}'
-        # load = f'python voterfile/voters_load.py --date={date_format}'
-        logging.info(f"Executing: {command}")
-        return_code = os.system(command)
-        if return_code != 0:
-            logging.error(f"Command failed with return code {return_code}: {command}")
-        else:
-            logging.info(f"Command executed successfully: {command}")
+    file_dates = get_file_dates(RAW_DATA_PATH, until=file_date)
+    print(f"Processing {len(file_dates)} folders of {RAW_DATA_PATH}")
+    run_file_dates(STAGES, file_dates, persist=True)
 
 if __name__ == "__main__":
     main()
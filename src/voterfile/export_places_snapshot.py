@@ -0,0 +1,30 @@
+"""
+Export the places indices to local snapshots so the address passes can run
+with ADDRESS_BACKEND=local (no access to the Elasticsearch cluster).
+"""
+import sys
+sys.path.append(r'../src')
+import os
+import time
+
+from common_functions.common import get_traceback, get_timing
+
+from utils.search import get_search_client
+from utils.places_snapshot import export_places_snapshot
+
+PLACES_INDICES = ["places", "places-previous"]
+
+def main():
+    for index_name in PLACES_INDICES:
+        export_places_snapshot(get_search_client(), index_name)
+
+if __name__ == "__main__":
+    process_time = time.time()
+    try:
+        print(f"Starting {os.path.basename(__file__)}")
+        main()
+    except Exception as e:
+        print('------Start--------')
+        print(get_traceback(e))
+        print('------End--------')
+    get_timing(process_time)
@@ -1,38 +1,46 @@
-import os
-import re
-import logging
+"""
+Runs the voter file pipeline (extract -> transform [-> load]) in one process
+for every raw folder up to --date (all of them when it is omitted). Frames
+are handed from stage to stage in memory; the processed datasets are only written with --persist, the final
+dataset is always written. Pick stages with --stages (e.g. --stages transform,load
+starts from the datasets an earlier run persisted).
+"""
+import sys
+sys.path.append(r'../src')
+from common_functions.common import timing_decorator
 
-def get_folder_names(directory, pattern):
-    folder_names = []
-    for item in os.listdir(directory):
-        if os.path.isdir(os.path.join(directory, item)) and re.match(pattern, item):
-            folder_names.append(item)
-    return folder_names
+from utils.config import RAW_DATA_PATH, file_date, sample, seed, incremental, link, persist, stages
+from utils.pipeline import get_file_dates, setup_logging, select_stages, run_file_dates
+from voterfile import voters_extract, voters_transform, voters_load_database
+from data_contracts.voterfile_data_contract import final_columns
 
-def setup_logging():
-    logging.basicConfig(filename='voter_data_extraction.log', level=logging.INFO,
-                        format='%(asctime)s - %(levelname)s - %(message)s')
+def _extract(df, file_date):
+    return voters_extract.extract(file_date, sample, seed)
 
-def main():
-    directory = '/Volumes/nfs-data/voter_data/oregon/voter_lists/raw'
-    pattern = r'\d{4}_\d{2}_\d{2}'  # Pattern for yyyy_mm_dd
-    folder_names = get_folder_names(directory, pattern)
+def _transform(df, file_date):
+    if df is None:
+        df = voters_transform.read_processed(file_date, sample=sample, seed=seed)
+    df = voters_transform.transform(df, file_date, incremental=incremental)
+    return voters_transform.write_final(df, file_date)
 
-    setup_logging()
+def _load(df, file_date):
+    if df is None:
+        df = voters_transform.read_final(file_date, columns=final_columns)
+    return voters_load_database.load(df, file_date, link)
+
+STAGES = [
+    ('extract', _extract, voters_extract.write_processed),
+    ('transform', _transform, None),
+    ('load', _load, None),
+]
+DEFAULT_STAGES = ['extract', 'transform']
 
-    for folder_name in sorted(folder_names):
-        date_format = folder_name.replace('_', '-')
-        extract = f'python voterfile/voters_extract.py --date={date_format}'
-        transform = f'python voterfile/voters_transform.py --date={date_format}'
-        # load = f'python voterfile/voters_load.py --date={date_format}'
-        logging.info(f"Executing: {extract}")
-        return_code = os.system(extract)
-        logging.info(f"Executing: {transform}")
-        return_code = os.system(transform)
-        if return_code != 0:
-            logging.error(f"Command failed with return code {return_code}: {command}")
-        else:
-            logging.info(f"Command executed successfully: {command}")
+@timing_decorator
+def main():
+    setup_logging()
+    file_dates = get_file_dates(RAW_DATA_PATH, until=file_date)
+    print(f"Processing {len(file_dates)} folders of {RAW_DATA_PATH}")
+    run_file_dates(select_stages(STAGES, stages or DEFAULT_STAGES), file_dates, persist)
 
 if __name__ == "__main__":
     main()
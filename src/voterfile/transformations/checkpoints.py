@@ -0,0 +1,141 @@
+"""
+Checkpoints for the address passes.
+
+The frame after pass 01 is written once as the base. Every later pass only
+writes the rows whose pass columns it changed (a delta), and a manifest lists
+the base and the deltas in order. Files are written on a background thread
+with a fast codec so the passes do not wait on the (NFS) working directory.
+Resuming at pass N reads the base and applies the deltas of passes before N.
+A pass stopped by the circuit breaker writes a partial delta with the rows it
+had resolved; resuming at that pass applies it too, so only the rest is
+searched again, and the pass's delta then includes it.
+"""
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+from utils.config import WORKING_DATA_PATH, CHECKPOINT_COMPRESSION
+from data_contracts.voterfile_data_contract import TABLENAME
+
+MANIFEST_FILE = 'manifest.json'
+BASE_FILE = 'base.parquet'
+
+def checkpoint_directory(file_date):
+    return os.path.join(WORKING_DATA_PATH, 'checkpoints', f"{TABLENAME}-{file_date.strftime('%Y.%m.%d')}")
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_FILE)) as manifest_file:
+        return json.load(manifest_file)
+
+def changed_rows(before, after):
+    """
+    Return a mask of the rows where any column differs (two nulls are equal).
+    """
+    differs = before.ne(after) & ~(before.isna() & after.isna())
+    return differs.any(axis=1)
+
+class CheckpointWriter:
+    def __init__(self, file_date, reset):
+        """
+        Parameters:
+        file_date (datetime): The file date being processed.
+        reset (bool): Start a new manifest (a run starting at pass 01) instead of extending the existing one.
+        """
+        self.directory = checkpoint_directory(file_date)
+        os.makedirs(self.directory, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+        if reset or not os.path.exists(os.path.join(self.directory, MANIFEST_FILE)):
+            self.manifest = {"file_date": file_date.strftime('%Y-%m-%d'), "base": None, "passes": []}
+        else:
+            self.manifest = read_manifest(self.directory)
+
+    def _write_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        with open(f"{path}.tmp", 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def _write(self, df, file_name, update_manifest):
+        df.to_parquet(os.path.join(self.directory, file_name), compression=CHECKPOINT_COMPRESSION)
+        update_manifest()
+        self._write_manifest()
+
+    def write_base(self, df):
+        """
+        Write the full frame after pass 01.
+        """
+        def update_manifest():
+            self.manifest["base"] = BASE_FILE
+            self.manifest["passes"] = []
+        self.futures.append(self.executor.submit(self._write, df.copy(), BASE_FILE, update_manifest))
+
+    def write_delta(self, interation_pass, before, after, partial=False):
+        """
+        Write the rows a pass changed.
+
+        Parameters:
+        interation_pass (str): The pass, e.g. '02'.
+        before (pd.DataFrame): The pass columns before the pass ran.
+        after (pd.DataFrame): The same columns after the pass ran.
+        partial (bool): The pass stopped before its end (the circuit breaker opened).
+        """
+        delta = after[changed_rows(before, after)].copy()
+        previous = self._partial_entry(interation_pass)
+        if previous is not None:
+            # a resumed pass starts from its partial delta, so those rows are not in before/after's difference
+            earlier = pd.read_parquet(os.path.join(self.directory, previous["file"]))
+            earlier = earlier[~earlier.index.isin(delta.index)]
+            delta = pd.concat([earlier, delta]) if len(delta) > 0 else earlier
+        file_name = f"delta-{interation_pass}.partial.parquet" if partial else f"delta-{interation_pass}.parquet"
+        print(f"...checkpointing {len(delta)} changed rows{' (partial pass)' if partial else ''}")
+
+        def update_manifest():
+            # re-running a pass invalidates the deltas of the passes after it
+            passes = [entry for entry in self.manifest["passes"] if entry["pass"] < interation_pass]
+            passes.append({"pass": interation_pass, "file": file_name, "rows": len(delta), "columns": list(delta.columns), "partial": partial})
+            self.manifest["passes"] = passes
+        self.futures.append(self.executor.submit(self._write, delta, file_name, update_manifest))
+
+    def _partial_entry(self, interation_pass):
+        for entry in self.manifest["passes"]:
+            if entry["pass"] == interation_pass and entry.get("partial"):
+                return entry
+        return None
+
+    def close(self):
+        """
+        Wait for the pending writes, raising the first write error.
+        """
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.executor.shutdown()
+
+def load_checkpoint(file_date, upto_pass):
+    """
+    Rebuild the frame as it was after a pass from the base and the deltas,
+    with the partial delta of the next pass when the circuit breaker stopped it.
+
+    Parameters:
+    file_date (datetime): The file date being processed.
+    upto_pass (int): The last pass to apply, e.g. 3.
+
+    Returns:
+    pd.DataFrame: The frame after pass upto_pass.
+    """
+    directory = checkpoint_directory(file_date)
+    manifest = read_manifest(directory)
+    if manifest["base"] is None:
+        raise ValueError(f"No pass 01 checkpoint in {directory}")
+
+    # copied: the categorical codes parquet hands back are read-only, the deltas are assigned into them
+    df = pd.read_parquet(os.path.join(directory, manifest["base"])).copy()
+    for entry in manifest["passes"]:
+        if int(entry["pass"]) > upto_pass and not (entry.get("partial") and int(entry["pass"]) == upto_pass + 1):
+            break
+        delta = pd.read_parquet(os.path.join(directory, entry["file"]))
+        df.loc[delta.index, delta.columns] = delta
+    return df
@@ -0,0 +1,117 @@
+import os
+import re
+from datetime import datetime
+import pandas as pd
+
+from utils.config import FINAL_DATA_PATH
+from utils.datasets import read_dataset, dataset_columns
+from data_contracts.voterfile_data_contract import TABLENAME
+
+# columns that decide the outcome of the address passes for a voter
+ADDRESS_COLUMNS = [
+    'physical_address_1',
+    'physical_address_2',
+    'physical_city',
+    'physical_state',
+    'physical_zip_code',
+    'physical_house_number',
+    'physical_house_suffix',
+    'physical_street_pre_direction',
+    'physical_street_name',
+    'physical_street_suffix',
+    'physical_street_post_direction',
+    'physical_unit_type',
+    'physical_unit_number',
+    'confidential',
+    'precinct_link',
+]
+
+def find_previous_final_file(file_date):
+    """
+    Find the most recent final voter dataset written before file_date.
+
+    Parameters:
+    file_date (datetime): The file date being processed.
+
+    Returns:
+    str: Path of the previous final dataset (without the .gzip of legacy files), or None if there is none.
+    """
+    pattern = re.compile(rf"(\d{{4}}\.\d{{2}}\.\d{{2}})\.{TABLENAME.lower()}(\.gzip)?$")
+    previous_date = None
+    previous_file = None
+    for item in os.listdir(FINAL_DATA_PATH):
+        match = pattern.match(item)
+        if not match:
+            continue
+        item_date = datetime.strptime(match.group(1), '%Y.%m.%d')
+        if item_date < file_date and (previous_date is None or item_date > previous_date):
+            previous_date = item_date
+            previous_file = os.path.join(FINAL_DATA_PATH, f"{match.group(1)}.{TABLENAME.lower()}")
+    return previous_file
+
+def address_hash(df):
+    """
+    Hash the physical address columns of each voter.
+
+    Parameters:
+    df (pd.DataFrame): Voters with the ADDRESS_COLUMNS.
+
+    Returns:
+    pd.Series: uint64 hash per row.
+    """
+    return pd.util.hash_pandas_object(df[ADDRESS_COLUMNS].astype(object).fillna('').astype(str), index=False)
+
+def split_unchanged(df, previous, columns_to_update):
+    """
+    Split voters into those whose address results can be reused from the
+    previous final file and those that still have to be geocoded.
+
+    A voter is reused when the previous file has the same state_voter_id with
+    the same address hash and the address was resolved (anything other than
+    'Not Found', so misses are retried against the current places index).
+
+    Parameters:
+    df (pd.DataFrame): The processed voters for this file date.
+    previous (pd.DataFrame): The previous final voter file.
+    columns_to_update (list of str): The columns produced by the address passes.
+
+    Returns:
+    tuple: (unchanged voters with their previous results, voters to geocode), both keeping df's index
+    """
+    df = df.copy()
+    df['address_hash'] = address_hash(df)
+
+    reuse_columns = [column for column in columns_to_update + ['find_address'] if column in previous.columns]
+    resolved = previous[previous['results'] != 'Not Found']
+    previous = resolved[['state_voter_id'] + reuse_columns].copy()
+    previous['address_hash'] = address_hash(resolved)
+    previous = previous.drop_duplicates(subset='state_voter_id', keep='first')
+
+    merged = df.merge(previous, on=['state_voter_id', 'address_hash'], how='left', indicator=True)
+    # previous has one row per voter, so the left merge keeps df's rows in order
+    merged.index = df.index
+    unchanged = merged[merged['_merge'] == 'both'].drop(columns=['_merge', 'address_hash'])
+    changed = df[~df['state_voter_id'].isin(unchanged['state_voter_id'])].drop(columns=['address_hash'])
+
+    print(f"...{len(unchanged)} voters unchanged, {len(changed)} new or moved")
+    return unchanged, changed
+
+def load_previous_final(file_date, columns_to_update):
+    """
+    Read the columns split_unchanged needs from the previous final voter file, if there is one.
+
+    Parameters:
+    file_date (datetime): The file date being processed.
+    columns_to_update (list of str): The columns produced by the address passes.
+
+    Returns:
+    pd.DataFrame: The previous final voter file, or None.
+    """
+    previous_file = find_previous_final_file(file_date)
+    if previous_file is None:
+        print("...no previous final file, geocoding every voter")
+        return None
+    print(f"...reusing address results from {os.path.basename(previous_file)}")
+    wanted = ['state_voter_id', 'results'] + ADDRESS_COLUMNS + columns_to_update + ['find_address']
+    available = set(dataset_columns(previous_file))
+    return read_dataset(previous_file, columns=[column for column in dict.fromkeys(wanted) if column in available])
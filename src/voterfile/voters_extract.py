@@ -16,35 +16,36 @@ import glob
 from common_functions.common import get_traceback, get_timing, cast_date, timing_decorator
 from common_functions.file_operations import read_extract, write_load, read_extract_multiple
 
-from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, LOGSTASH_DATA_PATH, state, file_date, sample
+from utils.arg_parser import require_date
+from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, LOGSTASH_DATA_PATH, state, file_date, sample, seed
 from utils.database import Database
-from utils.dataframe_operations import validate_dataframe
-from utils.transformations import convert_date_format
+from utils.file_operations import read_contract_files
+from utils.dtypes import dtype_policy, apply_dtypes
+from utils.dates import parse_dates, format_dates, normalize_birthdates, ages
+from utils.stage_cache import stage_fingerprint, cached_output, with_fingerprint, write_output
+from utils.sampling import BottomKSampler
 
-from data_contracts.voterfile_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns, ACTIVE_VOTERS_CODES
+from data_contracts.voterfile_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns, ACTIVE_VOTERS_CODES, category_columns, partition_columns
 
-# Get the date and sample values using the imported function
+# bump when a change to this stage changes what it writes (invalidates the stage cache)
+STAGE_VERSION = 2
+
+def _kept_rows(df):
+    """
+    Mask of the records cleaning keeps: no bad records, inactive voters or voters with no precinct.
+    """
+    # (the columns are nullable strings: comparisons with a null give NA, not False)
+    return df['state_voter_id'].ne('ACP').fillna(True) & df['voter_status'].isin(ACTIVE_VOTERS_CODES) & df['precinct'].notna()
 
 def _clean(df):
     print(f"Cleaning data - {len(df)}")
     # You can continue working with the modified DataFrame 'df'
 
     # remove bad records, inactive voters and voters with no precinct
-    mask = df['state_voter_id'] != 'ACP'
-    df = df[mask]
-    mask = df['voter_status'].isin(ACTIVE_VOTERS_CODES)
-    df = df[mask]
-    mask = ~df['precinct'].isna()
-    df = df[mask]
-
-    # df['registration_date'] = df['registration_date'].parallel_apply(convert_date_format)
-    df['registration_date'] = pd.to_datetime(df['registration_date'], format='%m-%d-%Y', errors='coerce')
-
-    # cast back to string with a format of 'YYYY-MM-DD'
-    if df['registration_date'].dtype == 'datetime64[ns]':
-        df['registration_date'] = df['registration_date'].dt.strftime('%Y-%m-%d').astype(str)
-    else:
-        print("Conversion to datetime failed. Check the format and data.")
+    df = df[_kept_rows(df)]
+
+    # cast to string with a format of 'YYYY-MM-DD' (unparseable dates become 'nan', replaced when loading)
+    df['registration_date'] = format_dates(parse_dates(df['registration_date'])).astype(str)
 
     # print(df['registration_date'].head())
     # print(df['registration_date'].tail())
@@ -58,46 +59,59 @@ def _clean(df):
 
 def _transform(df) -> pd.DataFrame:
     print("Initial Transformations....")
-    # Define the confidential birth year
-    # Convert the 'BIRTH_DATE' column to integers
-    # Replace 'BIRTH_DATE' with 1850 for confidential voters
-    date2 = datetime(2017, 3, 4)
-    current_year = pd.Timestamp.now().year
-    if file_date < date2:
-        df['birthdate'] = pd.to_datetime(df['birthdate'], errors='coerce')
-        default_date = datetime(1850, 1, 1)
-        df['birthdate'] = df['birthdate'].fillna(default_date)
-        df['birth_year'] = df['birthdate'].astype(str).str[:4].astype(int)
-        df['age'] = current_year - df['birth_year']
-        df.drop(columns=['birth_year'], inplace=True)
-    else:
-        generic_birth_year = 1850
-        df.loc[df['confidential'] == 'confidential', 'birthdate'] = generic_birth_year
-        df.loc[df['birthdate'].str.contains('X'), 'birthdate'] = generic_birth_year
-        df['birthdate'] = df['birthdate'].astype(int, errors='ignore')
-        df.loc[df['birthdate'] < generic_birth_year, 'birthdate'] = generic_birth_year
-        # Calculate age by subtracting birth year from the current year
-        df['age'] = current_year - df['birthdate']
-
+    # Files before 2017-03-04 carry full birthdates, later ones only the year (masked 'XXXX' when confidential)
+    # Both become 'YYYY-MM-DD' (Jan 1 for bare years) with 1850 for confidential voters and unusable values
+    df['birthdate'], birth_years = normalize_birthdates(df['birthdate'], df['confidential'])
+    # Calculate age by subtracting birth year from the current year
+    df['age'] = ages(birth_years)
 
     df['precinct_link'] = df['county'] + '-' + df['precinct'] + '-' + df['split']
 
     return df.drop_duplicates(subset="state_voter_id", keep="first").reset_index(drop=True)
 
-def main():
+def extract(file_date, sample=0, seed=0) -> pd.DataFrame:
+    """
+    Read, clean and cast the raw voter files of a file date.
+
+    Parameters:
+    file_date (datetime): The file date to process.
+    sample (int): Only read this many voters, counted after cleaning (see utils/sampling.py), all of them when 0.
+    seed (int): The seed of the sample.
+
+    Returns:
+    pd.DataFrame: The processed voters, in the pipeline dtypes.
+    """
     print(f"Processing raw voter file on {file_date.strftime('%Y-%m-%d')}")
 
-    df = pd.DataFrame()
-    df = read_extract_multiple(df, os.path.join(RAW_DATA_PATH, file_date.strftime('%Y_%m_%d'), TABLENAME.lower()))
-    df = validate_dataframe(df, DATA_CONTRACT)
-    df = _clean(df)
+    raw_directory = os.path.join(RAW_DATA_PATH, file_date.strftime('%Y_%m_%d'), TABLENAME.lower())
+    # ages are counted from the current year
+    fingerprint = stage_fingerprint('voters_extract', STAGE_VERSION, raw_directory, (DATA_CONTRACT, dtype_mapping, category_columns),
+                                    {"sample": sample, "seed": seed, "year": datetime.now().year}, processed_path(file_date))
+    df = cached_output(fingerprint, processed_path(file_date))
+    if df is not None:
+        return df
+
+    sampler = None
     if sample > 0:
-        print(f"...taking a sample of {sample}")
-        df = df.sample(n=sample)
+        print(f"...taking a sample of {sample} voters (seed {seed})")
+        sampler = BottomKSampler(sample, seed, row_filter=_kept_rows)
+    df = read_contract_files(raw_directory, DATA_CONTRACT, sampler=sampler)
+    df = _clean(df)
     df = _transform(df)
     # Nan to empty string
     df = df.fillna('')
-    df = write_load(df, os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.gzip"))
+    df = apply_dtypes(df, dtype_policy(dtype_mapping, category_columns))
+    return with_fingerprint(df, fingerprint)
+
+def processed_path(file_date):
+    return os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}")
+
+def write_processed(df, file_date):
+    return write_output(df, processed_path(file_date), partition_columns)
+
+def main():
+    df = extract(file_date, sample, seed)
+    df = write_processed(df, file_date)
 
     print(f"File Processed {len(df)} records")
     print(f"File Processed {len(df.columns)} columns")
@@ -105,6 +119,7 @@ def main():
         print(col)
 
 if __name__ == "__main__":
+    require_date()
     process_time = time.time()
     try:
         main()
@@ -16,28 +16,29 @@ import pyarrow.parquet as pq
 
 
 from common_functions.common import get_traceback, get_timing
-from common_functions.file_operations import read_extract, write_load
 
-from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, state, file_date, sample, link
+from utils.dtypes import to_boundary
+from utils.arg_parser import require_date
+from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, state, file_date, sample, seed, link
 from utils.database import Database
+from utils.datasets import read_dataset
+from utils.sampling import read_sampled_dataset
 
 from data_contracts.voterfile_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns
 
 DB_DATABASE = "oregon_voter_files"
 
-def _load_database(df) -> pd.DataFrame:
+def _load_database(df, file_date) -> pd.DataFrame:
     db_connection = Database(DB_DATABASE)
     print(f"Writing to database {DB_DATABASE}")
-    engine = db_connection.get_engine()
     table_name = f"{TABLENAME.lower()}_{file_date.strftime('%Y_%m_%d')}"
 
     # drop columns
     df = df[final_columns]
-    # df.to_sql(table_name, con=engine, index=False, if_exists='replace')
-    df.to_sql(table_name, con=engine, index=False, if_exists='replace', dtype=dtype_mapping)
+    db_connection.bulk_load(df, table_name, dtype_mapping, if_exists='replace')
     return df.reset_index(drop=True)
 
-def _create_indices():
+def _create_indices(file_date):
     # Example usage
     print("Creating indices")
     db_connection = Database(DB_DATABASE)
@@ -46,33 +47,45 @@ def _create_indices():
     db_connection.create_index(table_name, ["precinct_link"])
     db_connection.create_index(table_name, ["physical_id"])
 
-def _create_view():
+def _create_view(file_date):
     print("Creating view")
     db_connection = Database(DB_DATABASE)
     table_name = f"{TABLENAME.lower()}_{file_date.strftime('%Y_%m_%d')}"
     db_connection.create_view(f"{TABLENAME.lower()}_current", table_name)
 
-def main():
-    df = pd.DataFrame()
-    df = read_extract(df, os.path.join(FINAL_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.gzip"))
-
-    if sample > 0:
-        print(f"...taking a sample of {sample}")
-        df = df.sample(n=sample)
+def load(df, file_date, link=False) -> pd.DataFrame:
+    """
+    Write the final voters of a file date to their database table, optionally
+    pointing the current view at it.
+    """
+    # categoricals and Arrow strings go back to plain objects for the database/Elasticsearch
+    df = to_boundary(df)
     df['registration_date'] = df['registration_date'].replace('nan', file_date.strftime('%Y-%m-%d'))
 
     df = df.fillna('')
-    _load_database(df)
-    _create_indices()
+    _load_database(df, file_date)
+    _create_indices(file_date)
 
     if (link):
-        _create_view()
+        _create_view(file_date)
     else:
         print("Skipping create view")
+    return df
+
+def main():
+    file_path = os.path.join(FINAL_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}")
+    # only the columns that go to the database are read
+    if sample > 0:
+        print(f"...taking a sample of {sample} voters (seed {seed})")
+        df = read_sampled_dataset(file_path, sample, seed, columns=final_columns)
+    else:
+        df = read_dataset(file_path, columns=final_columns)
+    df = load(df, file_date, link)
 
     print(f"File Processed {len(df)} records")
 
 if __name__ == "__main__":
+    require_date()
     process_time = time.time()
     try:
         print(f"Starting {os.path.basename(__file__)}")
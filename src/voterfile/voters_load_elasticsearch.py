@@ -11,10 +11,13 @@ from datetime import datetime
 import pandas as pd
 
 from common_functions.common import get_traceback, get_timing
-from common_functions.file_operations import read_extract, write_load
 
-from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, LOGSTASH_DATA_PATH, state, file_date, sample
-from utils.search import search_client, index_documents
+from utils.dtypes import to_boundary
+from utils.arg_parser import require_date
+from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, LOGSTASH_DATA_PATH, state, file_date, sample, seed
+from utils.search import get_search_client, index_documents
+from utils.datasets import read_dataset
+from utils.sampling import read_sampled_dataset
 
 
 from data_contracts.voterfile_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, final_columns
@@ -51,7 +54,7 @@ def voter_votehistory(state_voter_id):
         dict: The search results as a dictionary.
     """
     index_name = f"votetracker-{state}-voter-elections"
-    response = search_client.voter_votehistory(index_name, state_voter_id)
+    response = get_search_client().voter_votehistory(index_name, state_voter_id)
     total = response['hits']['total']['value']
 
     if total > 0:
@@ -96,13 +99,14 @@ def main():
     """
     Main function to process the voter file.
     """
-    df = pd.DataFrame()
-    file_path = os.path.join(FINAL_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.gzip")
-    df = read_extract(df, file_path)
-
+    file_path = os.path.join(FINAL_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}")
     if sample > 0:
-        print(f"...taking a sample of {sample}")
-        df = df.sample(n=sample)
+        print(f"...taking a sample of {sample} voters (seed {seed})")
+        df = read_sampled_dataset(file_path, sample, seed)
+    else:
+        df = read_dataset(file_path)
+    # categoricals and Arrow strings go back to plain objects for the database/Elasticsearch
+    df = to_boundary(df)
     df['registration_date'] = df['registration_date'].replace('nan', file_date.strftime('%Y-%m-%d'))
     # set Nan to empty string
     df = df.fillna('')
@@ -113,6 +117,7 @@ def main():
     print(f"File Processed {len(df)} records")
 
 if __name__ == "__main__":
+    require_date()
     process_time = time.time()
     try:
         print(f"Processing processed voter file on {file_date.strftime('%Y-%m-%d')}")
@@ -8,95 +8,132 @@ import sys
 sys.path.append(r'../src')
 import os
 import time
-from datetime import datetime
 import pandas as pd
-import numpy as np
-import pyarrow.parquet as pq
-import gender_guesser.detector as gender
 
 
 from common_functions.common import get_traceback, get_timing
-from common_functions.physical_address import standardize_address
-from common_functions.file_operations import read_extract, write_load
-
-from data_contracts.voterfile_data_contract import DATA_CONTRACT, TABLENAME, final_columns
-from utils.config import RAW_DATA_PATH, PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, state, file_date, sample, iteration, initialize_pandarallel
 
+from data_contracts.voterfile_data_contract import DATA_CONTRACT, TABLENAME, dtype_mapping, category_columns, partition_columns
+from utils.arg_parser import require_date
+from utils.config import PROCESSED_DATA_PATH, FINAL_DATA_PATH, WORKING_DATA_PATH, state, file_date, sample, seed, iteration, resume, incremental
+
+from utils.address_cache import close_address_cache
+from utils.datasets import read_dataset, write_dataset
+from utils.sampling import read_sampled_dataset
+from utils.dtypes import dtype_policy, apply_dtypes, fill_missing
+from utils.gender import assign_gender
+from utils.dates import normalize_birthdates
+from utils.pass_metrics import get_run_report, close_run_report
+from utils.rate_control import SearchUnavailable, get_rate_controller
+from voterfile.transformations.checkpoints import CheckpointWriter, load_checkpoint
+from voterfile.transformations.incremental import load_previous_final, split_unchanged
 from voterfile.transformations.address_passes import _transform_pass_01, _transform_pass_02, _transform_pass_03, _transform_pass_04, _transform_pass_05, _transform_pass_06, _transform_pass_07, _transform_pass_final
 
-gd = gender.Detector(case_sensitive=False)
+VOTER_DTYPES = dtype_policy(dtype_mapping, category_columns)
+
+# columns written by the address passes
+columns_to_update = ["results", "physical_id", "PropertyAddressFull", "PropertyAddressHouseNumber", "PropertyAddressStreetDirection", "PropertyAddressStreetName", "PropertyAddressStreetSuffix", "PropertyAddressCity", "PropertyAddressState", "PropertyAddressZIP", "PropertyAddressZIP4", "PropertyAddressCRRT", "PropertyLatitude", "PropertyLongitude"]
 
-def _transform_address(df, iteration) -> pd.DataFrame:
+def _find_address(df, interation_pass) -> pd.Series:
+    """
+    Build the full text address query used by a pass
+    """
+    find_address = df['physical_house_number'].astype(str) + ' ' + df['physical_street_pre_direction'].astype(str) + ' ' + df['physical_street_name'].astype(str) + ' ' + df['physical_zip_code'].astype(str) + ' ' + df['physical_unit_number'].astype(str)
+    if interation_pass in ('04', '05', '06'):
+        find_address = find_address + ' ' + df['physical_unit_type'].astype(str)
+    if interation_pass == '06':
+        find_address = find_address + ' ' + df['physical_street_suffix'].astype(str)
+    if interation_pass == '07':
+        find_address = df['physical_address_2'] + ' ' + df['physical_zip_code'].astype(str)
+    return find_address
+
+ADDRESS_PASSES = [
+    ('01', _transform_pass_01),
+    ('02', _transform_pass_02),
+    ('03', _transform_pass_03),
+    ('04', _transform_pass_04),
+    ('05', _transform_pass_05),
+    ('06', _transform_pass_06),
+    ('07', _transform_pass_07),
+]
+
+def _transform_address(df, iteration, file_date, resume=0) -> pd.DataFrame:
     """
     Transform addresses (mail and physical) into standard formats
     Create hash from standard addresses
     Match which addresses are already geocoded (in the places table)
     Write unmatched addresses to file adding to places table and for geocoding (only physical)
     Write processed voters to file having the right columns
+    With resume, continue an interrupted run: df is replaced by the working state
+    checkpointed after pass resume - 1 and the passes from resume on are run
     """
 
-    # fill na with empty string
-    df = df.fillna('')
-    columns_to_update = ["results", "physical_id", "PropertyAddressFull", "PropertyAddressHouseNumber", "PropertyAddressStreetDirection", "PropertyAddressStreetName", "PropertyAddressStreetSuffix", "PropertyAddressCity", "PropertyAddressState", "PropertyAddressZIP", "PropertyAddressZIP4", "PropertyAddressCRRT", "PropertyLatitude", "PropertyLongitude"]
-
-
-    # we are only going run the exact iteration or if it is 0 then we will run all iterations
-    if iteration == 0 or iteration == 1:
-        interation_pass = '01'
-        print(f"...pass { interation_pass }")
-        df = _transform_pass_01(df, columns_to_update)
-        # we are going write the results of the first pass to a file with the date and iteration
-        # df.to_parquet(os.path.join(WORKING_DATA_PATH, f"{TABLENAME}-places-iteration-{ interation_pass }.parquet"), compression='gzip')
-
-    if iteration == 0 or iteration == 2:
-        df['find_address'] = df['physical_house_number'].astype(str) + ' ' + df['physical_street_pre_direction'].astype(str) + ' ' + df['physical_street_name'].astype(str) + ' ' + df['physical_zip_code'].astype(str) + ' ' + df['physical_unit_number'].astype(str)
-        interation_pass = '02'
-        print(f"...pass { interation_pass }")
-        df = _transform_pass_02(df, columns_to_update)
-        df.to_parquet(os.path.join(WORKING_DATA_PATH, f"{TABLENAME}-places-iteration-{ interation_pass }.parquet"), compression='gzip')
-
-    if iteration == 0 or iteration == 3:
-        interation_pass = '03'
-        print(f"...pass { interation_pass }")
-        df = _transform_pass_03(df, columns_to_update)
-        df.to_parquet(os.path.join(WORKING_DATA_PATH, f"{TABLENAME}-places-iteration-{ interation_pass }.parquet"), compression='gzip')
-
-    if iteration == 0 or iteration == 4:
-        df['find_address'] = df['find_address'] + ' ' + df['physical_unit_type'].astype(str)
-        interation_pass = '04'
-        print(f"...pass { interation_pass }")
-        df = _transform_pass_04(df, columns_to_update)
-        df.to_parquet(os.path.join(WORKING_DATA_PATH, f"{TABLENAME}-places-iteration-{ interation_pass }.parquet"), compression='gzip')
+    if resume >= 2:
+        print(f"...resuming at pass {resume:02d} from the checkpoints")
+        df = load_checkpoint(file_date, resume - 1)
+    else:
+        # fill na with empty string
+        df = fill_missing(df)
 
-    if iteration == 0 or iteration == 5:
-        interation_pass = '05'
-        print(f"...pass { interation_pass }")
-        df = _transform_pass_05(df, columns_to_update)
-        df.to_parquet(os.path.join(WORKING_DATA_PATH, f"{TABLENAME}-places-iteration-{ interation_pass }.parquet"), compression='gzip')
+    # pass 01 starts a new set of checkpoints, later passes add their deltas to it
+    checkpoints = CheckpointWriter(file_date, reset=iteration < 2 and resume < 2)
 
-    if iteration == 0 or iteration == 6:
-        df['find_address'] = df['find_address'] + ' ' + df['physical_street_suffix'].astype(str)
-        interation_pass = '06'
-        print(f"...pass { interation_pass }")
-        df = _transform_pass_06(df, columns_to_update)
-        df.to_parquet(os.path.join(WORKING_DATA_PATH, f"{TABLENAME}-places-iteration-{ interation_pass }.parquet"), compression='gzip')
+    report = get_run_report()
+    report_path = os.path.join(WORKING_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.run.json")
 
-    if iteration == 0 or iteration == 7:
-        df['find_address'] = df['physical_address_2'] + ' ' + df['physical_zip_code'].astype(str)
-        interation_pass = '07'
+    # we are only going run the exact iteration or if it is 0 then we will run all iterations
+    for interation_pass, transform_pass in ADDRESS_PASSES:
+        if iteration != 0 and iteration != int(interation_pass):
+            continue
+        if int(interation_pass) < resume:
+            continue
         print(f"...pass { interation_pass }")
-        df = _transform_pass_07(df, columns_to_update)
-        df.to_parquet(os.path.join(WORKING_DATA_PATH, f"{TABLENAME}-places-iteration-{ interation_pass }.parquet"), compression='gzip')
+        pass_started = time.perf_counter()
+        try:
+            if interation_pass == '01':
+                df = transform_pass(df, columns_to_update)
+                checkpoints.write_base(df)
+            else:
+                df['find_address'] = _find_address(df, interation_pass)
+                before = df[columns_to_update].copy()
+                df = transform_pass(df, columns_to_update)
+                checkpoints.write_delta(interation_pass, before, df[columns_to_update])
+        except SearchUnavailable as e:
+            if interation_pass != '01':
+                # checkpoint what the pass resolved before the breaker opened, the resumed pass does not search it again
+                after = df[columns_to_update].copy()
+                if e.resolved is not None and len(e.resolved) > 0:
+                    after.loc[e.resolved.index, columns_to_update] = e.resolved
+                checkpoints.write_delta(interation_pass, before, after, partial=True)
+            # flush what the passes produced before giving up
+            checkpoints.close()
+            close_address_cache()
+            close_run_report(report_path)
+            raise SearchUnavailable(f"{e} during pass {interation_pass}. The earlier passes and the searches it finished are checkpointed; "
+                                    f"once the cluster recovers, finish the run with voterfile/voters_transform.py --date {file_date.strftime('%Y-%m-%d')} "
+                                    f"--resume {int(interation_pass)} (with the same --incremental, --sample and --seed)") from e
+        report.record_pass(interation_pass, time.perf_counter() - pass_started, len(df))
+        print(report.pass_summary(interation_pass))
 
     # only run the final pass if we are running all iterations
     if iteration == 0:
         print(f"...final pass")
+        pass_started = time.perf_counter()
         df = _transform_pass_final(df, columns_to_update)
-
+        report.record_pass('final', time.perf_counter() - pass_started, len(df))
+
+    checkpoints.close()
+    close_address_cache()
+    print(get_rate_controller().summary())
+    results = df['results'].value_counts()
+    print(results)
+    report.record_results(results)
+    close_run_report(report_path)
     # df = df.drop('find_address', axis=1)
-    return df.reset_index(drop=True)
+    # keep the index, an incremental run puts the rows back in file order with it
+    return df
 
-def _transform_main(df, iteration) -> pd.DataFrame:
+def _transform_main(df, iteration, file_date) -> pd.DataFrame:
     print("Performing Final Data Transformtion...")
 
     df['file_date'] = file_date.strftime('%Y-%m-%d')
@@ -107,9 +144,8 @@ def _transform_main(df, iteration) -> pd.DataFrame:
     df.loc[df['physical_unit_type'] != '', 'address_type'] = 'apartment'
 
     # ensure birthdate is a date
-    # if only year is present, set to Jan 1 of that year
-    df['birthdate'] = df['birthdate'].astype(str)
-    df.loc[df['birthdate'].str.len() == 4, 'birthdate'] = df['birthdate'] + '-01-01'
+    # if only year is present (processed files written before normalize_birthdates), set to Jan 1 of that year
+    df['birthdate'], _ = normalize_birthdates(df['birthdate'])
 
     # ensure PropertyLatitude and PropertyLongitude are numeric
     df['PropertyLatitude'] = pd.to_numeric(df['PropertyLatitude'], errors='coerce')
@@ -139,70 +175,110 @@ def _transform_main(df, iteration) -> pd.DataFrame:
     df.loc[mask, 'PropertyAddressZIP'] = 'Homeless'
     df.loc[mask, 'address_type'] = 'Homeless'
 
-    # add gender column
+    # add gender column: first name, then middle name when the first is unknown or androgynous
     print("...guessing gender based on first and middle names")
-    # df['gender'] = df.parallel_apply(lambda row: assume_gender(row['name_first'], row['name_middle']), axis=1)
-    df['gender'] = df['name_first'].map(lambda x: gd.get_gender(x, country='usa'))
-
-    # create a mask based on gender being unknown, andy
-    # then guess based on middle name
-    mask = df['gender'].isin(['unknown', 'andy'])
-    df.loc[mask, 'gender'] = df['name_middle'].map(lambda x: gd.get_gender(x, country='usa'))
-
-    # create the same mask and then change their gender value to unknown
-    mask = df['gender'].isin(['unknown', 'andy'])
-    df.loc[mask, 'gender'] = 'unknown'
-
-    # create a mask based on mostly_male
-    mask = df['gender'] == 'mostly_male'
-    df.loc[mask, 'gender'] = 'male'
-
-    # create a mask based on mostly_female
-    mask = df['gender'] == 'mostly_female'
-    df.loc[mask, 'gender'] = 'female'
+    df = assign_gender(df)
 
     df['mail_id'] = df['mail_address_1'] + ' ' + df['mail_zip_code']
 
     return df.reset_index(drop=True)
 
-def main():
-    # Get the date and sample values using the imported function
-    print(f"Processing processed voter file on {file_date.strftime('%Y-%m-%d')}")
+def processed_path(file_date):
+    return os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}")
 
-    df = pd.DataFrame()
+def final_path(file_date):
+    return os.path.join(FINAL_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}")
 
+def read_final(file_date, columns=None, filters=None) -> pd.DataFrame:
+    """
+    Read the final voters of a file date, only the given columns and the rows matching filters (see utils/datasets.py).
+    """
+    return read_dataset(final_path(file_date), columns, filters)
+
+def write_final(df, file_date):
+    return write_dataset(df, final_path(file_date), partition_columns)
+
+def read_processed(file_date, iteration=0, sample=0, seed=0) -> pd.DataFrame:
+    """
+    Read the processed file, or the working state after pass iteration - 1 from its checkpoints
+    """
     # read the process file or the working file iteration if it exists
     if iteration < 2:
         print(f"...reading processed file")
-        df = read_extract(df, os.path.join(PROCESSED_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.gzip"))
+        if sample:
+            print(f"...taking a sample of {sample} voters (seed {seed})")
+            df = read_sampled_dataset(processed_path(file_date), sample, seed)
+        else:
+            df = read_dataset(processed_path(file_date))
     else:
-        print(f"...reading working file iteration {(iteration - 1):02d}")
-        df = read_extract(df, os.path.join(WORKING_DATA_PATH, f"{TABLENAME}-places-iteration-{(iteration - 1):02d}.parquet"))
-
-    if sample:
-        print(f"...taking a sample of {sample}")
-        df = df.sample(n=sample)
-    df = _transform_address(df, iteration)
-    df = _transform_main(df, iteration)
-    # we only write the final file if we are running all iterations
+        print(f"...rebuilding working state after pass {(iteration - 1):02d} from checkpoints")
+        df = load_checkpoint(file_date, iteration - 1)
+    return df
+
+def transform(df, file_date, iteration=0, incremental=False, resume=0) -> pd.DataFrame:
+    """
+    Run the address passes and the final transformations on the processed voters of a file date.
+
+    Parameters:
+    df (pd.DataFrame): The processed voters (or the working state when resuming at iteration).
+        None when resuming a run that was not incremental, the checkpoints hold every voter.
+    file_date (datetime): The file date being processed.
+    iteration (int): The single pass to run, 0 for all of them.
+    incremental (bool): Only geocode the voters new or moved since the previous final file.
+    resume (int): Continue an interrupted run from its checkpoints at this pass, 0 to start over.
+
+    Returns:
+    pd.DataFrame: The transformed voters.
+    """
+    print(f"Processing processed voter file on {file_date.strftime('%Y-%m-%d')}")
+    if df is not None:
+        df = apply_dtypes(df, VOTER_DTYPES)
+
+    previous = None
+    if incremental and iteration == 0:
+        previous = load_previous_final(file_date, columns_to_update)
+    if previous is not None:
+        # fill na with empty string for every voter, not only the ones the passes see
+        df = fill_missing(df)
+        unchanged, changed = split_unchanged(df, previous, columns_to_update)
+        if len(changed) > 0:
+            changed = _transform_address(changed, iteration, file_date, resume)
+        df = pd.concat([unchanged, changed]).sort_index().reset_index(drop=True)
+    else:
+        df = _transform_address(df, iteration, file_date, resume)
+    df = _transform_main(df, iteration, file_date)
+    return apply_dtypes(df, VOTER_DTYPES)
 
-    # non_numeric = df[pd.to_numeric(df['PropertyLatitude'], errors='coerce').isna()]
-    # print(non_numeric[['PropertyLatitude','PropertyLongitude']])
-    # exit()
+def main():
+    if resume and iteration:
+        raise ValueError("--resume runs every pass from the given one on, it does not combine with --iteration")
+    if resume >= 2 and not incremental:
+        # the checkpoints hold the working state of every voter
+        df = None
+    else:
+        # an incremental run also needs the voters whose results come from the previous final file
+        df = read_processed(file_date, iteration, sample, seed)
+    df = transform(df, file_date, iteration, incremental, resume)
+    # we only write the final file if we are running all iterations
     if iteration == 0:
-        df = write_load(df, os.path.join(FINAL_DATA_PATH, f"{file_date.strftime('%Y.%m.%d')}.{TABLENAME.lower()}.gzip"))
+        df = write_final(df, file_date)
     print('')
     print(f"File Processed {len(df)} records")
-    # print(df)
 
 
 
 if __name__ == "__main__":
+    require_date()
     process_time = time.time()
+    failed = False
     try:
         main()
     except Exception as e:
+        failed = True
         print('------Start--------')
         print(get_traceback(e))
         print('------End--------')
     get_timing(process_time)
+    # let the scripts that chain the steps see the failure
+    if failed:
+        sys.exit(1)